@@ -0,0 +1,874 @@
+"""
+Precomputed analytical views over the FHIR data files
+Each view is assembled from one segment per data file and served from memory.
+Views are built together in a single pass: each file is read once and its lines
+feed every view that uses it. When a file changes only its segment
+is rebuilt, and the assembled view is swapped in with one assignment.
+"""
+
+import json
+import math
+import os
+import pickle
+import re
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # In requirements.txt; the stdlib path is only a fallback for installs without it
+    np = None
+
+class SegmentScanner(ABC):
+    """Builds one view's segment of a data file from its lines, fed in file order"""
+
+    @abstractmethod
+    def feed(self, line: bytes) -> None:
+        """Take in one raw NDJSON line"""
+
+    @abstractmethod
+    def segment(self) -> object:
+        """The segment, once every line has been fed"""
+
+def scan_file(filepath: str, scanners: Sequence[type]) -> List[object]:
+    """
+    Read a data file once, feeding each line to one scanner per view (module-level,
+    so files can be scanned in worker processes). A scanner that raises is dropped,
+    and its exception is returned in place of its segment.
+    """
+    instances: Dict[int, SegmentScanner] = {}
+    results: List[object] = [None] * len(scanners)
+    for position, scanner_type in enumerate(scanners):
+        try:
+            instances[position] = scanner_type()
+        except Exception as e:
+            results[position] = e
+    feeds = [(position, scanner.feed) for position, scanner in instances.items()]
+    with open(filepath, 'rb') as f:
+        for line in f:
+            for entry in feeds:
+                try:
+                    entry[1](line)
+                except Exception as e:
+                    results[entry[0]] = e
+                    del instances[entry[0]]
+                    feeds = [other for other in feeds if other is not entry]
+    for position, scanner in instances.items():
+        try:
+            results[position] = scanner.segment()
+        except Exception as e:
+            results[position] = e
+    return results
+
+class SegmentedView(ABC):
+    """
+    A view combined from per-file segments.
+    Subclasses provide a SegmentScanner type and combine.
+    """
+
+    def __init__(self, name: str, scanner: type):
+        """
+        Initialize view (empty until built)
+
+        Args:
+            name: Name used in log messages
+            scanner: SegmentScanner subclass building one file's segment
+        """
+        self.name = name
+        self.scanner = scanner
+        self.filenames: List[str] = []
+        self.segments: Dict[str, object] = {}
+        self.combined = None
+        self.building = False
+        # Why the last build failed, if it did; the view then stays unready
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.combined is not None
+
+    def build(self, data_dir: str, filenames: Sequence[str], map_func: Callable = map) -> None:
+        """Build this view alone (ViewSet builds several in one pass)"""
+        ViewSet([(self, filenames)]).build(data_dir, map_func)
+
+    def refresh(self, data_dir: str, filenames: Iterable[str]) -> None:
+        """Rebuild the segments of changed (or removed) files only"""
+        ViewSet([(self, self.filenames)]).refresh(data_dir, filenames)
+
+    def _publish(self, segments: Dict[str, object]) -> None:
+        """Combine and swap in new segments; raises the first scan failure among them instead"""
+        for segment in segments.values():
+            if isinstance(segment, Exception):
+                raise segment
+        combined = self.combine([segments[filename] for filename in self.filenames if filename in segments])
+        with self._lock:
+            self.segments = segments
+            self.combined = combined
+
+    @abstractmethod
+    def combine(self, segments: List[object]):
+        """Assemble the served view from the segments, in file order"""
+
+class ViewSet:
+    """
+    Views built together: every data file is read once, and each line feeds the
+    scanners of all the views that use that file. A view whose scan or combine
+    fails is logged and marked failed without affecting the others.
+    """
+
+    def __init__(self, views: Sequence[Tuple[SegmentedView, Sequence[str]]]):
+        """
+        Initialize view set
+
+        Args:
+            views: Each view with the data files it is built from
+        """
+        self.views = [(view, list(filenames)) for view, filenames in views]
+
+    def _scans(self, data_dir: str, filenames: Iterable[str], views: Sequence[SegmentedView]) -> List[tuple]:
+        """(filename, path, views using it) for each file, in first-use order"""
+        scans = []
+        for filename in dict.fromkeys(filenames):
+            users = [view for view in views if filename in view.filenames]
+            if users:
+                scans.append((filename, os.path.join(data_dir, filename), users))
+        return scans
+
+    def build(self, data_dir: str, map_func: Callable = map) -> None:
+        """Build every view (map_func may fan the file scans out to worker processes)"""
+        views = [view for view, _ in self.views]
+        for view, filenames in self.views:
+            view.filenames = filenames
+            view.building = True
+        try:
+            scans = [
+                scan for scan in self._scans(data_dir, (f for _, names in self.views for f in names), views)
+                if os.path.exists(scan[1])
+            ]
+            results = map_func(
+                scan_file,
+                [path for _, path, _ in scans],
+                [[view.scanner for view in users] for _, _, users in scans]
+            )
+            segments: Dict[str, Dict[str, object]] = {view.name: {} for view in views}
+            for (filename, _, users), file_segments in zip(scans, results):
+                for view, segment in zip(users, file_segments):
+                    segments[view.name][filename] = segment
+            for view in views:
+                try:
+                    view._publish(segments[view.name])
+                    view.error = None
+                except Exception as e:
+                    view.error = repr(e)
+                    print(f"Building {view.name} view failed: {e!r}")
+        finally:
+            for view in views:
+                view.building = False
+
+    def refresh(self, data_dir: str, filenames: Iterable[str]) -> None:
+        """
+        Rescan changed (or removed) files, once each, for the views that are
+        ready and use them. A view whose refresh fails keeps its previous contents.
+        """
+        views = [view for view, _ in self.views if view.ready]
+        updated = {view.name: dict(view.segments) for view in views}
+        affected = set()
+        for filename, path, users in self._scans(data_dir, filenames, views):
+            affected.update(view.name for view in users)
+            if os.path.exists(path):
+                for view, segment in zip(users, scan_file(path, [view.scanner for view in users])):
+                    updated[view.name][filename] = segment
+            else:
+                for view in users:
+                    updated[view.name].pop(filename, None)
+        for view in views:
+            if view.name not in affected:
+                continue
+            try:
+                view._publish(updated[view.name])
+            except Exception as e:
+                print(f"Refreshing {view.name} view failed: {e!r}")
+
+    def save(self, path: str) -> None:
+        """
+        Write the segments of every ready view to a snapshot file, renamed into
+        place so other processes never load a partial snapshot
+        """
+        snapshot = {view.name: (view.filenames, view.segments) for view, _ in self.views if view.ready}
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Publish every view from a snapshot written by save instead of scanning
+        the files. Returns False, changing nothing, if the snapshot is missing
+        or lacks any of the views.
+        """
+        try:
+            with open(path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False
+        if any(view.name not in snapshot for view, _ in self.views):
+            return False
+        for view, _ in self.views:
+            view.filenames, segments = snapshot[view.name]
+            try:
+                view._publish(segments)
+                view.error = None
+            except Exception as e:
+                view.error = repr(e)
+                print(f"Loading {view.name} view failed: {e!r}")
+        return True
+
+# ============================================================================
+# Observation values - columnar valueQuantity store
+# ============================================================================
+
+_QUANTITY_MARKER = b'"valueQuantity"'
+_MISSING_DAY = -1
+
+def _code_of(concept: Optional[Dict]) -> Optional[str]:
+    codings = (concept or {}).get('coding') or [{}]
+    return codings[0].get('code')
+
+class ObservationValueScanner(SegmentScanner):
+    """
+    Extracts every numeric valueQuantity (including component values, under the
+    component's code) from an Observation file into columns. Patients and codes
+    are stored as indexes into the segment's own lists.
+    """
+
+    def __init__(self):
+        self.patients: List[str] = []
+        self.patient_numbers: Dict[str, int] = {}
+        self.codes: List[str] = []
+        self.code_numbers: Dict[str, int] = {}
+        self.units: Dict[str, str] = {}
+        self.day_numbers: Dict[str, tuple] = {}
+
+        self.patient_column = array('i')
+        self.code_column = array('i')
+        self.day_column = array('i')
+        self.month_column = array('i')
+        self.value_column = array('d')
+
+    def _add(self, patient_number: int, code: Optional[str], quantity: Dict, day: tuple) -> None:
+        value = quantity.get('value')
+        if code is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+            return
+        code_number = self.code_numbers.get(code)
+        if code_number is None:
+            code_number = self.code_numbers[code] = len(self.codes)
+            self.codes.append(code)
+            self.units[code] = quantity.get('unit') or quantity.get('code') or ''
+        self.patient_column.append(patient_number)
+        self.code_column.append(code_number)
+        self.day_column.append(day[0])
+        self.month_column.append(day[1])
+        self.value_column.append(float(value))
+
+    def feed(self, line: bytes) -> None:
+        if _QUANTITY_MARKER not in line:
+            return
+        try:
+            resource = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        reference = (resource.get('subject') or {}).get('reference', '')
+        if not reference.startswith('Patient/'):
+            return
+        patient_id = reference[len('Patient/'):]
+        patient_number = self.patient_numbers.get(patient_id)
+        if patient_number is None:
+            patient_number = self.patient_numbers[patient_id] = len(self.patients)
+            self.patients.append(patient_id)
+
+        effective = resource.get('effectiveDateTime') or (resource.get('effectivePeriod') or {}).get('start') or ''
+        # Bucket by the recorded (local) date; parsed once per distinct date
+        day = self.day_numbers.get(effective[:10])
+        if day is None:
+            try:
+                parsed = date.fromisoformat(effective[:10])
+                day = (parsed.toordinal(), parsed.year * 12 + parsed.month - 1)
+            except ValueError:
+                day = (_MISSING_DAY, _MISSING_DAY)
+            self.day_numbers[effective[:10]] = day
+
+        if 'valueQuantity' in resource:
+            self._add(patient_number, _code_of(resource.get('code')), resource['valueQuantity'], day)
+        for component in resource.get('component') or []:
+            if 'valueQuantity' in component:
+                self._add(patient_number, _code_of(component.get('code')), component['valueQuantity'], day)
+
+    def segment(self) -> Dict:
+        return {
+            'patients': self.patients, 'codes': self.codes, 'units': self.units,
+            'patient': self.patient_column, 'code': self.code_column, 'day': self.day_column,
+            'month': self.month_column, 'value': self.value_column,
+        }
+
+_INT_COLUMNS = ('patient', 'code', 'day', 'month')
+
+class ObservationColumns:
+    """Every segment's values in global columns (NumPy arrays when available)"""
+
+    def __init__(self, segments: List[Dict]):
+        self.patient_numbers: Dict[str, int] = {}
+        self.code_numbers: Dict[str, int] = {}
+        self.units: Dict[str, str] = {}
+
+        parts: Dict[str, list] = {name: [] for name in _INT_COLUMNS + ('value',)}
+        for segment in segments:
+            # Translate the segment's local patient/code numbers to global ones
+            patient_map = [self.patient_numbers.setdefault(patient_id, len(self.patient_numbers)) for patient_id in segment['patients']]
+            code_map = [self.code_numbers.setdefault(code, len(self.code_numbers)) for code in segment['codes']]
+            for code in segment['codes']:
+                self.units.setdefault(code, segment['units'][code])
+            if np is not None:
+                parts['patient'].append(np.array(patient_map, dtype=np.int32)[np.array(segment['patient'], dtype=np.int32)])
+                parts['code'].append(np.array(code_map, dtype=np.int32)[np.array(segment['code'], dtype=np.int32)])
+            else:
+                parts['patient'].append(array('i', (patient_map[number] for number in segment['patient'])))
+                parts['code'].append(array('i', (code_map[number] for number in segment['code'])))
+            for name in ('day', 'month', 'value'):
+                parts[name].append(segment[name])
+
+        self.patients = list(self.patient_numbers)
+        self.codes = list(self.code_numbers)
+        self.columns = {}
+        for name, column_parts in parts.items():
+            if np is not None:
+                dtype = np.float64 if name == 'value' else np.int32
+                self.columns[name] = np.concatenate([np.asarray(part, dtype=dtype) for part in column_parts]) if column_parts else np.zeros(0, dtype=dtype)
+            else:
+                column = array('d' if name == 'value' else 'i')
+                for part in column_parts:
+                    column.extend(part)
+                self.columns[name] = column
+
+    def __len__(self) -> int:
+        return len(self.columns['value'])
+
+BUCKETS = ('day', 'week', 'month', 'year')
+GROUP_FIELDS = ('patient', 'code', 'period')
+
+def _period_numbers(day, month, bucket: str):
+    """Bucket number per row, from the day ordinal and month columns (vectorized under NumPy)"""
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        # date.fromordinal(1) is a Monday, so weeks start on Mondays
+        return day - (day - 1) % 7
+    if bucket == 'month':
+        return month
+    return month // 12
+
+def _period_label(number: int, bucket: str) -> Optional[str]:
+    if number < 0:
+        return None
+    if bucket in ('day', 'week'):
+        return date.fromordinal(number).isoformat()
+    if bucket == 'month':
+        return f"{number // 12:04d}-{number % 12 + 1:02d}"
+    return f"{number:04d}"
+
+def _percentile(sorted_values: Sequence[float], percentile: float) -> float:
+    """Linearly interpolated percentile of sorted values (NumPy's default method)"""
+    position = (len(sorted_values) - 1) * percentile / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+class ObservationStats(SegmentedView):
+    """valueQuantity statistics grouped by patient, code and/or time bucket"""
+
+    def __init__(self):
+        super().__init__("observation-stats", ObservationValueScanner)
+
+    def combine(self, segments: List[Dict]) -> ObservationColumns:
+        return ObservationColumns(segments)
+
+    def query(
+        self,
+        patient: Optional[str] = None,
+        code: Optional[str] = None,
+        start_day: Optional[int] = None,
+        end_day: Optional[int] = None,
+        group_by: Sequence[str] = ('patient', 'code'),
+        bucket: str = 'month',
+        percentiles: Sequence[float] = (5, 25, 50, 75, 95)
+    ) -> Dict:
+        """
+        Count, min, max, mean and percentiles of the matching values per group.
+        Days are date ordinals and both bounds are inclusive.
+        """
+        columns = self.combined
+        patient_number = columns.patient_numbers.get(patient, -1) if patient else None
+        code_number = columns.code_numbers.get(code, -1) if code else None
+        if np is not None:
+            groups = self._query_numpy(columns, patient_number, code_number, start_day, end_day, group_by, bucket, percentiles)
+        else:
+            groups = self._query_python(columns, patient_number, code_number, start_day, end_day, group_by, bucket, percentiles)
+
+        results = []
+        for key, count, minimum, maximum, mean, values in groups:
+            group = {}
+            for field, number in zip(group_by, key):
+                if field == 'patient':
+                    group['patient'] = f"Patient/{columns.patients[number]}"
+                elif field == 'code':
+                    group['code'] = columns.codes[number]
+                    group['unit'] = columns.units.get(columns.codes[number], '')
+                else:
+                    group['period'] = _period_label(number, bucket)
+            group.update({
+                'count': count,
+                'min': minimum,
+                'max': maximum,
+                'mean': mean,
+                'percentiles': {f"p{p:g}": value for p, value in zip(percentiles, values)},
+            })
+            results.append(group)
+        return {
+            'groupBy': list(group_by),
+            'bucket': bucket if 'period' in group_by else None,
+            'total': sum(group['count'] for group in results),
+            'groups': results,
+        }
+
+    @staticmethod
+    def _query_numpy(columns, patient_number, code_number, start_day, end_day, group_by, bucket, percentiles):
+        data = columns.columns
+        mask = np.ones(len(columns), dtype=bool)
+        if patient_number is not None:
+            mask &= data['patient'] == patient_number
+        if code_number is not None:
+            mask &= data['code'] == code_number
+        if start_day is not None:
+            mask &= data['day'] >= start_day
+        if end_day is not None:
+            mask &= data['day'] <= end_day
+        if start_day is not None or end_day is not None:
+            mask &= data['day'] != _MISSING_DAY
+
+        values = data['value'][mask]
+        if len(values) == 0:
+            return []
+        keys = []
+        for field in group_by:
+            if field == 'period':
+                keys.append(_period_numbers(data['day'][mask], data['month'][mask], bucket))
+            else:
+                keys.append(data[field][mask])
+
+        # Sort by group, then value: every group becomes a sorted run
+        order = np.lexsort([values] + keys[::-1])
+        values = values[order]
+        keys = [key[order] for key in keys]
+        boundary = np.zeros(len(values), dtype=bool)
+        boundary[0] = True
+        for key in keys:
+            boundary[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(boundary)
+        counts = np.diff(np.append(starts, len(values)))
+        ends = starts + counts - 1
+        sums = np.add.reduceat(values, starts)
+
+        percentile_columns = []
+        for p in percentiles:
+            position = starts + (counts - 1) * (p / 100)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(lower + 1, ends)
+            percentile_columns.append(values[lower] + (values[upper] - values[lower]) * (position - lower))
+
+        return [
+            (
+                tuple(int(key[start]) for key in keys),
+                int(counts[i]), float(values[start]), float(values[ends[i]]), float(sums[i] / counts[i]),
+                [float(column[i]) for column in percentile_columns]
+            )
+            for i, start in enumerate(starts)
+        ]
+
+    @staticmethod
+    def _query_python(columns, patient_number, code_number, start_day, end_day, group_by, bucket, percentiles):
+        data = columns.columns
+        grouped: Dict[tuple, List[float]] = {}
+        has_range = start_day is not None or end_day is not None
+        for row in range(len(columns)):
+            if patient_number is not None and data['patient'][row] != patient_number:
+                continue
+            if code_number is not None and data['code'][row] != code_number:
+                continue
+            day = data['day'][row]
+            if has_range and (day == _MISSING_DAY
+                              or (start_day is not None and day < start_day)
+                              or (end_day is not None and day > end_day)):
+                continue
+            key = tuple(
+                _period_numbers(day, data['month'][row], bucket) if field == 'period' else data[field][row]
+                for field in group_by
+            )
+            grouped.setdefault(key, []).append(data['value'][row])
+
+        groups = []
+        for key in sorted(grouped):
+            values = sorted(grouped[key])
+            groups.append((
+                key, len(values), values[0], values[-1], sum(values) / len(values),
+                [_percentile(values, p) for p in percentiles]
+            ))
+        return groups
+
+# ============================================================================
+# Patient risk - interpretation counts per patient
+# ============================================================================
+
+# Interpretation codes as classified by the original patient-intelligence handler
+CRITICAL_INTERPRETATIONS = {'C', 'CRT', 'H', 'HH', 'L', 'LL'}
+ABNORMAL_INTERPRETATIONS = {'A', 'AA', 'N'}
+
+_SUBJECT_PREFIX = b'"subject": {"reference": "Patient/'
+_OBSERVATION_MARKER = b'"resourceType": "Observation"'
+_INTERPRETATION_MARKER = b'"interpretation"'
+
+def _subject_patient_id(line: bytes, resource: Optional[Dict] = None) -> Optional[str]:
+    """Patient id of a line's subject, found by string search when the layout allows it"""
+    start = line.find(_SUBJECT_PREFIX)
+    if start != -1:
+        start += len(_SUBJECT_PREFIX)
+        end = line.find(b'"', start)
+        if end != -1:
+            return line[start:end].decode('utf-8')
+    if resource is None:
+        try:
+            resource = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+    reference = (resource.get('subject') or {}).get('reference', '')
+    return reference[len('Patient/'):] if reference.startswith('Patient/') else None
+
+def _concept_text(concept: Optional[Dict]) -> str:
+    concept = concept or {}
+    codings = concept.get('coding') or [{}]
+    return concept.get('text') or codings[0].get('display') or 'Unknown'
+
+class PatientRiskScanner(SegmentScanner):
+    """
+    Demographics from Patient lines, per-patient observation and interpretation-code
+    counts, and condition counts with the first condition names. Observation lines
+    are only parsed when they carry an interpretation.
+    """
+
+    def __init__(self):
+        self.patients: Dict[str, Dict] = {}
+        self.observations = Counter()
+        self.critical = Counter()
+        self.abnormal = Counter()
+        self.conditions = Counter()
+        self.condition_names: Dict[str, List[str]] = {}
+
+    def feed(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        if _OBSERVATION_MARKER in line:
+            patient_id = _subject_patient_id(line)
+            if patient_id is None:
+                return
+            self.observations[patient_id] += 1
+            if _INTERPRETATION_MARKER in line:
+                try:
+                    resource = json.loads(line)
+                except json.JSONDecodeError:
+                    return
+                code = _code_of((resource.get('interpretation') or [{}])[0]) or ''
+                if code in CRITICAL_INTERPRETATIONS:
+                    self.critical[patient_id] += 1
+                elif code in ABNORMAL_INTERPRETATIONS:
+                    self.abnormal[patient_id] += 1
+            return
+
+        try:
+            resource = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        resource_type = resource.get('resourceType')
+        if resource_type == 'Condition':
+            patient_id = _subject_patient_id(line, resource)
+            if patient_id is None:
+                return
+            self.conditions[patient_id] += 1
+            names = self.condition_names.setdefault(patient_id, [])
+            if len(names) < 3:
+                names.append(_concept_text(resource.get('code')))
+        elif resource_type == 'Patient' and resource.get('id'):
+            name = (resource.get('name') or [{}])[0]
+            self.patients[resource['id']] = {
+                'name': f"{(name.get('given') or [''])[0]} {name.get('family', '')}".strip(),
+                'gender': resource.get('gender', 'unknown'),
+                'birthDate': resource.get('birthDate', '1970'),
+            }
+
+    def segment(self) -> Dict:
+        return {
+            'patients': self.patients,
+            'observations': self.observations,
+            'critical': self.critical,
+            'abnormal': self.abnormal,
+            'conditions': self.conditions,
+            'condition_names': self.condition_names,
+        }
+
+def risk_level(risk_score: int) -> str:
+    if risk_score >= 80:
+        return 'critical'
+    if risk_score >= 60:
+        return 'high'
+    if risk_score >= 40:
+        return 'moderate'
+    return 'low'
+
+class PatientRisk(SegmentedView):
+    """Risk scores for every patient, from interpretation-code and condition counts"""
+
+    def __init__(self):
+        super().__init__("patient-risk", PatientRiskScanner)
+
+    def combine(self, segments: List[Dict]) -> Dict:
+        patients: Dict[str, Dict] = {}
+        observations, critical, abnormal, conditions = Counter(), Counter(), Counter(), Counter()
+        condition_names: Dict[str, List[str]] = {}
+        for segment in segments:
+            patients.update(segment['patients'])
+            observations.update(segment['observations'])
+            critical.update(segment['critical'])
+            abnormal.update(segment['abnormal'])
+            conditions.update(segment['conditions'])
+            for patient_id, names in segment['condition_names'].items():
+                merged = condition_names.setdefault(patient_id, [])
+                merged.extend(names[:3 - len(merged)])
+
+        patient_list = []
+        for position, (patient_id, demographics) in enumerate(patients.items()):
+            critical_count = critical[patient_id]
+            abnormal_count = abnormal[patient_id]
+            observation_count = observations[patient_id]
+            risk_score = min(95, 30 + critical_count * 5 + abnormal_count * 2 + conditions[patient_id] * 3)
+            level = risk_level(risk_score)
+            names = condition_names.get(patient_id, [])
+            patient_list.append({
+                'id': patient_id,
+                'name': demographics['name'] or f"Patient {position + 1}",
+                'age': 2024 - int(demographics['birthDate'][:4]),
+                'gender': demographics['gender'],
+                'mrn': patient_id[:8].upper(),
+                'location': f"ICU-{(position % 20) + 1}" if level == 'critical' else f"Room {100 + position}",
+                'intelligence': {
+                    'riskScore': risk_score,
+                    'riskLevel': level,
+                    'criticalLabs': critical_count,
+                    'abnormalLabs': abnormal_count,
+                    'deteriorating': risk_score > 70,
+                    'primaryConcern': names[0] if names else 'Stable',
+                    'alerts': [name[:30] for name in names] or ['Stable'],
+                    'predictedDisposition': 'ICU' if level == 'critical' else 'Floor',
+                    'aiInsights': [
+                        f"Based on {observation_count} observations, patient requires monitoring",
+                        f"Risk score: {risk_score} with {critical_count} critical values"
+                    ]
+                },
+                'recentLabCount': observation_count,
+                'labVelocity': 'high' if observation_count > 20 else 'moderate'
+            })
+        patient_list.sort(key=lambda patient: patient['intelligence']['riskScore'], reverse=True)
+
+        levels = Counter(patient['intelligence']['riskLevel'] for patient in patient_list)
+        return {
+            'timestamp': datetime.utcnow().isoformat(),
+            'totalPatients': len(patient_list),
+            'criticalCount': levels['critical'],
+            'highRiskCount': levels['high'],
+            'moderateRiskCount': levels['moderate'],
+            'deterioratingCount': sum(1 for patient in patient_list if patient['intelligence']['deteriorating']),
+            'patients': patient_list
+        }
+
+# ============================================================================
+# Patient summary - per-patient counts, activity span and top conditions
+# ============================================================================
+
+_RESOURCE_TYPE_MARKER = b'"resourceType": "'
+_PATIENT_REFERENCE_MARKER = b'"Patient/'
+
+# Clinical timestamps; the earliest and latest in a line bound the patient's activity
+_ACTIVITY_DATE = re.compile(
+    rb'"(?:effectiveDateTime|effectiveInstant|issued|authoredOn|whenHandedOver|onsetDateTime|'
+    rb'recordedDate|performedDateTime|collectedDateTime|start|end)": "(\d{4}-\d{2}-\d{2}[^"]*)"'
+)
+
+def _resource_type_of(line: bytes) -> Optional[str]:
+    start = line.find(_RESOURCE_TYPE_MARKER)
+    if start == -1:
+        return None
+    start += len(_RESOURCE_TYPE_MARKER)
+    end = line.find(b'"', start)
+    return line[start:end].decode('utf-8') if end != -1 else None
+
+class PatientSummaryScanner(SegmentScanner):
+    """
+    Resources per patient and type, the earliest and latest clinical timestamp
+    per patient, condition names per patient and patient demographics, from any
+    data file. Only Patient and Condition lines are JSON-parsed.
+    """
+
+    def __init__(self):
+        self.patients: Dict[str, Dict] = {}
+        self.counts: Dict[str, Counter] = {}
+        self.first: Dict[str, str] = {}
+        self.last: Dict[str, str] = {}
+        self.conditions: Dict[str, Counter] = {}
+
+    def feed(self, line: bytes) -> None:
+        resource_type = _resource_type_of(line)
+        if resource_type is None:
+            return
+        if resource_type == 'Patient':
+            try:
+                resource = json.loads(line)
+            except json.JSONDecodeError:
+                return
+            if not resource.get('id'):
+                return
+            name = (resource.get('name') or [{}])[0]
+            self.patients[resource['id']] = {
+                'name': name.get('family', f"Patient_{resource['id'][:8]}"),
+                'gender': resource.get('gender', 'unknown'),
+                'birthDate': resource.get('birthDate', ''),
+            }
+            return
+        if _PATIENT_REFERENCE_MARKER not in line:
+            return
+
+        resource = None
+        if resource_type == 'Condition':
+            try:
+                resource = json.loads(line)
+            except json.JSONDecodeError:
+                return
+        patient_id = _subject_patient_id(line, resource)
+        if patient_id is None:
+            return
+        self.counts.setdefault(patient_id, Counter())[resource_type] += 1
+        timestamps = _ACTIVITY_DATE.findall(line)
+        if timestamps:
+            earliest = min(timestamps).decode('utf-8')
+            latest = max(timestamps).decode('utf-8')
+            if patient_id not in self.first or earliest < self.first[patient_id]:
+                self.first[patient_id] = earliest
+            if patient_id not in self.last or latest > self.last[patient_id]:
+                self.last[patient_id] = latest
+        if resource is not None:
+            self.conditions.setdefault(patient_id, Counter())[_concept_text(resource.get('code'))] += 1
+
+    def segment(self) -> Dict:
+        return {
+            'patients': self.patients,
+            'counts': self.counts,
+            'first': self.first,
+            'last': self.last,
+            'conditions': self.conditions,
+        }
+
+def _data_quality(observation_count: int) -> str:
+    if observation_count > 30000:
+        return 'excellent'
+    if observation_count >= 1000:
+        return 'good'
+    return 'moderate'
+
+# Fields /patients-summary can be sorted by
+SUMMARY_SORT_FIELDS = (
+    'name', 'age', 'observationCount', 'encounterCount', 'conditionCount',
+    'resourceCount', 'firstActivity', 'lastActivity',
+)
+
+class PatientSummary(SegmentedView):
+    """One row per patient with exact resource counts, activity span and top conditions"""
+
+    def __init__(self, top_conditions: int = 3):
+        super().__init__("patient-summary", PatientSummaryScanner)
+        self.top_conditions = top_conditions
+
+    def combine(self, segments: List[Dict]) -> Dict[str, List[Dict]]:
+        """The summaries in every SUMMARY_SORT_FIELDS order, keyed by sort parameter"""
+        patients: Dict[str, Dict] = {}
+        counts: Dict[str, Counter] = {}
+        conditions: Dict[str, Counter] = {}
+        first: Dict[str, str] = {}
+        last: Dict[str, str] = {}
+        for segment in segments:
+            patients.update(segment['patients'])
+            for patient_id, type_counts in segment['counts'].items():
+                counts.setdefault(patient_id, Counter()).update(type_counts)
+            for patient_id, names in segment['conditions'].items():
+                conditions.setdefault(patient_id, Counter()).update(names)
+            for patient_id, timestamp in segment['first'].items():
+                if patient_id not in first or timestamp < first[patient_id]:
+                    first[patient_id] = timestamp
+            for patient_id, timestamp in segment['last'].items():
+                if patient_id not in last or timestamp > last[patient_id]:
+                    last[patient_id] = timestamp
+
+        summaries = []
+        for patient_id, demographics in patients.items():
+            type_counts = counts.get(patient_id, Counter())
+            top = conditions.get(patient_id, Counter()).most_common(self.top_conditions)
+            birth_date = demographics['birthDate']
+            summaries.append({
+                'id': patient_id,
+                'name': demographics['name'],
+                'gender': demographics['gender'],
+                'age': 2024 - int(birth_date[:4]) if birth_date else None,
+                'birthDate': birth_date,
+                'observationCount': type_counts['Observation'],
+                'encounterCount': type_counts['Encounter'],
+                'conditionCount': type_counts['Condition'],
+                'resourceCount': sum(type_counts.values()),
+                'resourceCounts': dict(sorted(type_counts.items())),
+                'firstActivity': first.get(patient_id),
+                'lastActivity': last.get(patient_id),
+                'conditions': [name[:50] for name, _ in top],
+                'topConditions': [{'display': name, 'count': count} for name, count in top],
+                'dataQuality': _data_quality(type_counts['Observation']),
+            })
+
+        # Every supported order is sorted once here, so requests only slice
+        orders = {}
+        for field in SUMMARY_SORT_FIELDS:
+            # Patients without a value (no birth date, no activity) go last either way
+            present = [summary for summary in summaries if summary[field] is not None]
+            missing = [summary for summary in summaries if summary[field] is None]
+            for descending in (False, True):
+                orders[f"-{field}" if descending else field] = sorted(
+                    present, key=lambda summary: summary[field], reverse=descending
+                ) + missing
+        return orders
+
+    def page(self, sort: str = '-observationCount', offset: int = 0, count: int = 100) -> Dict:
+        """A page of summaries ordered by a SUMMARY_SORT_FIELDS field (prefix - for descending)"""
+        summaries = self.combined[sort]
+        return {
+            'total': len(summaries),
+            'offset': offset,
+            'count': count,
+            'sort': sort,
+            'patients': summaries[offset:offset + count],
+        }
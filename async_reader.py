@@ -0,0 +1,118 @@
+"""
+Non-blocking NDJSON reads for streaming responses
+Files are read with aiofiles in large chunks and split into lines on the event
+loop, so many concurrent streams share one loop instead of holding a worker
+thread each. Reads are pulled by the consumer: the next chunk is requested
+only while the current one is being parsed, so a slow client holds at most two
+chunks per file in memory. Output is re-buffered into SEND_SIZE pieces before
+it is sent.
+"""
+
+import asyncio
+import json
+import os
+from contextlib import aclosing, suppress
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import aiofiles
+
+CHUNK_SIZE = 1 << 20
+
+# Streamed responses are sent in pieces of about this size, not one message per resource:
+# each message costs an ASGI send and, when compressed, a compressor flush
+SEND_SIZE = 64 * 1024
+
+async def read_lines(filepath: str, chunk_size: int = CHUNK_SIZE, contains: Optional[bytes] = None) -> AsyncIterator[bytes]:
+    """
+    Yield the non-empty lines of a file, reading ahead by one chunk.
+    With contains, chunks without it are skipped whole instead of split into lines.
+    """
+    async with aiofiles.open(filepath, 'rb') as f:
+        pending = asyncio.ensure_future(f.read(chunk_size))
+        remainder = b''
+        try:
+            while True:
+                chunk = await pending
+                if not chunk:
+                    break
+                # Overlap the next read with parsing this chunk
+                pending = asyncio.ensure_future(f.read(chunk_size))
+                buffer = remainder + chunk
+                end = buffer.rfind(b'\n')
+                # The partial last line waits for the next chunk
+                complete, remainder = (buffer[:end], buffer[end + 1:]) if end != -1 else (b'', buffer)
+                if complete and (contains is None or contains in complete):
+                    for line in complete.split(b'\n'):
+                        if line.strip():
+                            yield line
+                # Let other requests run between chunks
+                await asyncio.sleep(0)
+        finally:
+            # The file must not be closed under a read in progress
+            with suppress(Exception):
+                await pending
+        if remainder.strip() and (contains is None or contains in remainder):
+            yield remainder
+
+async def read_resources(
+    filepath: str,
+    filter_func: Optional[Callable[[Dict], bool]] = None,
+    line_filter: Optional[bytes] = None,
+    limit: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[Dict]:
+    """
+    Yield parsed resources from an NDJSON file. Lines not containing line_filter
+    are skipped without parsing; malformed lines are skipped. A missing file
+    yields nothing.
+    """
+    if not os.path.exists(filepath):
+        return
+    matched = 0
+    async with aclosing(read_lines(filepath, chunk_size, line_filter)) as lines:
+        async for line in lines:
+            if line_filter is not None and line_filter not in line:
+                continue
+            try:
+                resource = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if filter_func is None or filter_func(resource):
+                yield resource
+                matched += 1
+                if limit is not None and matched >= limit:
+                    return
+
+async def read_many(
+    data_dir: str,
+    filenames: Iterable[str],
+    filter_func: Optional[Callable[[Dict], bool]] = None,
+    line_filter: Optional[bytes] = None,
+    limit: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[Dict]:
+    """read_resources over several files in order, with one limit across all of them"""
+    remaining = limit
+    for filename in filenames:
+        if remaining is not None and remaining <= 0:
+            return
+        resources = read_resources(os.path.join(data_dir, filename), filter_func, line_filter, remaining, chunk_size)
+        async with aclosing(resources):
+            async for resource in resources:
+                yield resource
+                if remaining is not None:
+                    remaining -= 1
+
+async def buffered(parts: AsyncIterator[bytes], size: int = SEND_SIZE) -> AsyncIterator[bytes]:
+    """Join small byte strings into chunks of at least size bytes (the last one may be smaller)"""
+    pending: List[bytes] = []
+    pending_size = 0
+    async with aclosing(parts):
+        async for part in parts:
+            pending.append(part)
+            pending_size += len(part)
+            if pending_size >= size:
+                yield b''.join(pending)
+                pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
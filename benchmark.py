@@ -0,0 +1,451 @@
+"""
+Benchmark harness for the FHIR API
+Generates synthetic MIMIC-shaped NDJSON in the FILE_MAPPINGS layout at several
+scales, drives search, read, _summary=count and cached searches in-process
+(ASGI, no sockets) and over HTTP (a local uvicorn), and compares throughput,
+latency percentiles and memory against a recorded JSON baseline
+
+Usage:
+    python benchmark.py --scales 1 10 --update-baseline   # record a baseline
+    python benchmark.py --scales 1 10                     # compare; exit 1 on regressions
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+# Scale 1 has as many patients as the demo dataset
+PATIENTS_PER_SCALE = 100
+
+# Resources generated per patient, per file. Densities are reduced from the demo
+# (which has ~8,000 observations per patient) so 100x stays a few GB; use
+# --density to approach demo volume.
+PER_PATIENT = {
+    'MimicEncounter.ndjson': 3,
+    'MimicEncounterED.ndjson': 1,
+    'MimicEncounterICU.ndjson': 1,
+    'MimicCondition.ndjson': 10,
+    'MimicConditionED.ndjson': 2,
+    'MimicObservationLabevents.ndjson': 150,
+    'MimicObservationChartevents.ndjson': 200,
+    'MimicObservationDatetimeevents.ndjson': 10,
+    'MimicObservationOutputevents.ndjson': 20,
+    'MimicObservationED.ndjson': 10,
+    'MimicObservationVitalSignsED.ndjson': 20,
+    'MimicObservationMicroTest.ndjson': 5,
+    'MimicObservationMicroOrg.ndjson': 2,
+    'MimicObservationMicroSusc.ndjson': 5,
+    'MimicProcedure.ndjson': 5,
+    'MimicProcedureED.ndjson': 1,
+    'MimicProcedureICU.ndjson': 3,
+    'MimicMedicationRequest.ndjson': 20,
+    'MimicMedicationAdministration.ndjson': 30,
+    'MimicMedicationAdministrationICU.ndjson': 20,
+    'MimicMedicationDispense.ndjson': 10,
+    'MimicMedicationDispenseED.ndjson': 2,
+    'MimicMedicationStatementED.ndjson': 3,
+    'MimicSpecimen.ndjson': 3,
+    'MimicSpecimenLab.ndjson': 15,
+}
+
+# Resources shared by all patients, per file (not scaled)
+SHARED = {
+    'MimicOrganization.ndjson': 1,
+    'MimicLocation.ndjson': 30,
+    'MimicMedication.ndjson': 500,
+    'MimicMedicationMix.ndjson': 50,
+}
+
+MANIFEST = 'benchmark-manifest.json'
+PROFILE_BASE = 'http://mimic.mit.edu/fhir/mimic/StructureDefinition/'
+CODE_SYSTEM = 'http://mimic.mit.edu/fhir/mimic/CodeSystem/'
+
+# ============================================================================
+# Synthetic dataset
+# ============================================================================
+
+class _ResourceFactory:
+    """Builds MIMIC-shaped resources with the fields the search filters read"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.start = datetime(2180, 1, 1)
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def timestamp(self) -> str:
+        moment = self.start + timedelta(minutes=self.rng.randrange(0, 60 * 24 * 365 * 5))
+        return moment.strftime('%Y-%m-%dT%H:%M:%S-04:00')
+
+    def coding(self, system: str, code: str, display: str) -> Dict:
+        return {"coding": [{"code": code, "system": CODE_SYSTEM + system, "display": display}]}
+
+    def resource(self, resource_type: str, profile: str, patient_id: str, encounter_id: Optional[str]) -> Dict:
+        """Create one patient-scoped resource; keys are ordered with id first, as in the demo files"""
+        rng = self.rng
+        resource = {"id": self.new_id(), "meta": {"profile": [PROFILE_BASE + profile]}}
+        if resource_type == 'Encounter':
+            start = self.timestamp()
+            resource["class"] = {"code": rng.choice(["AMB", "EMER", "IMP"])}
+            resource["period"] = {"start": start, "end": start}
+            resource["status"] = "finished"
+        elif resource_type == 'Observation':
+            code = rng.randrange(50800, 51000)
+            resource["code"] = self.coding("mimic-d-labitems", str(code), f"Lab item {code}")
+            resource["status"] = "final"
+            category = "laboratory" if rng.random() < 0.6 else "vital-signs"
+            resource["category"] = [self.coding("mimic-observation-category", category, category)]
+            resource["effectiveDateTime"] = self.timestamp()
+            resource["valueQuantity"] = {"value": round(rng.uniform(0, 200), 1), "unit": "mg/dL"}
+        elif resource_type == 'Condition':
+            code = str(rng.randrange(1000, 9999))
+            resource["code"] = self.coding("mimic-diagnosis-icd9", code, f"Diagnosis {code}")
+            resource["category"] = [self.coding("condition-category", "encounter-diagnosis", "Encounter Diagnosis")]
+        elif resource_type == 'Procedure':
+            code = str(rng.randrange(1000, 9999))
+            resource["code"] = self.coding("mimic-procedure-icd9", code, f"Procedure {code}")
+            resource["status"] = "completed"
+            resource["performedDateTime"] = self.timestamp()
+        elif resource_type.startswith('Medication'):
+            resource["status"] = "completed"
+            resource["medicationCodeableConcept"] = self.coding("mimic-medication-name", f"MED{rng.randrange(500)}", "Medication")
+            resource["effectiveDateTime"] = self.timestamp()
+        elif resource_type == 'Specimen':
+            resource["type"] = self.coding("mimic-spec-type-desc", str(rng.randrange(70000, 70100)), "Specimen")
+            resource["collection"] = {"collectedDateTime": self.timestamp()}
+
+        resource["subject"] = {"reference": f"Patient/{patient_id}"}
+        if encounter_id and resource_type != 'Encounter':
+            element = 'context' if resource_type in ('MedicationAdministration', 'MedicationDispense', 'MedicationStatement') else 'encounter'
+            resource[element] = {"reference": f"Encounter/{encounter_id}"}
+        resource["resourceType"] = resource_type
+        return resource
+
+    def shared(self, resource_type: str, profile: str, index: int) -> Dict:
+        resource = {"id": self.new_id(), "meta": {"profile": [PROFILE_BASE + profile]}}
+        resource["name"] = f"{resource_type} {index}"
+        resource["resourceType"] = resource_type
+        return resource
+
+def generate_dataset(path: str, scale: int, file_mappings: Dict[str, List[str]], density: float = 1.0, seed: int = 0) -> Dict:
+    """
+    Write a synthetic dataset for one scale into path and return its manifest,
+    which lists sample patient and resource ids for the benchmark queries.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = random.Random(seed)
+    factory = _ResourceFactory(rng)
+    types_by_file = {filename: resource_type for resource_type, filenames in file_mappings.items() for filename in filenames}
+
+    patient_ids = [factory.new_id() for _ in range(PATIENTS_PER_SCALE * scale)]
+    with open(os.path.join(path, 'MimicPatient.ndjson'), 'w') as f:
+        for number, patient_id in enumerate(patient_ids):
+            patient = {
+                "id": patient_id,
+                "meta": {"profile": [PROFILE_BASE + "mimic-patient"]},
+                "name": [{"use": "official", "family": f"Patient_{10000000 + number}"}],
+                "gender": rng.choice(["female", "male"]),
+                "birthDate": f"{rng.randrange(2050, 2150)}-0{rng.randrange(1, 10)}-1{rng.randrange(0, 10)}",
+                "resourceType": "Patient"
+            }
+            f.write(json.dumps(patient) + '\n')
+
+    for filename, count in SHARED.items():
+        resource_type = types_by_file[filename]
+        with open(os.path.join(path, filename), 'w') as f:
+            for index in range(count):
+                f.write(json.dumps(factory.shared(resource_type, filename[len('Mimic'):-len('.ndjson')].lower(), index)) + '\n')
+
+    # Encounters are generated first so other resources can reference them
+    encounters: Dict[str, List[str]] = {}
+    sample_ids: Dict[str, List[str]] = {}
+    encounter_files = [filename for filename in PER_PATIENT if types_by_file[filename] == 'Encounter']
+    other_files = [filename for filename in PER_PATIENT if filename not in encounter_files]
+    for filename in encounter_files + other_files:
+        resource_type = types_by_file[filename]
+        per_patient = max(1, round(PER_PATIENT[filename] * density))
+        profile = filename[len('Mimic'):-len('.ndjson')].lower()
+        with open(os.path.join(path, filename), 'w') as f:
+            for patient_id in patient_ids:
+                patient_encounters = encounters.get(patient_id)
+                for _ in range(per_patient):
+                    encounter_id = rng.choice(patient_encounters) if patient_encounters else None
+                    resource = factory.resource(resource_type, profile, patient_id, encounter_id)
+                    if resource_type == 'Encounter':
+                        encounters.setdefault(patient_id, []).append(resource["id"])
+                    samples = sample_ids.setdefault(resource_type, [])
+                    if len(samples) < 1000 and rng.random() < 0.05:
+                        samples.append(resource["id"])
+                    f.write(json.dumps(resource) + '\n')
+
+    manifest = {
+        "scale": scale,
+        "density": density,
+        "seed": seed,
+        "patients": len(patient_ids),
+        "sample_patients": rng.sample(patient_ids, min(200, len(patient_ids))),
+        "sample_ids": sample_ids,
+        "bytes": sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith('.ndjson')),
+        "generated": datetime.now().isoformat()
+    }
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+def ensure_dataset(root: str, scale: int, file_mappings: Dict[str, List[str]], density: float, seed: int) -> tuple:
+    """Reuse a previously generated dataset when its parameters match, else generate it"""
+    path = os.path.join(root, f"scale-{scale}")
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("density") == density and manifest.get("seed") == seed:
+            return path, manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    print(f"Generating {scale}x dataset in {path}...")
+    return path, generate_dataset(path, scale, file_mappings, density, seed)
+
+# ============================================================================
+# Measurement
+# ============================================================================
+
+def percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+def _rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident and peak memory of a process in MB (Linux only)"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return round(int(fields['VmRSS'].split()[0]) / 1024, 1)
+
+def measure(operation: Callable[[int], None], iterations: int, pid: Optional[int] = None) -> Dict:
+    """Run operation(i) iterations times and summarize throughput, latency and memory"""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "rss_mb": _rss_mb(pid),
+    }
+
+def run_cases(client, manifest: Dict, iterations: int, scan_iterations: int, pid: Optional[int] = None) -> Dict:
+    """
+    Drive the API through a client with a .get(path) method.
+    Cold cases rotate through patients so every request misses the bundle cache.
+    """
+    patients = manifest["sample_patients"]
+    observation_ids = manifest["sample_ids"].get("Observation", [])
+
+    def get(path: str, expected: int = 200) -> None:
+        response = client.get(path)
+        if response.status_code != expected:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+    # Build id indexes and line counts outside the measured runs
+    get(f"/Observation/{observation_ids[0]}")
+
+    results = {}
+    results["search_cold"] = measure(
+        lambda i: get(f"/Observation?patient={patients[i % len(patients)]}&_count=50"), scan_iterations, pid
+    )
+    results["search_cached"] = measure(
+        lambda i: get(f"/Observation?patient={patients[0]}&_count=50"), iterations, pid
+    )
+    results["summary_count"] = measure(
+        lambda i: get(f"/Observation?patient={patients[-1 - i % len(patients)]}&_summary=count"), scan_iterations, pid
+    )
+    results["read"] = measure(
+        lambda i: get(f"/Observation/{observation_ids[(i * 7919) % len(observation_ids)]}"), iterations, pid
+    )
+    results["patient_page"] = measure(lambda i: get("/Patient?_count=100"), iterations, pid)
+    return results
+
+def benchmark_cache(iterations: int) -> Dict:
+    """In-process InMemoryCache get/set throughput with bundle-sized values"""
+    from cache import InMemoryCache
+
+    cache = InMemoryCache(max_size=5000)
+    bundle = {"resourceType": "Bundle", "entry": [{"resource": {"id": str(i)}} for i in range(50)]}
+    keys = [("bundle", "Observation", "patient", str(i)) for i in range(5000)]
+    operations = iterations * 100
+    return {
+        "set": measure(lambda i: cache.set(keys[i % len(keys)], bundle), operations),
+        "get": measure(lambda i: cache.get(keys[i % len(keys)]), operations),
+    }
+
+def _reset_app_state(main, data_path: str) -> None:
+    """Point the in-process app at a dataset with empty caches and indexes"""
+    main.data_dir = data_path
+    main.clear_all_caches()
+    main.resource_id_index.clear()
+    main.file_line_counts.clear()
+
+def benchmark_inprocess(data_path: str, manifest: Dict, iterations: int, scan_iterations: int) -> Dict:
+    """Run the cases against the ASGI app in this process (no sockets)"""
+    from fastapi.testclient import TestClient
+    import main
+
+    _reset_app_state(main, data_path)
+    with TestClient(main.app) as client:
+        return run_cases(client, manifest, iterations, scan_iterations)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def local_server(data_path: Optional[str] = None, timeout: float = 600) -> Iterator[tuple]:
+    """Run a single-worker uvicorn on a free port until ready; yields (base_url, process)"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, FHIR_BASE_URL=base_url)
+    if data_path:
+        env['FHIR_DATA_DIR'] = data_path
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    try:
+        deadline = time.time() + timeout
+        while True:
+            try:
+                if httpx.get(f"{base_url}/ready").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None or time.time() > deadline:
+                raise RuntimeError("uvicorn did not become ready")
+            time.sleep(0.2)
+        yield base_url, server
+    finally:
+        server.terminate()
+        server.wait()
+
+def benchmark_http(data_path: str, manifest: Dict, iterations: int, scan_iterations: int) -> Dict:
+    """Run the cases over HTTP against a local single-worker uvicorn"""
+    with local_server(data_path) as (base_url, server):
+        with httpx.Client(base_url=base_url, timeout=300) as client:
+            return run_cases(client, manifest, iterations, scan_iterations, pid=server.pid)
+
+# ============================================================================
+# Baseline comparison
+# ============================================================================
+
+# Metric -> direction in which a change is a regression
+_REGRESSION_DIRECTIONS = {"ops_per_sec": -1, "p50_ms": 1, "p99_ms": 1, "rss_mb": 1}
+
+def _flatten(results: Dict, prefix: str = '') -> Dict[str, Dict]:
+    """Flatten nested results into {"scale-1/http/search_cold": {...metrics}}"""
+    flat = {}
+    for name, value in results.items():
+        path = f"{prefix}/{name}" if prefix else name
+        if isinstance(value, dict) and "p50_ms" in value:
+            flat[path] = value
+        elif isinstance(value, dict):
+            flat.update(_flatten(value, path))
+    return flat
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every metric that got worse than the baseline by more than tolerance"""
+    regressions = []
+    baseline_cases = _flatten(baseline.get("results", {}))
+    for case, measured in _flatten(results).items():
+        reference = baseline_cases.get(case)
+        if reference is None:
+            continue
+        for metric, direction in _REGRESSION_DIRECTIONS.items():
+            old, new = reference.get(metric), measured.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(f"{case} {metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the FHIR API against a recorded baseline")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10], help="Dataset scales (1 = 100 patients)")
+    parser.add_argument('--modes', nargs='+', choices=['inprocess', 'http'], default=['inprocess', 'http'])
+    parser.add_argument('--data-root', default='/tmp/fhir-benchmark', help="Where generated datasets are kept")
+    parser.add_argument('--density', type=float, default=1.0, help="Multiplier for resources per patient")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=200, help="Iterations for cached/indexed cases")
+    parser.add_argument('--scan-iterations', type=int, default=10, help="Iterations for cases that scan files")
+    parser.add_argument('--baseline', default='benchmark-baseline.json')
+    parser.add_argument('--update-baseline', action='store_true', help="Write results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before flagging")
+    parser.add_argument('--output', help="Also write this run's results to a file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from main import FILE_MAPPINGS
+
+    results = {"cache": benchmark_cache(args.iterations)}
+    for scale in args.scales:
+        data_path, manifest = ensure_dataset(args.data_root, scale, FILE_MAPPINGS, args.density, args.seed)
+        scale_results = results[f"scale-{scale}"] = {}
+        for mode in args.modes:
+            print(f"Running {scale}x {mode} ({manifest['bytes'] / 1e6:.0f} MB)...")
+            runner = benchmark_inprocess if mode == 'inprocess' else benchmark_http
+            scale_results[mode] = runner(data_path, manifest, args.iterations, args.scan_iterations)
+
+    for case, measured in _flatten(results).items():
+        print(f"  {case:<40} {measured['ops_per_sec']:>10} ops/s  p50 {measured['p50_ms']:>9} ms  "
+              f"p99 {measured['p99_ms']:>9} ms  rss {measured['rss_mb']} MB")
+
+    report = {
+        "recorded": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "parameters": {"density": args.density, "seed": args.seed, "iterations": args.iterations,
+                       "scan_iterations": args.scan_iterations},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%} of {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
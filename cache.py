@@ -1,30 +1,220 @@
 """
 Simple in-memory caching layer for PathPilot FHIR API
 Optimized for static test data with long TTLs
+Optionally backed by a shared Redis-protocol server (FHIR_CACHE_URL)
 """
 
+import asyncio
+import fcntl
 import hashlib
+import heapq
+import json
+import os
+import queue
+import socket
+import sqlite3
+import threading
 import time
-from typing import Any, Optional, Callable, Dict, Union
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from sys import intern
+from typing import Any, Optional, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Union
+from urllib.parse import urlsplit
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import wraps
 from datetime import datetime, timedelta
 
-class InMemoryCache:
-    """Simple in-memory cache with TTL support"""
+# Cache keys are tuples of hashable parts (plain strings are still accepted)
+CacheKey = Union[str, tuple]
 
-    def __init__(self, default_ttl: Optional[int] = None, max_size: int = 1000):
+def serialize_key(key: CacheKey) -> str:
+    """
+    String form of a key for crossing a process or disk boundary.
+    Leading string parts stay readable (so pattern clears still match)
+    and the full key is hashed into a fixed-length suffix.
+    """
+    if isinstance(key, str):
+        return key
+    readable = []
+    for part in key[:2]:
+        if not isinstance(part, str):
+            break
+        readable.append(part)
+    digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+    return ":".join(readable + [digest])
+
+class CacheBackend(ABC):
+    """Interface shared by all cache backends"""
+
+    @abstractmethod
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Get value from cache"""
+
+    def get_stale(self, key: CacheKey) -> Tuple[Optional[Any], bool]:
+        """Get value even if past its TTL but within its stale window; returns (value, is_stale)"""
+        return self.get(key), False
+
+    @abstractmethod
+    def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        stale_ttl: Optional[int] = None
+    ) -> None:
+        """
+        Set value in cache, optionally labelled with invalidation tags.
+        With stale_ttl, the value stays available to get_stale for that many
+        seconds after it expires.
+        """
+
+    def get_many(self, keys: List[CacheKey]) -> Dict[CacheKey, Any]:
+        """Get several values at once; missing keys are omitted"""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, items: Dict[CacheKey, Any], ttl: Optional[int] = None, tags: Iterable[str] = ()) -> None:
+        """Set several values at once, all labelled with the same tags"""
+        for key, value in items.items():
+            self.set(key, value, ttl, tags)
+
+    @abstractmethod
+    def clear(self, pattern: Optional[str] = None) -> int:
+        """Clear cache entries matching pattern or all if pattern is None"""
+
+    @abstractmethod
+    def invalidate(self, *tags: str) -> int:
+        """Clear entries carrying every one of the given tags"""
+
+    def sweep(self, limit: int = 1000) -> int:
+        """Reclaim up to limit expired entries; returns how many were removed"""
+        return 0
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+
+class _CacheShard:
+    """One lock-protected slice of an InMemoryCache"""
+
+    __slots__ = (
+        'lock', 'entries', 'tag_index', 'capacity', 'byte_capacity', 'nbytes',
+        'hits', 'misses', 'evictions', 'expiry_heap', 'sequence'
+    )
+
+    def __init__(self, capacity: int, byte_capacity: Optional[int] = None):
+        self.lock = threading.Lock()
+        # key -> (value, expiry, tags, removal, size)
+        self.entries: OrderedDict = OrderedDict()
+        # Tag -> keys of this shard's entries, kept under the same lock as the entries
+        self.tag_index: Dict[str, Set[CacheKey]] = {}
+        self.capacity = capacity
+        self.byte_capacity = byte_capacity
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # (removal time, sequence, key), popped by sweeps; superseded items are skipped
+        self.expiry_heap: List[tuple] = []
+        self.sequence = 0
+
+    def schedule(self, removal: float, key: CacheKey) -> None:
+        """Queue a key for removal by the sweeper (caller holds the lock)"""
+        self.sequence += 1
+        heapq.heappush(self.expiry_heap, (removal, self.sequence, key))
+        if len(self.expiry_heap) > 2 * self.capacity + 64:
+            # Mostly superseded items: rebuild from the live entries
+            self.expiry_heap = [
+                (entry[3], sequence, k)
+                for sequence, (k, entry) in enumerate(self.entries.items())
+                if entry[3] is not None
+            ]
+            heapq.heapify(self.expiry_heap)
+            self.sequence = len(self.entries)
+
+    def remove(self, key: CacheKey) -> tuple:
+        """Pop an entry, dropping it from the tag index and byte count (caller holds the lock)"""
+        entry = self.entries.pop(key)
+        self.untag(key, entry[2])
+        self.nbytes -= entry[4]
+        return entry
+
+    def full(self, size: int) -> bool:
+        """Whether an entry of size bytes only fits after evicting (caller holds the lock)"""
+        if len(self.entries) >= self.capacity:
+            return True
+        return self.byte_capacity is not None and self.nbytes + size > self.byte_capacity
+
+    def tag(self, key: CacheKey, tags: tuple) -> None:
+        """Add a key to the tag index (caller holds the lock)"""
+        for tag in tags:
+            self.tag_index.setdefault(tag, set()).add(key)
+
+    def untag(self, key: CacheKey, tags: tuple) -> None:
+        """Drop a key from the tag index (caller holds the lock)"""
+        for tag in tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_index[tag]
+
+class InMemoryCache(CacheBackend):
+    """
+    Simple in-memory cache with TTL support.
+    Keys are spread over lock-striped shards so concurrent readers of
+    different keys rarely contend; stats are counted under the shard lock
+    and stay exact. Entries may carry tags, kept in a per-shard tag -> keys
+    index so invalidation touches only the affected entries and writes never
+    take a cache-wide lock. Expired entries are reclaimed by sweep() in expiry
+    order, not only when read again. With max_bytes, shards also evict to stay
+    under their share of a byte budget, and values too large for it are not cached.
+    """
+
+    def __init__(
+        self,
+        default_ttl: Optional[int] = None,
+        max_size: int = 1000,
+        shards: int = 16,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
         """
         Initialize cache
 
         Args:
             default_ttl: Default time-to-live in seconds (None = never expire)
             max_size: Maximum number of items to cache
+            shards: Number of independently locked shards
+            max_bytes: Maximum total size of cached values (None = count limit only)
+            sizeof: Size in bytes charged for a value against max_bytes
         """
-        self.cache: Dict[str, tuple[Any, Optional[float]]] = {}
         self.default_ttl = default_ttl
         self.max_size = max_size
-        self.hits = 0
-        self.misses = 0
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof if max_bytes is not None else None
+        shard_count = max(1, min(shards, max_size))
+        # Spread max_size (and max_bytes) over the shards so their capacities sum to it exactly
+        base, extra = divmod(max_size, shard_count)
+        byte_base, byte_extra = divmod(max_bytes, shard_count) if max_bytes is not None else (None, 0)
+        self.shards = [
+            _CacheShard(
+                base + (1 if i < extra else 0),
+                byte_base + (1 if i < byte_extra else 0) if byte_base is not None else None
+            )
+            for i in range(shard_count)
+        ]
+        self._next_sweep_shard = 0
+
+    def _shard(self, key: CacheKey) -> _CacheShard:
+        return self.shards[hash(key) % len(self.shards)]
 
     def _is_expired(self, timestamp: Optional[float]) -> bool:
         """Check if cached item has expired"""
@@ -32,150 +222,1160 @@ class InMemoryCache:
             return False  # Never expires
         return time.time() > timestamp
 
-    def _evict_lru(self):
-        """Evict least recently used items if cache is full"""
-        if len(self.cache) >= self.max_size:
-            # Remove oldest item (simple FIFO for now)
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-
-    def get(self, key: str) -> Optional[Any]:
+    def get(self, key: CacheKey) -> Optional[Any]:
         """Get value from cache"""
-        if key in self.cache:
-            value, expiry = self.cache[key]
-            if not self._is_expired(expiry):
-                self.hits += 1
-                return value
-            else:
-                # Remove expired entry
-                del self.cache[key]
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            expired = False
+            if entry is not None:
+                value, expiry, _, removal, _ = entry
+                if not self._is_expired(expiry):
+                    shard.entries.move_to_end(key)
+                    shard.hits += 1
+                    return value
+                # Entries inside their stale window stay for get_stale
+                expired = self._is_expired(removal)
+            shard.misses += 1
 
-        self.misses += 1
+        if expired:
+            self._remove_expired(key)
         return None
 
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
-        """Set value in cache"""
+    def get_stale(self, key: CacheKey) -> Tuple[Optional[Any], bool]:
+        """Get value even if past its TTL but within its stale window; returns (value, is_stale)"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None:
+                value, expiry, _, removal, _ = entry
+                if not self._is_expired(removal):
+                    shard.entries.move_to_end(key)
+                    shard.hits += 1
+                    return value, self._is_expired(expiry)
+            shard.misses += 1
+
+        if entry is not None:
+            self._remove_expired(key)
+        return None, False
+
+    def _remove_expired(self, key: CacheKey) -> bool:
+        """Remove an entry past its removal time, unless it was replaced in the meantime"""
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None or not self._is_expired(entry[3]):
+                return False
+            shard.remove(key)
+        return True
+
+    def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        stale_ttl: Optional[int] = None
+    ) -> None:
+        """Set value in cache, optionally labelled with invalidation tags and a stale window"""
         ttl = ttl if ttl is not None else self.default_ttl
         expiry = (time.time() + ttl) if ttl else None  # None = never expires
+        removal = (expiry + stale_ttl) if expiry is not None and stale_ttl else expiry
+        tags = tuple(tags)
+        size = self.sizeof(value) if self.sizeof is not None else 0
 
-        self._evict_lru()
-        self.cache[key] = (value, expiry)
+        shard = self._shard(key)
+        with shard.lock:
+            if key in shard.entries:
+                shard.remove(key)
+            if shard.byte_capacity is not None and size > shard.byte_capacity:
+                # Would evict the whole shard; not worth caching
+                return
+            while shard.full(size):
+                # Evict least recently used entries in this shard
+                shard.remove(next(iter(shard.entries)))
+                shard.evictions += 1
+            shard.entries[key] = (value, expiry, tags, removal, size)
+            shard.nbytes += size
+            shard.tag(key, tags)
+            if removal is not None:
+                shard.schedule(removal, key)
 
     def clear(self, pattern: Optional[str] = None) -> int:
         """Clear cache entries matching pattern or all if pattern is None"""
-        if pattern is None:
-            count = len(self.cache)
-            self.cache.clear()
-            return count
+        cleared = 0
+        for shard in self.shards:
+            with shard.lock:
+                if pattern is None:
+                    cleared += len(shard.entries)
+                    shard.entries.clear()
+                    shard.tag_index.clear()
+                    shard.expiry_heap.clear()
+                    shard.nbytes = 0
+                    continue
+                # Substring match for string keys, part match for tuple keys
+                keys_to_delete = [k for k in shard.entries if pattern in k]
+                for key in keys_to_delete:
+                    shard.remove(key)
+                cleared += len(keys_to_delete)
+        return cleared
 
-        keys_to_delete = [k for k in self.cache.keys() if pattern in k]
-        for key in keys_to_delete:
-            del self.cache[key]
-        return len(keys_to_delete)
+    def invalidate(self, *tags: str) -> int:
+        """Clear entries carrying every one of the given tags, via the tag index"""
+        if not tags:
+            return 0
+        cleared = 0
+        for shard in self.shards:
+            with shard.lock:
+                # Intersect starting from the smallest tag set
+                key_sets = sorted((shard.tag_index.get(tag, set()) for tag in tags), key=len)
+                keys = key_sets[0].intersection(*key_sets[1:])
+                for key in keys:
+                    shard.remove(key)
+                cleared += len(keys)
+        return cleared
+
+    def remove_where(self, predicate: Callable[[CacheKey], bool]) -> int:
+        """Remove entries whose key satisfies predicate"""
+        removed = 0
+        for shard in self.shards:
+            with shard.lock:
+                keys = [key for key in shard.entries if predicate(key)]
+                for key in keys:
+                    shard.remove(key)
+                removed += len(keys)
+        return removed
+
+    def sweep(self, limit: int = 1000) -> int:
+        """
+        Reclaim up to limit entries whose removal time has passed, in expiry order.
+        Each shard's lock is held only while popping its due keys, so requests
+        are blocked for at most one small slice.
+        """
+        now = time.time()
+        due = []
+        start = self._next_sweep_shard
+        for offset in range(len(self.shards)):
+            shard = self.shards[(start + offset) % len(self.shards)]
+            with shard.lock:
+                heap = shard.expiry_heap
+                while heap and heap[0][0] < now and len(due) < limit:
+                    due.append(heapq.heappop(heap)[2])
+            if len(due) >= limit:
+                # Resume from the next shard so no shard is starved
+                self._next_sweep_shard = (start + offset + 1) % len(self.shards)
+                break
+
+        return sum(1 for key in due if self._remove_expired(key))
+
+    def __len__(self) -> int:
+        return sum(len(shard.entries) for shard in self.shards)
+
+    @property
+    def hits(self) -> int:
+        return sum(shard.hits for shard in self.shards)
+
+    @property
+    def misses(self) -> int:
+        return sum(shard.misses for shard in self.shards)
+
+    def estimate_bytes(self, sample_size: int = 64) -> int:
+        """Approximate memory held by cached values, from the JSON size of a sample"""
+        per_shard = max(1, sample_size // len(self.shards))
+        sample = []
+        size = 0
+        for shard in self.shards:
+            with shard.lock:
+                size += len(shard.entries)
+                for entry, _ in zip(shard.entries.values(), range(per_shard)):
+                    sample.append(entry[0])
+        if not sample:
+            return 0
+        sampled_bytes = sum(
+            value.nbytes if hasattr(value, 'nbytes') else len(json.dumps(value, separators=(',', ':'), default=str))
+            for value in sample
+        )
+        return sampled_bytes * size // len(sample)
+
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        size = hits = misses = evictions = charged = 0
+        tags: Set[str] = set()
+        for shard in self.shards:
+            with shard.lock:
+                size += len(shard.entries)
+                charged += shard.nbytes
+                hits += shard.hits
+                misses += shard.misses
+                evictions += shard.evictions
+                tags.update(shard.tag_index)
+        total_requests = hits + misses
+        hit_rate = (hits / total_requests * 100) if total_requests > 0 else 0
+
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "charged_bytes": charged,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "memory_bytes": self.estimate_bytes(),
+            "hit_rate": f"{hit_rate:.1f}%",
+            "tags": len(tags),
+            "expiry_queue": sum(len(shard.expiry_heap) for shard in self.shards),
+            "default_ttl_hours": (self.default_ttl / 3600) if self.default_ttl else "Never expires"
+        }
+
+class CacheConnectionError(Exception):
+    """Raised when the remote cache server cannot be reached"""
+
+def _encode_command(*parts: Union[str, bytes, int]) -> bytes:
+    """Encode a command in the Redis serialization protocol (RESP)"""
+    encoded = [b'*%d\r\n' % len(parts)]
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif isinstance(part, int):
+            part = str(part).encode('ascii')
+        encoded.append(b'$%d\r\n%s\r\n' % (len(part), part))
+    return b''.join(encoded)
+
+class _Connection:
+    """Single RESP connection with a buffered reader"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, payload: bytes) -> None:
+        self.sock.sendall(payload)
+
+    def read_reply(self) -> Any:
+        """Read and decode one RESP reply"""
+        line = self.reader.readline()
+        if not line:
+            raise CacheConnectionError("Connection closed by cache server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('utf-8')
+        if kind == b'-':
+            raise CacheConnectionError(body.decode('utf-8'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(body)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise CacheConnectionError(f"Unexpected reply from cache server: {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+class _ConnectionPool:
+    """Thread-safe pool of RESP connections"""
+
+    def __init__(self, host: str, port: int, max_connections: int = 16, timeout: float = 1.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(max_connections)
+
+    def execute(self, commands: List[tuple]) -> List[Any]:
+        """Send commands as one pipelined write and read back every reply"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise CacheConnectionError("Cache connection pool exhausted")
+        connection = None
+        try:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = _Connection(self.host, self.port, self.timeout)
+            connection.send(b''.join(_encode_command(*command) for command in commands))
+            replies = [connection.read_reply() for _ in commands]
+            self.idle.put(connection)
+            return replies
+        except (OSError, CacheConnectionError) as e:
+            if connection is not None:
+                connection.close()
+            raise CacheConnectionError(str(e)) from e
+        finally:
+            self.slots.release()
+
+class RemoteCache(CacheBackend):
+    """
+    Networked cache backend speaking the Redis protocol, shared by all replicas.
+    A small in-process near cache sits in front of the server to absorb hot keys.
+    Tags are kept as server-side sets of keys, so every replica sees them.
+    Server errors degrade to cache misses rather than failing requests.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        namespace: str,
+        default_ttl: Optional[int] = None,
+        near_cache_size: int = 1000,
+        near_cache_ttl: Optional[int] = 60,
+        max_connections: int = 16
+    ):
+        """
+        Initialize remote cache
+
+        Args:
+            url: Server URL, e.g. redis://localhost:6379
+            namespace: Key prefix separating this cache from others on the server
+            default_ttl: Default time-to-live in seconds (None = never expire)
+            near_cache_size: Maximum number of items held in the local near cache
+            near_cache_ttl: Near cache TTL in seconds, bounding staleness after a remote clear
+            max_connections: Maximum number of pooled connections
+        """
+        parsed = urlsplit(url)
+        self.url = url
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.pool = _ConnectionPool(parsed.hostname or 'localhost', parsed.port or 6379, max_connections)
+        self.near_cache = InMemoryCache(default_ttl=near_cache_ttl, max_size=near_cache_size)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.stats_lock = threading.Lock()
+
+    def _key(self, key: CacheKey) -> str:
+        return f"{self.namespace}:{serialize_key(key)}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    def _set_command(self, key: CacheKey, value: Any, ttl: Optional[int]) -> tuple:
+        ttl = ttl if ttl is not None else self.default_ttl
+        payload = json.dumps(value, separators=(',', ':'))
+        if ttl:
+            return ('SET', self._key(key), payload, 'EX', int(ttl))
+        return ('SET', self._key(key), payload)
+
+    def _execute(self, commands: List[tuple]) -> Optional[List[Any]]:
+        """Run pipelined commands, returning None if the server is unavailable"""
+        try:
+            return self.pool.execute(commands)
+        except CacheConnectionError:
+            with self.stats_lock:
+                self.errors += 1
+            return None
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Get value from the near cache, falling back to the server"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[CacheKey]) -> Dict[CacheKey, Any]:
+        """Get several values with a single MGET round trip for near-cache misses"""
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.near_cache.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+
+        if remote_keys:
+            replies = self._execute([('MGET', *[self._key(key) for key in remote_keys])])
+            values = replies[0] if replies else [None] * len(remote_keys)
+            for key, payload in zip(remote_keys, values):
+                if payload is not None:
+                    value = json.loads(payload)
+                    self.near_cache.set(key, value)
+                    found[key] = value
+
+        with self.stats_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get_stale(self, key: CacheKey) -> Tuple[Optional[Any], bool]:
+        """Stale values are only held by the near cache; the server drops entries at their TTL"""
+        value, is_stale = self.near_cache.get_stale(key)
+        if value is not None and is_stale:
+            with self.stats_lock:
+                self.hits += 1
+            return value, True
+        return self.get(key), False
+
+    def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        stale_ttl: Optional[int] = None
+    ) -> None:
+        """Set value on the server and in the near cache"""
+        self.set_many({key: value}, ttl, tags, stale_ttl)
+
+    def set_many(
+        self,
+        items: Dict[CacheKey, Any],
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        stale_ttl: Optional[int] = None
+    ) -> None:
+        """Set several values (and their tag memberships) in one pipelined round trip"""
+        tags = tuple(tags)
+        near_ttl = ttl if ttl is not None else self.default_ttl
+        for key, value in items.items():
+            if stale_ttl:
+                # Near cache keeps the caller's TTL so the stale window starts when the server copy expires
+                self.near_cache.set(key, value, near_ttl, tags, stale_ttl)
+            else:
+                self.near_cache.set(key, value, tags=tags)
+        commands = [self._set_command(key, value, ttl) for key, value in items.items()]
+        if items:
+            server_keys = [self._key(key) for key in items]
+            commands.extend(('SADD', self._tag_key(tag), *server_keys) for tag in tags)
+        self._execute(commands)
+
+    def _scan(self, match: str) -> List[bytes]:
+        """Collect server keys matching a glob pattern"""
+        keys = []
+        cursor = b'0'
+        while True:
+            replies = self._execute([('SCAN', cursor, 'MATCH', match, 'COUNT', 1000)])
+            if not replies:
+                return keys
+            cursor, batch = replies[0]
+            keys.extend(batch)
+            if cursor == b'0':
+                return keys
+
+    def clear(self, pattern: Optional[str] = None) -> int:
+        """Clear entries in this namespace matching pattern or all if pattern is None"""
+        self.near_cache.clear(pattern)
+        match = self._key('*') if pattern is None else self._key(f"*{pattern}*")
+        keys = self._scan(match)
+        for start in range(0, len(keys), 1000):
+            self._execute([('DEL', *keys[start:start + 1000])])
+        return len(keys)
+
+    def invalidate(self, *tags: str) -> int:
+        """
+        Clear entries carrying every given tag, using SINTER over the tag sets.
+        Deleted keys may linger in other tags' sets; deleting them again later is harmless.
+        """
+        if not tags:
+            return 0
+        self.near_cache.invalidate(*tags)
+        replies = self._execute([('SINTER', *[self._tag_key(tag) for tag in tags])])
+        keys = replies[0] if replies else []
+        if keys:
+            # Near cache copies read back from the server carry no tags
+            deleted = set(keys)
+            self.near_cache.remove_where(lambda key: self._key(key).encode('utf-8') in deleted)
+        commands = [('DEL', *keys[start:start + 1000]) for start in range(0, len(keys), 1000)]
+        commands.extend(('SREM', self._tag_key(tag), *keys) for tag in tags if keys)
+        if commands:
+            self._execute(commands)
+        return len(keys)
+
+    def sweep(self, limit: int = 1000) -> int:
+        """Reclaim expired near cache entries (the server expires its own keys)"""
+        return self.near_cache.sweep(limit)
 
     def get_stats(self) -> dict:
         """Get cache statistics"""
         total_requests = self.hits + self.misses
         hit_rate = (self.hits / total_requests * 100) if total_requests > 0 else 0
+        near_stats = self.near_cache.get_stats()
 
         return {
-            "size": len(self.cache),
-            "max_size": self.max_size,
+            "backend": "remote",
+            "url": self.url,
+            # Counting server keys would take full keyspace scans; report the near cache only
+            "size": near_stats["size"],
             "hits": self.hits,
             "misses": self.misses,
+            "evictions": near_stats["evictions"],
+            "memory_bytes": near_stats["memory_bytes"],
+            "errors": self.errors,
             "hit_rate": f"{hit_rate:.1f}%",
             "default_ttl_hours": (self.default_ttl / 3600) if self.default_ttl else "Never expires"
         }
 
+class DiskStore:
+    """
+    Persistent key/value store in an embedded SQLite database.
+    Entries are tied to a dataset fingerprint; opening the store with a
+    different fingerprint discards everything written for the old data.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize disk store (inactive until open() is called)
+
+        Args:
+            path: Location of the SQLite database file
+        """
+        self.path = path
+        self.fingerprint: Optional[str] = None
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (SQLite connections are not shared across threads)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction on this thread's connection, rolled back if anything in it fails"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    def open(self, fingerprint: str) -> None:
+        """Activate the store for a dataset, invalidating entries from any other dataset"""
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT, key TEXT, value BLOB, expiry REAL, PRIMARY KEY (namespace, key))"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS tags ("
+            "namespace TEXT, tag TEXT, key TEXT, PRIMARY KEY (namespace, tag, key))"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS tags_by_key ON tags (namespace, key)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entries_by_expiry ON entries (namespace, expiry)")
+        row = connection.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            with self._transaction() as connection:
+                connection.execute("DELETE FROM entries")
+                connection.execute("DELETE FROM tags")
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self.fingerprint = fingerprint
+
+    @property
+    def active(self) -> bool:
+        return self.fingerprint is not None
+
+    def get(self, namespace: str, key: CacheKey) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, expiry FROM entries WHERE namespace = ? AND key = ?", (namespace, serialize_key(key))
+        ).fetchone()
+        if row is None:
+            return None
+        value, expiry = row
+        if expiry is not None and time.time() > expiry:
+            return None
+        return json.loads(zlib.decompress(value))
+
+    def tags(self, namespace: str, key: CacheKey) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT tag FROM tags WHERE namespace = ? AND key = ?", (namespace, serialize_key(key))
+        ).fetchall()
+        return [tag for (tag,) in rows]
+
+    def set(self, namespace: str, key: CacheKey, value: Any, expiry: Optional[float], tags: Iterable[str] = ()) -> None:
+        payload = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 1)
+        stored_key = serialize_key(key)
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (namespace, stored_key, payload, expiry)
+            )
+            connection.execute("DELETE FROM tags WHERE namespace = ? AND key = ?", (namespace, stored_key))
+            connection.executemany(
+                "INSERT OR IGNORE INTO tags VALUES (?, ?, ?)", [(namespace, tag, stored_key) for tag in tags]
+            )
+
+    def clear(self, namespace: str, pattern: Optional[str] = None) -> int:
+        with self._transaction() as connection:
+            if pattern is None:
+                cursor = connection.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+                connection.execute("DELETE FROM tags WHERE namespace = ?", (namespace,))
+            else:
+                cursor = connection.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND instr(key, ?) > 0", (namespace, pattern)
+                )
+                connection.execute("DELETE FROM tags WHERE namespace = ? AND instr(key, ?) > 0", (namespace, pattern))
+        return cursor.rowcount
+
+    def invalidate(self, namespace: str, tags: List[str]) -> int:
+        """Delete entries carrying every given tag, found through the tags table"""
+        tagged = " INTERSECT ".join(["SELECT key FROM tags WHERE namespace = ? AND tag = ?"] * len(tags))
+        with self._transaction() as connection:
+            keys = [(namespace, key) for (key,) in connection.execute(
+                tagged, [value for tag in tags for value in (namespace, tag)]
+            ).fetchall()]
+            connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", keys)
+            connection.executemany("DELETE FROM tags WHERE namespace = ? AND key = ?", keys)
+        return len(keys)
+
+    def sweep(self, namespace: str, limit: int = 1000) -> int:
+        """Delete up to limit expired entries, oldest expiry first"""
+        with self._transaction() as connection:
+            keys = [(namespace, key) for (key,) in connection.execute(
+                "SELECT key FROM entries WHERE namespace = ? AND expiry < ? ORDER BY expiry LIMIT ?",
+                (namespace, time.time(), limit)
+            ).fetchall()]
+            connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", keys)
+            connection.executemany("DELETE FROM tags WHERE namespace = ? AND key = ?", keys)
+        return len(keys)
+
+    def count(self, namespace: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)
+        ).fetchone()[0]
+
+class TieredCache(CacheBackend):
+    """Fast front cache backed by a persistent disk tier that survives restarts"""
+
+    def __init__(self, front: CacheBackend, disk: DiskStore, namespace: str, default_ttl: Optional[int] = None):
+        """
+        Initialize tiered cache
+
+        Args:
+            front: In-memory or remote cache consulted first
+            disk: Shared disk store holding the second tier
+            namespace: Name separating this cache's entries in the disk store
+            default_ttl: Default time-to-live in seconds (None = never expire)
+        """
+        self.front = front
+        self.disk = disk
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.disk_hits = 0
+        self.stats_lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Get value from the front cache, promoting disk hits into it"""
+        value = self.front.get(key)
+        if value is not None or not self.disk.active:
+            return value
+        return self._promote(key)
+
+    def _promote(self, key: CacheKey) -> Optional[Any]:
+        """Read a front cache miss from disk, copying a hit into the front cache"""
+        value = self.disk.get(self.namespace, key)
+        if value is not None:
+            with self.stats_lock:
+                self.disk_hits += 1
+            self.front.set(key, value, tags=self.disk.tags(self.namespace, key))
+        return value
+
+    def get_stale(self, key: CacheKey) -> Tuple[Optional[Any], bool]:
+        """Stale values come from the front cache only; the disk tier holds fresh values"""
+        value, is_stale = self.front.get_stale(key)
+        if value is not None or not self.disk.active:
+            return value, is_stale
+        return self._promote(key), False
+
+    def set(
+        self,
+        key: CacheKey,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = (),
+        stale_ttl: Optional[int] = None
+    ) -> None:
+        """Write through to both tiers"""
+        tags = tuple(tags)
+        self.front.set(key, value, ttl, tags, stale_ttl)
+        if self.disk.active:
+            ttl = ttl if ttl is not None else self.default_ttl
+            self.disk.set(self.namespace, key, value, (time.time() + ttl) if ttl else None, tags)
+
+    def clear(self, pattern: Optional[str] = None) -> int:
+        """Clear entries matching pattern from both tiers"""
+        cleared = self.front.clear(pattern)
+        if self.disk.active:
+            cleared = max(cleared, self.disk.clear(self.namespace, pattern))
+        return cleared
+
+    def invalidate(self, *tags: str) -> int:
+        """Clear entries carrying every given tag from both tiers"""
+        if not tags:
+            return 0
+        cleared = self.front.invalidate(*tags)
+        if self.disk.active:
+            cleared = max(cleared, self.disk.invalidate(self.namespace, list(tags)))
+        return cleared
+
+    def sweep(self, limit: int = 1000) -> int:
+        """Reclaim expired entries from both tiers"""
+        swept = self.front.sweep(limit)
+        if self.disk.active:
+            swept += self.disk.sweep(self.namespace, limit)
+        return swept
+
+    def get_stats(self) -> dict:
+        """Get front cache statistics plus disk tier usage"""
+        stats = self.front.get_stats()
+        stats["disk_size"] = self.disk.count(self.namespace) if self.disk.active else "inactive"
+        stats["disk_hits"] = self.disk_hits
+        return stats
+
+# Optional shared cache server (Redis protocol); unset = process-local caches
+CACHE_URL = os.getenv('FHIR_CACHE_URL')
+
+# Optional persistent disk tier; activated at startup with the dataset fingerprint
+DISK_CACHE_PATH = os.getenv('FHIR_DISK_CACHE')
+disk_store = DiskStore(DISK_CACHE_PATH) if DISK_CACHE_PATH else None
+
+def create_cache(namespace: str, default_ttl: Optional[int] = None, max_size: int = 1000) -> CacheBackend:
+    """Create the configured cache backend for a named cache"""
+    if CACHE_URL:
+        front = RemoteCache(CACHE_URL, namespace, default_ttl=default_ttl, near_cache_size=min(max_size, 1000))
+    else:
+        front = InMemoryCache(default_ttl=default_ttl, max_size=max_size)
+    if disk_store is not None:
+        return TieredCache(front, disk_store, namespace, default_ttl=default_ttl)
+    return front
+
+def open_disk_cache(fingerprint: str) -> bool:
+    """Activate the disk tier for the current dataset; returns False if not configured"""
+    if disk_store is None:
+        return False
+    disk_store.open(fingerprint)
+    return True
+
+class ExpirySweeper:
+    """
+    Background thread that reclaims expired entries from caches in bounded slices,
+    so entries set with a TTL don't hold memory (and max_size slots) until read again.
+    """
+
+    def __init__(self, caches: List[CacheBackend], interval: float = 30.0, slice_size: int = 1000):
+        """
+        Initialize sweeper
+
+        Args:
+            caches: Caches to sweep
+            interval: Seconds between sweeps
+            slice_size: Maximum entries reclaimed per cache per slice
+        """
+        self.caches = caches
+        self.interval = interval
+        self.slice_size = slice_size
+        self.swept = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sweeping in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-expiry-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sweeper thread and wait for the current slice to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sweep_once(self) -> int:
+        """Sweep every cache until no full slice of expired entries remains"""
+        swept = 0
+        for cache in self.caches:
+            while not self._stop.is_set():
+                try:
+                    removed = cache.sweep(self.slice_size)
+                except (sqlite3.Error, CacheConnectionError) as e:
+                    print(f"Cache expiry sweep failed: {e}")
+                    break
+                swept += removed
+                if removed < self.slice_size:
+                    break
+                # Let request threads in between slices
+                time.sleep(0)
+        self.swept += swept
+        return swept
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sweep_once()
+
 # FHIR-compliant caching strategy
 # Individual resource caching by resource type and ID
-patient_cache = InMemoryCache(default_ttl=None, max_size=10000)     # Cache individual Patient resources by ID
-resource_cache = InMemoryCache(default_ttl=None, max_size=50000)    # Cache all FHIR resources by type/ID
-bundle_cache = InMemoryCache(default_ttl=None, max_size=5000)       # Cache search results by query parameters
+patient_cache = create_cache("patient", default_ttl=None, max_size=10000)     # Cache individual Patient resources by ID
+resource_cache = create_cache("resource", default_ttl=None, max_size=50000)   # Cache all FHIR resources by type/ID
+bundle_cache = create_cache("bundle", default_ttl=None, max_size=5000)        # Cache search results by query parameters
+# Serialized response bodies and their compressed variants; bytes, so always process-local
+body_cache = InMemoryCache(
+    default_ttl=None,
+    max_size=int(os.getenv('FHIR_BODY_CACHE_SIZE', '1000')),
+    max_bytes=int(os.getenv('FHIR_BODY_CACHE_BYTES', str(128 * 1024 * 1024))),
+    sizeof=lambda body: body.max_nbytes
+)
+validator_cache = create_cache("validator", default_ttl=None, max_size=100000)  # ETag/Last-Modified of cached bodies
+
+# Background reclaim of expired entries (started with the app)
+SWEEP_INTERVAL = float(os.getenv('FHIR_CACHE_SWEEP_INTERVAL', '30'))
+expiry_sweeper = ExpirySweeper([patient_cache, resource_cache, bundle_cache, body_cache, validator_cache], interval=SWEEP_INTERVAL)
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls with the same key across threads.
+    The first caller computes the result; callers arriving while it runs
+    wait on the same future instead of repeating the work.
+    """
 
-def generate_cache_key(*args, **kwargs) -> str:
-    """Generate cache key from function arguments"""
-    key_parts = [str(arg) for arg in args]
-    key_parts.extend([f"{k}={v}" for k, v in sorted(kwargs.items())])
-    key_string = ":".join(key_parts)
-    return hashlib.md5(key_string.encode()).hexdigest()
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[CacheKey, Future] = {}
+        self.deduplicated = 0
 
-def cache_result(cache: InMemoryCache, ttl: Optional[int] = None):
+    def do(self, key: CacheKey, func: Callable, *args, **kwargs) -> Any:
+        """Call func, or wait for the in-flight call with the same key"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+class AsyncSingleFlight:
+    """Deduplicate concurrent awaits with the same key on one event loop"""
+
+    def __init__(self):
+        self._calls: Dict[CacheKey, asyncio.Future] = {}
+        self.deduplicated = 0
+
+    async def do(self, key: CacheKey, func: Callable, *args, **kwargs) -> Any:
+        """Await func, or the in-flight call with the same key"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            # Shield so one waiter being cancelled doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+class QueryLog:
+    """
+    Hit counts for normalized query keys, persisted as JSON so the most
+    popular queries can be replayed to warm caches after a restart.
+    Every worker process merges its own new counts into the shared file.
+    """
+
+    def __init__(self, path: str, flush_every: int = 500):
+        """
+        Initialize query log, loading any counts recorded by earlier runs
+
+        Args:
+            path: Location of the JSON log file
+            flush_every: Write the log to disk (in a background thread) after this many new records
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.counts: Dict[str, int] = self._read()
+        self.unflushed: Dict[str, int] = {}
+        self.pending = 0
+        self.flushing = False
+        self.lock = threading.Lock()
+
+    def _read(self) -> Dict[str, int]:
+        try:
+            with open(self.path, 'r') as f:
+                return {str(k): int(v) for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, key: str) -> None:
+        """Count one occurrence of a query key; never blocks on disk"""
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.unflushed[key] = self.unflushed.get(key, 0) + 1
+            self.pending += 1
+            should_flush = self.pending >= self.flush_every and not self.flushing
+            if should_flush:
+                self.flushing = True
+        if should_flush:
+            threading.Thread(target=self._background_flush, name="query-log-flush", daemon=True).start()
+
+    def _background_flush(self) -> None:
+        try:
+            self.flush()
+        finally:
+            with self.lock:
+                self.flushing = False
+
+    def top(self, n: int) -> List[str]:
+        """Most frequent query keys, most popular first"""
+        with self.lock:
+            ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return [key for key, _ in ranked[:n]]
+
+    def flush(self) -> None:
+        """
+        Merge the counts recorded since the last flush into the file, under a
+        cross-process lock, and write it atomically. On failure the counts are
+        kept for the next flush.
+        """
+        with self.lock:
+            delta, self.unflushed = self.unflushed, {}
+            self.pending = 0
+        if not delta:
+            return
+        tmp_path = f"{self.path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(f"{self.path}.lock", 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    merged = self._read()
+                    for key, count in delta.items():
+                        merged[key] = merged.get(key, 0) + count
+                    with open(tmp_path, 'w') as f:
+                        json.dump(merged, f)
+                    os.replace(tmp_path, self.path)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError as e:
+            print(f"WARNING: Could not write query log {self.path}: {e}")
+            with self.lock:
+                for key, count in delta.items():
+                    self.unflushed[key] = self.unflushed.get(key, 0) + count
+            return
+        with self.lock:
+            # Counts from other workers, plus whatever this one recorded meanwhile
+            for key, count in self.unflushed.items():
+                merged[key] = merged.get(key, 0) + count
+            self.counts = merged
+
+# Shared in-flight registries for cache misses (keys are namespaced by cache)
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+# Background refreshes of stale entries (stale-while-revalidate)
+_revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-revalidate")
+_revalidating: Set[CacheKey] = set()
+_revalidating_lock = threading.Lock()
+_revalidate_tasks: Set[asyncio.Task] = set()
+
+def _start_revalidation(key: CacheKey) -> bool:
+    """Claim the refresh of a stale key; False if one is already running"""
+    with _revalidating_lock:
+        if key in _revalidating:
+            return False
+        _revalidating.add(key)
+        return True
+
+def _finish_revalidation(key: CacheKey) -> None:
+    with _revalidating_lock:
+        _revalidating.discard(key)
+
+def revalidate(key: CacheKey, compute: Callable, *args, **kwargs) -> None:
+    """Refresh a stale entry in the background worker pool, at most once at a time per key"""
+    if not _start_revalidation(key):
+        return
+
+    def run():
+        try:
+            single_flight.do(key, compute, *args, **kwargs)
+        except Exception as e:
+            # The stale value keeps being served; the next stale read retries
+            print(f"Cache revalidation failed for {key!r}: {e}")
+        finally:
+            _finish_revalidation(key)
+
+    _revalidate_executor.submit(run)
+
+def revalidate_async(key: CacheKey, compute: Callable, *args, **kwargs) -> None:
+    """Refresh a stale entry in a background task on the running loop, at most once at a time per key"""
+    if not _start_revalidation(key):
+        return
+
+    async def run():
+        try:
+            await async_single_flight.do(key, compute, *args, **kwargs)
+        except Exception as e:
+            print(f"Cache revalidation failed for {key!r}: {e}")
+        finally:
+            _finish_revalidation(key)
+
+    # Keep a reference so the task isn't garbage collected mid-flight
+    task = asyncio.get_running_loop().create_task(run())
+    _revalidate_tasks.add(task)
+    task.add_done_callback(_revalidate_tasks.discard)
+
+def generate_cache_key(*args, **kwargs) -> tuple:
+    """
+    Generate cache key from function arguments.
+    Returns a tuple of hashable parts with strings interned; no hashing is
+    done here (see serialize_key for keys leaving the process).
+    """
+    parts = [_key_part(arg) for arg in args]
+    parts.extend((intern(k), _key_part(v)) for k, v in sorted(kwargs.items()))
+    return tuple(parts)
+
+def _key_part(value: Any) -> Any:
+    """Make one argument usable as part of a cache key"""
+    if isinstance(value, str):
+        return intern(value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+def type_tag(resource_type: str) -> str:
+    """Invalidation tag for entries derived from one resource type"""
+    return f"type:{resource_type}"
+
+def patient_tag(patient_id: str) -> str:
+    """Invalidation tag for entries scoped to one patient"""
+    return f"patient:{patient_id}"
+
+def function_tag(name: str) -> str:
+    """Invalidation tag for results cached by a decorated function"""
+    return f"function:{name}"
+
+def cache_result(cache: CacheBackend, ttl: Optional[int] = None, stale_ttl: Optional[int] = None):
     """
     Decorator to cache function results
 
     Args:
         cache: The cache instance to use
         ttl: Time-to-live in seconds (uses cache default if None)
+        stale_ttl: Seconds past expiry during which the stale result is returned
+            while a background call refreshes it (None = no stale serving)
     """
     def decorator(func: Callable) -> Callable:
+        name = intern(func.__name__)
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Generate cache key from function name and arguments
-            cache_key = f"{func.__name__}:{generate_cache_key(*args, **kwargs)}"
+            cache_key = (name, *generate_cache_key(*args, **kwargs))
 
             # Try to get from cache
-            cached_value = cache.get(cache_key)
+            cached_value, is_stale = cache.get_stale(cache_key)
             if cached_value is not None:
+                if is_stale:
+                    revalidate(cache_key, compute, cache_key, *args, **kwargs)
                 return cached_value
 
-            # Call function and cache result
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, ttl)
+            # Call function and cache result (concurrent misses share one call)
+            return single_flight.do(cache_key, compute, cache_key, *args, **kwargs)
 
+        def compute(cache_key: tuple, *args, **kwargs):
+            result = func(*args, **kwargs)
+            cache.set(cache_key, result, ttl, tags=(function_tag(name),), stale_ttl=stale_ttl)
             return result
 
         # Add cache control methods to the wrapper
-        wrapper.cache_clear = lambda: cache.clear(func.__name__)
+        wrapper.cache_clear = lambda: cache.invalidate(function_tag(name))
         wrapper.cache_stats = lambda: cache.get_stats()
 
         return wrapper
     return decorator
 
-def cache_async_result(cache: InMemoryCache, ttl: Optional[int] = None):
+def cache_async_result(cache: CacheBackend, ttl: Optional[int] = None, stale_ttl: Optional[int] = None):
     """
     Decorator to cache async function results
 
     Args:
         cache: The cache instance to use
         ttl: Time-to-live in seconds (uses cache default if None)
+        stale_ttl: Seconds past expiry during which the stale result is returned
+            while a background task refreshes it (None = no stale serving)
     """
     def decorator(func: Callable) -> Callable:
+        name = intern(func.__name__)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             # Generate cache key from function name and arguments
-            cache_key = f"{func.__name__}:{generate_cache_key(*args, **kwargs)}"
+            cache_key = (name, *generate_cache_key(*args, **kwargs))
 
             # Try to get from cache
-            cached_value = cache.get(cache_key)
+            cached_value, is_stale = cache.get_stale(cache_key)
             if cached_value is not None:
+                if is_stale:
+                    revalidate_async(cache_key, compute, cache_key, *args, **kwargs)
                 return cached_value
 
-            # Call function and cache result
-            result = await func(*args, **kwargs)
-            cache.set(cache_key, result, ttl)
+            # Call function and cache result (concurrent misses share one call)
+            return await async_single_flight.do(cache_key, compute, cache_key, *args, **kwargs)
 
+        async def compute(cache_key: str, *args, **kwargs):
+            result = await func(*args, **kwargs)
+            cache.set(cache_key, result, ttl, tags=(function_tag(name),), stale_ttl=stale_ttl)
             return result
 
         # Add cache control methods to the wrapper
-        wrapper.cache_clear = lambda: cache.clear(func.__name__)
+        wrapper.cache_clear = lambda: cache.invalidate(function_tag(name))
         wrapper.cache_stats = lambda: cache.get_stats()
 
         return wrapper
     return decorator
 
 # Convenience decorators for common use cases
-def cache_patient_data(ttl: Optional[int] = None):
+def cache_patient_data(ttl: Optional[int] = None, stale_ttl: Optional[int] = None):
     """Cache patient-related data (never expires by default)"""
-    return cache_async_result(patient_cache, ttl)
+    return cache_async_result(patient_cache, ttl, stale_ttl)
 
-def cache_fhir_resource(ttl: Optional[int] = None):
+def cache_fhir_resource(ttl: Optional[int] = None, stale_ttl: Optional[int] = None):
     """Cache FHIR resources (never expires by default)"""
-    return cache_result(resource_cache, ttl)
+    return cache_result(resource_cache, ttl, stale_ttl)
 
-def cache_fhir_bundle(ttl: Optional[int] = None):
+def cache_fhir_bundle(ttl: Optional[int] = None, stale_ttl: Optional[int] = None):
     """Cache FHIR bundle responses (never expires by default)"""
-    return cache_result(bundle_cache, ttl)
+    return cache_result(bundle_cache, ttl, stale_ttl)
 
 def get_cache_statistics() -> dict:
     """Get statistics for all caches"""
@@ -183,6 +1383,9 @@ def get_cache_statistics() -> dict:
         "patient_cache": patient_cache.get_stats(),
         "resource_cache": resource_cache.get_stats(),
         "bundle_cache": bundle_cache.get_stats(),
+        "body_cache": body_cache.get_stats(),
+        "validator_cache": validator_cache.get_stats(),
+        "expired_swept": expiry_sweeper.swept,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -192,5 +1395,19 @@ def clear_all_caches() -> dict:
         "patient_cache_cleared": patient_cache.clear(),
         "resource_cache_cleared": resource_cache.clear(),
         "bundle_cache_cleared": bundle_cache.clear(),
+        "body_cache_cleared": body_cache.clear(),
+        "validator_cache_cleared": validator_cache.clear(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+def invalidate_caches(*tags: str) -> dict:
+    """Clear entries carrying every given tag from all cache instances"""
+    return {
+        "tags": list(tags),
+        "patient_cache_cleared": patient_cache.invalidate(*tags),
+        "resource_cache_cleared": resource_cache.invalidate(*tags),
+        "bundle_cache_cleared": bundle_cache.invalidate(*tags),
+        "body_cache_cleared": body_cache.invalidate(*tags),
+        "validator_cache_cleared": validator_cache.invalidate(*tags),
         "timestamp": datetime.now().isoformat()
     }
\ No newline at end of file
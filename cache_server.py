@@ -0,0 +1,155 @@
+"""
+Local stand-in for the shared cache server
+Speaks the subset of the Redis protocol used by RemoteCache, for development,
+testing and single-box deployments without an external cache service
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+class CacheStore:
+    """Thread-safe key/value store with optional per-key expiry, plus set values"""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.sets: Dict[bytes, Set[bytes]] = {}
+        self.lock = threading.Lock()
+
+    def _live_value(self, key: bytes) -> Optional[bytes]:
+        """Get a value, dropping it if expired (caller holds the lock)"""
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expiry = entry
+        if expiry is not None and time.time() > expiry:
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, command: List[bytes]) -> object:
+        """Execute one command and return its reply value"""
+        name = command[0].upper()
+        args = command[1:]
+        with self.lock:
+            if name == b'PING':
+                return 'PONG'
+            if name == b'GET':
+                return self._live_value(args[0])
+            if name == b'MGET':
+                return [self._live_value(key) for key in args]
+            if name == b'SET':
+                expiry = None
+                if len(args) >= 4 and args[2].upper() == b'EX':
+                    expiry = time.time() + int(args[3])
+                self.data[args[0]] = (args[1], expiry)
+                return 'OK'
+            if name == b'DEL':
+                deleted = 0
+                for key in args:
+                    if self.data.pop(key, None) is not None or self.sets.pop(key, None) is not None:
+                        deleted += 1
+                return deleted
+            if name == b'SADD':
+                members = self.sets.setdefault(args[0], set())
+                added = len(set(args[1:]) - members)
+                members.update(args[1:])
+                return added
+            if name == b'SREM':
+                members = self.sets.get(args[0], set())
+                removed = len(members & set(args[1:]))
+                members.difference_update(args[1:])
+                if not members:
+                    self.sets.pop(args[0], None)
+                return removed
+            if name == b'SMEMBERS':
+                return list(self.sets.get(args[0], ()))
+            if name == b'SINTER':
+                sets = sorted((self.sets.get(key, set()) for key in args), key=len)
+                return list(sets[0].intersection(*sets[1:]))
+            if name == b'SCAN':
+                # Single-pass scan: every match is returned with a final cursor of 0
+                pattern = '*'
+                if b'MATCH' in [arg.upper() for arg in args]:
+                    pattern = args[[arg.upper() for arg in args].index(b'MATCH') + 1].decode('utf-8')
+                live = [key for key in list(self.data) if self._live_value(key) is not None] + list(self.sets)
+                keys = [key for key in live if fnmatch.fnmatchcase(key.decode('utf-8'), pattern)]
+                return [b'0', keys]
+            if name == b'DBSIZE':
+                return len(self.data) + len(self.sets)
+            if name == b'FLUSHDB':
+                self.data.clear()
+                self.sets.clear()
+                return 'OK'
+        return Exception(f"ERR unknown command '{name.decode('utf-8', 'replace')}'")
+
+def _encode_reply(value: object) -> bytes:
+    """Encode a reply value in RESP"""
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, Exception):
+        return b'-%s\r\n' % str(value).encode('utf-8')
+    if isinstance(value, str):
+        return b'+%s\r\n' % value.encode('utf-8')
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(_encode_reply(item) for item in value)
+
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    """Handle pipelined RESP commands on one client connection"""
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command (e.g. from telnet)
+            return line.split()
+        parts = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def handle(self):
+        while True:
+            command = self._read_command()
+            if not command:
+                return
+            self.wfile.write(_encode_reply(self.server.store.execute(command)))
+
+class LocalCacheServer(socketserver.ThreadingTCPServer):
+    """Threaded cache server; use start() to run it in the background"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379):
+        super().__init__((host, port), _CacheRequestHandler)
+        self.store = CacheStore()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}"
+
+    def start(self) -> threading.Thread:
+        """Serve in a daemon thread and return it"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in cache server for FHIR_CACHE_URL")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+
+    server = LocalCacheServer(args.host, args.port)
+    print(f"Cache server listening on {server.url}")
+    server.serve_forever()
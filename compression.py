@@ -0,0 +1,228 @@
+"""
+Response compression for the FHIR API
+Negotiates gzip or brotli from Accept-Encoding. Cached bodies keep each
+compressed variant next to the raw bytes, so it is produced once per entry;
+everything else is compressed as it is sent by CompressionMiddleware.
+"""
+
+import gzip
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+import anyio
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+# Server preference when a client accepts several encodings equally
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Cached variants are compressed once, so they can afford a higher level than streamed responses
+CACHED_LEVELS = {'gzip': 9, 'br': 8}
+STREAM_LEVELS = {'gzip': 6, 'br': 4}
+
+# Bodies smaller than this are sent uncompressed
+MINIMUM_SIZE = 1024
+
+# Whole bodies larger than this are compressed in a worker thread, off the event loop
+THREAD_SIZE = 256 * 1024
+
+_COMPRESSIBLE_TYPES = (
+    'application/json', 'application/fhir+json', 'application/fhir+ndjson', 'application/x-ndjson', 'text/', 'application/xml'
+)
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content coding for a response from an Accept-Encoding header:
+    the supported coding with the highest q-value (server preference breaks
+    ties, and '*' stands for any coding not listed). None means identity.
+    """
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        weight = weights.get(coding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a whole body (gzip output is reproducible: no timestamp)"""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level or CACHED_LEVELS['gzip'], mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level or CACHED_LEVELS['br'])
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+class StreamCompressor:
+    """Incremental compressor; every chunk is flushed so clients can decode as data arrives"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(STREAM_LEVELS['gzip'], zlib.DEFLATED, 31)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=STREAM_LEVELS['br'])
+        else:
+            raise ValueError(f"Unsupported content coding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'gzip':
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        if self.encoding == 'gzip':
+            return self._compressor.flush(zlib.Z_FINISH)
+        return self._compressor.finish()
+
+class EncodedBody:
+    """
+    A serialized response body with its validators and compressed variants.
+    Variants are added on first request for each coding and kept for the
+    lifetime of the entry.
+    """
+
+    def __init__(self, content: bytes, etag: str, last_modified: Optional[float] = None,
+                 media_type: str = "application/json"):
+        """
+        Initialize body
+
+        Args:
+            content: Uncompressed body
+            etag: Entity tag of the content (without quotes or W/ prefix)
+            last_modified: Last modification time (epoch seconds), if known
+            media_type: Content-Type of the body
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.media_type = media_type
+        self.variants: Dict[Optional[str], bytes] = {None: content}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(variant) for variant in self.variants.values())
+
+    @property
+    def max_nbytes(self) -> int:
+        """What nbytes can grow to once every supported coding is added (no variant outgrows the raw body)"""
+        content = len(self.variants[None])
+        return content * (1 + len(SUPPORTED_ENCODINGS)) if self.compressible else content
+
+    @property
+    def compressible(self) -> bool:
+        return len(self.variants[None]) >= MINIMUM_SIZE
+
+    def has(self, encoding: Optional[str]) -> bool:
+        return encoding in self.variants
+
+    def get(self, encoding: Optional[str]) -> bytes:
+        """The body in the given coding (None = identity), compressing it the first time"""
+        variant = self.variants.get(encoding)
+        if variant is not None:
+            return variant
+        with self._lock:
+            variant = self.variants.get(encoding)
+            if variant is None:
+                variant = compress(self.variants[None], encoding)
+                self.variants[encoding] = variant
+        return variant
+
+def _header(headers: List, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses that are not already encoded.
+    Single-message bodies under MINIMUM_SIZE are left alone; streamed
+    bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate((_header(scope["headers"], b"accept-encoding") or b"").decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[StreamCompressor] = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = list(start_message.get("headers", []))
+                start, start_message = start_message, None
+                media_type = (_header(headers, b"content-type") or b"").decode('latin-1')
+                if (
+                    _header(headers, b"content-encoding") is not None
+                    or not media_type.startswith(_COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                ):
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = StreamCompressor(encoding)
+                headers = [(key, value) for key, value in headers if key.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode('latin-1')))
+                if _header(headers, b"vary") is None:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    if len(body) > THREAD_SIZE:
+                        body = await anyio.to_thread.run_sync(compress, body, encoding, STREAM_LEVELS[encoding])
+                    else:
+                        body = compress(body, encoding, STREAM_LEVELS[encoding])
+                    headers.append((b"content-length", str(len(body)).encode('latin-1')))
+                    compressor = None
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            if compressor is None:
+                await send(message)
+                return
+            chunk = compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,270 @@
+"""
+Load-test scenario runner for the FHIR API
+Drives a weighted mix of clinical workflows (chart open, patient list, lab trend,
+bulk paging, conditional 304 revalidation) from concurrent virtual users with a
+pooled async HTTP client, stepping up concurrency to find where a single worker
+saturates. Targets the in-process ASGI app, a local uvicorn, or any running server.
+
+Usage:
+    python loadtest.py --mode inprocess --steps 1 4 16 64
+    python loadtest.py --mode uvicorn --duration 20
+    python loadtest.py --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+from benchmark import local_server, percentile
+
+class Recorder:
+    """Latencies and outcomes of the requests made during one step"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Dict[int, int] = {}
+        self.errors = 0
+        self.scenarios: Dict[str, int] = {}
+
+    async def get(self, client: httpx.AsyncClient, path: str, headers: Optional[Dict] = None,
+                  expected: tuple = (200,)) -> Optional[httpx.Response]:
+        """Make one timed request; unexpected statuses and transport failures count as errors"""
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers)
+        except httpx.HTTPError:
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        if response.status_code not in expected:
+            self.errors += 1
+        return response
+
+class LoadContext:
+    """Shared state for scenarios: patient ids and ETags seen for revalidation"""
+
+    def __init__(self, patient_ids: List[str]):
+        self.patient_ids = patient_ids
+        self.etags: Dict[str, str] = {}
+
+# ============================================================================
+# Scenarios
+# ============================================================================
+
+async def chart_open(client: httpx.AsyncClient, context: LoadContext, recorder: Recorder, rng: random.Random) -> None:
+    """Clinician opens a chart: the patient, then their problems, visits, meds and vitals at once"""
+    patient_id = rng.choice(context.patient_ids)
+    await recorder.get(client, f"/Patient/{patient_id}")
+    await asyncio.gather(
+        recorder.get(client, f"/Condition?patient={patient_id}"),
+        recorder.get(client, f"/Encounter?patient={patient_id}&_count=20"),
+        recorder.get(client, f"/MedicationRequest?patient={patient_id}&_count=50"),
+        recorder.get(client, f"/Observation?patient={patient_id}&category=vital-signs&_count=20"),
+    )
+
+async def patient_list(client: httpx.AsyncClient, context: LoadContext, recorder: Recorder, rng: random.Random) -> None:
+    """Ward census: a page of patients"""
+    await recorder.get(client, f"/Patient?_count={rng.choice([20, 50, 100])}")
+
+async def lab_trend(client: httpx.AsyncClient, context: LoadContext, recorder: Recorder, rng: random.Random) -> None:
+    """Lab trend chart for one patient"""
+    patient_id = rng.choice(context.patient_ids)
+    await recorder.get(client, f"/Observation?patient={patient_id}&category=laboratory&_count=100")
+
+async def bulk_paging(client: httpx.AsyncClient, context: LoadContext, recorder: Recorder, rng: random.Random) -> None:
+    """Analytics export pulling maximum-size pages"""
+    resource_type = rng.choice(["Observation", "MedicationAdministration", "Encounter"])
+    await recorder.get(client, f"/{resource_type}?_count=1000")
+
+async def revalidate(client: httpx.AsyncClient, context: LoadContext, recorder: Recorder, rng: random.Random) -> None:
+    """Browser revalidating a cached chart view with If-None-Match"""
+    path = f"/Condition?patient={rng.choice(context.patient_ids[:10])}"
+    etag = context.etags.get(path)
+    if etag is None:
+        response = await recorder.get(client, path)
+        if response is not None and "etag" in response.headers:
+            context.etags[path] = response.headers["etag"]
+        return
+    await recorder.get(client, path, headers={"If-None-Match": etag}, expected=(304,))
+
+# name -> (weight, scenario)
+SCENARIOS: Dict[str, tuple] = {
+    "chart_open": (30, chart_open),
+    "patient_list": (20, patient_list),
+    "lab_trend": (25, lab_trend),
+    "bulk_paging": (10, bulk_paging),
+    "revalidate_304": (15, revalidate),
+}
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+async def _monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.05) -> None:
+    """Sample how late this event loop wakes from a sleep (in-process, this is the app's loop)"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+async def _probe_server_lag(base_url: str, samples: List[float], stop: asyncio.Event, interval: float = 0.05) -> None:
+    """
+    Approximate a remote server's event-loop lag by timing a trivial endpoint
+    on its own connection; queueing behind blocked handlers shows up as latency.
+    """
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as probe:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                await probe.get("/ready")
+            except httpx.HTTPError:
+                pass
+            samples.append(time.perf_counter() - start)
+            await asyncio.sleep(interval)
+
+async def run_step(
+    client: httpx.AsyncClient,
+    context: LoadContext,
+    concurrency: int,
+    duration: float,
+    lag_monitor: Callable
+) -> Dict:
+    """Run the scenario mix with concurrency virtual users for duration seconds"""
+    recorder = Recorder()
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name][0] for name in names]
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + duration
+
+    async def user(number: int) -> None:
+        rng = random.Random(number)
+        while loop.time() < stop_at:
+            name = rng.choices(names, weights)[0]
+            await SCENARIOS[name][1](client, context, recorder, rng)
+            recorder.scenarios[name] = recorder.scenarios.get(name, 0) + 1
+
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(lag_monitor(lag_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(user(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    latencies = sorted(recorder.latencies)
+    lag = sorted(lag_samples)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "scenarios_per_sec": round(sum(recorder.scenarios.values()) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "errors": recorder.errors,
+        "statuses": recorder.statuses,
+        "loop_lag_p99_ms": round(percentile(lag, 99) * 1000, 1),
+        "loop_lag_max_ms": round(lag[-1] * 1000, 1) if lag else 0.0,
+    }
+
+def find_saturation(steps: List[Dict], growth: float = 0.1) -> Dict:
+    """
+    Saturation is the last step before throughput stops growing by more than
+    growth (10%) as concurrency increases; past it, added users only add latency.
+    """
+    saturated = steps[0]
+    for previous, step in zip(steps, steps[1:]):
+        if step["requests_per_sec"] < previous["requests_per_sec"] * (1 + growth):
+            break
+        saturated = step
+    return saturated
+
+@asynccontextmanager
+async def open_target(mode: str, url: Optional[str], data_dir: Optional[str], concurrency: int) -> AsyncIterator[tuple]:
+    """Yield (client, lag_monitor) for the in-process app, a local uvicorn or a given URL"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if url or mode == "uvicorn":
+        if url:
+            server = None
+            base_url = url.rstrip('/')
+        else:
+            server = local_server(data_dir)
+            base_url, _ = server.__enter__()
+        try:
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+                yield client, lambda samples, stop: _probe_server_lag(base_url, samples, stop)
+        finally:
+            if server is not None:
+                server.__exit__(None, None, None)
+        return
+
+    import main
+    if data_dir:
+        main.data_dir = data_dir
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", limits=limits, timeout=300) as client:
+            yield client, _monitor_loop_lag
+
+async def run(args) -> Dict:
+    async with open_target(args.mode, args.url, args.data_dir, max(args.steps)) as (client, lag_monitor):
+        response = await client.get("/Patient?_count=1000")
+        patient_ids = [entry["resource"]["id"] for entry in response.json().get("entry", [])]
+        if not patient_ids:
+            raise RuntimeError("No patients found on the target server")
+        context = LoadContext(patient_ids)
+
+        # One short pass so index builds and first-touch cache fills don't skew step one
+        await run_step(client, context, 1, args.warmup, lag_monitor)
+
+        steps = []
+        for concurrency in args.steps:
+            step = await run_step(client, context, concurrency, args.duration, lag_monitor)
+            steps.append(step)
+            print(f"  users {concurrency:>4}  {step['requests_per_sec']:>8} req/s  "
+                  f"p50 {step['p50_ms']:>8} ms  p99 {step['p99_ms']:>8} ms  "
+                  f"loop lag p99 {step['loop_lag_p99_ms']:>7} ms  errors {step['errors']}")
+
+    saturation = find_saturation(steps)
+    print(f"Saturation: {saturation['requests_per_sec']} req/s at {saturation['concurrency']} users "
+          f"(p99 {saturation['p99_ms']} ms)")
+    return {
+        "target": args.url or args.mode,
+        "mix": {name: weight for name, (weight, _) in SCENARIOS.items()},
+        "step_duration": args.duration,
+        "steps": steps,
+        "saturation": saturation,
+    }
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Weighted scenario load test for the FHIR API")
+    parser.add_argument('--mode', choices=['inprocess', 'uvicorn'], default='inprocess')
+    parser.add_argument('--url', help="Test an already running server instead")
+    parser.add_argument('--data-dir', help="NDJSON directory for inprocess/uvicorn targets (default: the app's)")
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64], help="Concurrent users per step")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per step")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Seconds of single-user warmup")
+    parser.add_argument('--output', help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.exit(main_cli())
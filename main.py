@@ -11,29 +11,73 @@ https://doi.org/10.13026/c2f9-3y63
 Licensed under Open Database License (ODbL) - See LICENSE file
 """
 
+import asyncio
 import json
 import os
 import hashlib
-from typing import Dict, List, Optional, Any, Callable
-from datetime import datetime
+import hmac
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlencode, urlsplit
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional, Any, Callable
+from datetime import date, datetime
+from itertools import islice
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query, Request, Response
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+import anyio.to_thread
 import uvicorn
+import shared_index
+import metrics
+from manifest import DataManifest, DataWatcher, file_key, scan_data_file
+from storage import SQLiteStore
+from async_reader import buffered, read_many
+from analytics import ObservationStats, PatientRisk, PatientSummary, SegmentedView, ViewSet, BUCKETS, GROUP_FIELDS, SUMMARY_SORT_FIELDS
+from metrics import QueryTrace, current_trace, stage, record_scan
+from compression import CompressionMiddleware, EncodedBody, SUPPORTED_ENCODINGS, negotiate
 from cache import (
     cache_fhir_resource,
     cache_fhir_bundle,
     resource_cache,
     bundle_cache,
+    body_cache,
+    validator_cache,
     get_cache_statistics,
     clear_all_caches,
-    generate_cache_key
+    invalidate_caches,
+    type_tag,
+    patient_tag,
+    generate_cache_key,
+    open_disk_cache,
+    single_flight,
+    expiry_sweeper,
+    QueryLog,
+    DISK_CACHE_PATH
 )
 
 # Configuration
-data_dir = "data/mimic-iv-clinical-database-demo-on-fhir-2.1.0/fhir"
+data_dir = os.getenv('FHIR_DATA_DIR', "data/mimic-iv-clinical-database-demo-on-fhir-2.1.0/fhir")
 BASE_URL = os.getenv('FHIR_BASE_URL', 'http://localhost:8000')
+INDEX_FILE = os.getenv('FHIR_INDEX_FILE')  # Shared mmap'd index for multi-worker deployments
+QUERY_LOG_PATH = os.getenv('FHIR_QUERY_LOG')  # Record query popularity and warm caches on boot
+WARM_TOP_N = int(os.getenv('FHIR_WARM_TOP_N', '100'))
+ADMIN_TOKEN = os.getenv('FHIR_ADMIN_TOKEN')  # Enables per-request debug timing/profiling for admins
+MANIFEST_DIR = os.getenv('FHIR_MANIFEST_DIR')  # Persisted line counts/id segments (default: <data_dir>/.fhir-manifest)
+WATCH_INTERVAL = float(os.getenv('FHIR_WATCH_INTERVAL', '5'))  # Seconds between data file checks; 0 disables
+STORAGE_ENGINE = os.getenv('FHIR_STORAGE', 'ndjson')  # 'sqlite' serves searches from an indexed SQLite copy of the data
+SQLITE_PATH = os.getenv('FHIR_SQLITE_PATH')  # SQLite engine database (default: <manifest dir>/resources.db)
+ANALYTICS_ENABLED = os.getenv('FHIR_ANALYTICS', '1') != '0'  # Build in-memory analytical views at startup
+
+query_log = QueryLog(QUERY_LOG_PATH) if QUERY_LOG_PATH else None
+
+# Cache warming progress, reported by /ready
+warmup_state = {"status": "starting", "completed": 0, "total": 0}
 
 def get_base_url(request: Request) -> str:
     """Get the base URL for this request"""
@@ -41,31 +85,172 @@ def get_base_url(request: Request) -> str:
         return BASE_URL
     return f"{request.url.scheme}://{request.url.netloc}"
 
-def generate_etag(data: Any) -> str:
-    """Generate ETag for resource data"""
-    if isinstance(data, dict):
-        # Use resource content to generate hash
-        content = json.dumps(data, sort_keys=True, separators=(',', ':'))
-    else:
-        content = str(data)
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
-
 # Cache for file line counts (populated at startup)
 file_line_counts = {}
 
-def get_last_modified(resource: Dict) -> Optional[str]:
-    """Extract last modified date from FHIR resource meta"""
-    meta = resource.get('meta', {})
-    last_updated = meta.get('lastUpdated')
+# Sidecar manifest of line counts and id segments, opened at startup
+data_manifest: Optional[DataManifest] = None
+
+# SQLite storage engine (FHIR_STORAGE=sqlite), opened at startup
+sqlite_store: Optional[SQLiteStore] = None
+
+def _manifest_dir() -> str:
+    return MANIFEST_DIR or os.path.join(data_dir, '.fhir-manifest')
+
+def get_last_modified(resource: Dict) -> Optional[float]:
+    """Last modification time (epoch seconds) from FHIR resource meta"""
+    last_updated = resource.get('meta', {}).get('lastUpdated')
     if last_updated:
-        # Ensure proper HTTP date format
         try:
-            dt = datetime.fromisoformat(last_updated.replace('Z', '+00:00'))
-            return dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
-        except:
+            return datetime.fromisoformat(last_updated.replace('Z', '+00:00')).timestamp()
+        except ValueError:
             pass
     return None
 
+# Newest data file modification time (epoch seconds); no resource can have changed after it
+dataset_last_modified: Optional[float] = None
+
+def update_dataset_last_modified() -> None:
+    global dataset_last_modified
+    mtimes = [
+        signature[1] / 1e9
+        for signature in shared_index.dataset_signatures(data_dir, FILE_MAPPINGS).values()
+        if signature is not None
+    ]
+    dataset_last_modified = max(mtimes) if mtimes else None
+
+# ============================================================================
+# Conditional requests - answered from stored validators before any scan
+# ============================================================================
+
+def entity_tags(header: str) -> List[str]:
+    """Opaque tags of an If-None-Match list, without W/ prefixes or quotes ('*' is kept as is)"""
+    tags = []
+    for item in header.split(','):
+        item = item.strip()
+        if item.startswith('W/'):
+            item = item[2:]
+        if len(item) >= 2 and item[0] == item[-1] == '"':
+            item = item[1:-1]
+        if item:
+            tags.append(item)
+    return tags
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """Strong ETag of one content coding of a body (compressed variants are distinct representations)"""
+    return f'"{etag}-{encoding}"' if encoding else f'"{etag}"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires: any coding of the same body matches"""
+    for tag in entity_tags(if_none_match):
+        if tag == '*' or tag == etag:
+            return True
+        base, _, encoding = tag.rpartition('-')
+        if base == etag and encoding in SUPPORTED_ENCODINGS:
+            return True
+    return False
+
+def unmodified_since(if_modified_since: Optional[str], last_modified: Optional[float]) -> bool:
+    """Whether If-Modified-Since is a valid HTTP date no earlier than last_modified"""
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and int(last_modified) <= since.timestamp()
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    """If-None-Match takes precedence; If-Modified-Since is only used without it"""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    return unmodified_since(request.headers.get("If-Modified-Since"), last_modified)
+
+def response_encoding(request: Request, compressible: bool) -> Optional[str]:
+    return negotiate(request.headers.get("Accept-Encoding")) if compressible else None
+
+def body_validator(entry: EncodedBody) -> Dict:
+    """What conditional requests need to know about a cached body, for validator_cache"""
+    return {'etag': entry.etag, 'compressible': entry.compressible, 'last_modified': entry.last_modified}
+
+def validator_headers(request: Request, validator: Dict, cache_control: str) -> tuple:
+    """(content coding, headers) for a body, shared by its 200 and 304 responses"""
+    encoding = response_encoding(request, validator['compressible'])
+    headers = {
+        "ETag": representation_etag(validator['etag'], encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    last_modified = validator['last_modified'] or dataset_last_modified
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return encoding, headers
+
+def not_modified_response(request: Request, validator: Optional[Dict], cache_control: str) -> Optional[Response]:
+    """A 304 if the request's conditions match the validator, else None"""
+    if validator is None:
+        return None
+    if not is_not_modified(request, validator['etag'], validator['last_modified'] or dataset_last_modified):
+        return None
+    _, headers = validator_headers(request, validator, cache_control)
+    return Response(status_code=304, headers=headers)
+
+async def answer_conditional(request: Request, body_key: tuple, cache_control: str) -> Optional[Response]:
+    """
+    Answer a conditional request before any scan or read: a 304 from the stored
+    validator of the body, else, for If-Modified-Since alone, from the newest data
+    file's mtime (nothing served can have changed after it). Unconditional requests
+    return None without a validator lookup.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_none_match is None and if_modified_since is None:
+        return None
+    # validator_cache may be remote or disk-backed
+    validator = await run_in_threadpool(validator_cache.get, body_key)
+    if validator is not None:
+        return not_modified_response(request, validator, cache_control)
+    if if_none_match is None and unmodified_since(if_modified_since, dataset_last_modified):
+        # No ETag is known without the validator; the 304 carries the rest
+        return Response(status_code=304, headers={
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+            "Last-Modified": formatdate(dataset_last_modified, usegmt=True),
+        })
+    return None
+
+def serialize_json(content: Any) -> bytes:
+    """The bytes every JSON response body is sent as"""
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def content_etag(body: bytes) -> str:
+    """Entity tag of a serialized body (without quotes): the MD5 of its bytes"""
+    return hashlib.md5(body).hexdigest()
+
+def encode_json_body(content: Any, last_modified: Optional[float] = None) -> EncodedBody:
+    """Serialize a JSON body once for body_cache; its ETag is a hash of the serialized bytes"""
+    with stage("serialization"):
+        body = serialize_json(content)
+    with stage("etag"):
+        etag = content_etag(body)
+    return EncodedBody(body, etag, last_modified)
+
+async def encoded_response(entry: EncodedBody, request: Request, cache_control: str) -> Response:
+    """
+    Send a cached body in the coding negotiated from Accept-Encoding. A coding
+    is compressed (in the worker pool) the first time it is asked for and then
+    kept on the entry, so later hits cost no compression CPU.
+    """
+    encoding, headers = validator_headers(request, body_validator(entry), cache_control)
+    if entry.has(encoding):
+        body = entry.get(encoding)
+    else:
+        body = await run_in_threadpool(entry.get, encoding)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, headers=headers, media_type=entry.media_type)
+
 def create_operation_outcome(severity: str, code: str, diagnostics: str) -> Dict:
     """Create a FHIR OperationOutcome response"""
     return {
@@ -83,17 +268,23 @@ def read_ndjson_file(filepath: str, filter_func: Optional[Callable] = None, limi
     if not os.path.exists(filepath):
         return results
 
+    lines_scanned = 0
+    parse_seconds = 0.0
     with open(filepath, 'r') as f:
         for line in f:
             if limit and len(results) >= limit:
                 break
+            lines_scanned += 1
             if line.strip():
                 try:
+                    parse_start = time.perf_counter()
                     resource = json.loads(line)
+                    parse_seconds += time.perf_counter() - parse_start
                     if filter_func is None or filter_func(resource):
                         results.append(resource)
                 except json.JSONDecodeError:
                     continue
+    record_scan(lines_scanned, len(results), parse_seconds)
     return results
 
 # FHIR Resource Type Mappings
@@ -123,6 +314,231 @@ FILE_MAPPINGS = {
     'Specimen': ['MimicSpecimen.ndjson', 'MimicSpecimenLab.ndjson']
 }
 
+# Reference search parameters usable in _include/_revinclude
+# search parameter -> (resource element, target resource type)
+_SUBJECT_PARAMS = {
+    'subject': ('subject', 'Patient'),
+    'patient': ('subject', 'Patient')
+}
+REFERENCE_SEARCH_PARAMS = {
+    'Patient': {'organization': ('managingOrganization', 'Organization')},
+    'Location': {'organization': ('managingOrganization', 'Organization')},
+    'Encounter': {**_SUBJECT_PARAMS, 'part-of': ('partOf', 'Encounter'), 'service-provider': ('serviceProvider', 'Organization')},
+    'Condition': {**_SUBJECT_PARAMS, 'encounter': ('encounter', 'Encounter')},
+    'Observation': {**_SUBJECT_PARAMS, 'encounter': ('encounter', 'Encounter'), 'specimen': ('specimen', 'Specimen')},
+    'Procedure': {**_SUBJECT_PARAMS, 'encounter': ('encounter', 'Encounter')},
+    'MedicationRequest': {**_SUBJECT_PARAMS, 'encounter': ('encounter', 'Encounter'), 'medication': ('medicationReference', 'Medication')},
+    'MedicationAdministration': {**_SUBJECT_PARAMS, 'context': ('context', 'Encounter'), 'request': ('request', 'MedicationRequest'), 'medication': ('medicationReference', 'Medication')},
+    'MedicationDispense': {**_SUBJECT_PARAMS, 'context': ('context', 'Encounter'), 'medication': ('medicationReference', 'Medication')},
+    'MedicationStatement': {**_SUBJECT_PARAMS, 'context': ('context', 'Encounter'), 'medication': ('medicationReference', 'Medication')},
+    'Specimen': dict(_SUBJECT_PARAMS)
+}
+
+# Maximum number of resources appended by _revinclude per search
+MAX_REVINCLUDE = 1000
+
+# ============================================================================
+# Resource ID Index - byte offsets for direct reads by ID
+# ============================================================================
+
+# resource_type -> {resource_id: (filename, byte_offset)}, built lazily per type
+resource_id_index: Dict[str, Dict[str, tuple]] = {}
+_id_index_lock = threading.Lock()
+
+def build_id_index(resource_type: str) -> Dict[str, tuple]:
+    """Build (or return the existing) id -> (filename, offset) index for a resource type"""
+    if resource_type in resource_id_index:
+        return resource_id_index[resource_type]
+
+    # Serialize builds so concurrent batch lookups don't scan the same files twice
+    with _id_index_lock:
+        if resource_type in resource_id_index:
+            return resource_id_index[resource_type]
+        return _build_id_index_locked(resource_type)
+
+def _build_id_index_locked(resource_type: str) -> Dict[str, tuple]:
+    """Scan a resource type's files into the id index (caller holds _id_index_lock)"""
+    index, line_counts = scan_id_index(resource_type)
+    file_line_counts.update(line_counts)
+    resource_id_index[resource_type] = index
+    return index
+
+def scan_id_index(resource_type: str) -> tuple:
+    """
+    Build a resource type's id -> (filename, offset) index from per-file segments,
+    loading each from the data manifest when current and scanning it otherwise.
+    Non-empty lines are counted in the same pass; returns (index, line_counts).
+    """
+    segments = []
+    line_counts = {}
+    for filename in FILE_MAPPINGS.get(resource_type, []):
+        filepath = os.path.join(data_dir, filename)
+        if not os.path.exists(filepath):
+            continue
+        key = file_key(filepath) if data_manifest is not None else None
+        ids = data_manifest.load_segment(filename, key) if key is not None else None
+        if ids is None:
+            count, ids = scan_data_file(filepath)
+            if key is not None:
+                data_manifest.record(filename, key, count, ids)
+        else:
+            count = data_manifest.lookup(filename, key)['lines']
+        line_counts[filename] = count
+        segments.append((filename, ids))
+
+    # Earlier files win when an id appears more than once
+    index = {}
+    for filename, ids in reversed(segments):
+        index.update((resource_id, (filename, offset)) for resource_id, offset in ids.items())
+    return index, line_counts
+
+def load_shared_index(index_path: str) -> None:
+    """
+    Map the shared index file into this process, building it first if it is
+    missing or stale. The build runs under a file lock, so when several workers
+    start together exactly one scans the data and the rest map its result.
+    """
+    with shared_index.build_lock(index_path):
+        if not shared_index.is_current(index_path, data_dir, FILE_MAPPINGS):
+            signatures = shared_index.dataset_signatures(data_dir, FILE_MAPPINGS)
+            id_indexes = {}
+            line_counts = {}
+            for resource_type in FILE_MAPPINGS:
+                id_indexes[resource_type], counts = scan_id_index(resource_type)
+                line_counts.update(counts)
+            shared_index.write_index_file(index_path, id_indexes, line_counts, signatures)
+
+    mapped = shared_index.SharedIndex(index_path)
+    resource_id_index.update(mapped.tables)
+    file_line_counts.update(mapped.line_counts)
+
+def apply_data_changes(filenames: List[str]) -> None:
+    """
+    Refresh changed (or removed) data files without a restart: rescan only those
+    files, rebuild their line counts and id index segments, swap each affected
+    type's index in one assignment, then invalidate that type's cache entries.
+    """
+    segments = {}
+    for filename in filenames:
+        filepath = os.path.join(data_dir, filename)
+        key = file_key(filepath)
+        if key is None:
+            file_line_counts.pop(filename, None)
+            segments[filename] = {}
+            continue
+        count, ids = scan_data_file(filepath)
+        file_line_counts[filename] = count
+        segments[filename] = ids
+        if data_manifest is not None:
+            data_manifest.record(filename, key, count, ids)
+
+    changed_types = [
+        resource_type for resource_type, type_files in FILE_MAPPINGS.items()
+        if any(filename in segments for filename in type_files)
+    ]
+    if sqlite_store is not None:
+        # Loads the changed files, unless another worker already has
+        sqlite_store.sync(data_dir, FILE_MAPPINGS)
+    if INDEX_FILE:
+        # The shared file is rebuilt as a whole (by one worker) and remapped
+        load_shared_index(INDEX_FILE)
+    else:
+        for resource_type in changed_types:
+            current = resource_id_index.get(resource_type)
+            if current is None:
+                continue  # Not built yet; the first lookup scans current files
+            index = {
+                resource_id: location for resource_id, location in current.items()
+                if location[0] not in segments
+            }
+            for filename in FILE_MAPPINGS[resource_type]:
+                for resource_id, offset in segments.get(filename, {}).items():
+                    index.setdefault(resource_id, (filename, offset))
+            resource_id_index[resource_type] = index
+
+    try:
+        if ANALYTICS_ENABLED:
+            # Each changed file is rescanned once for every view reading it, by one worker
+            load_or_build_analytics(changed=filenames)
+    except Exception as e:
+        # The views keep serving what they had before the change
+        print(f"Refreshing analytical views failed: {e!r}")
+
+    update_dataset_last_modified()
+    for resource_type in changed_types:
+        invalidate_caches(type_tag(resource_type))
+    print(f"Reloaded {', '.join(filenames)}; invalidated cached {', '.join(changed_types)}")
+
+def _resource_tags(resource_type: str, resource: Dict) -> tuple:
+    """Invalidation tags for a cached resource: its type and, if any, its patient"""
+    if resource_type == 'Patient':
+        patient_id = resource.get('id')
+    else:
+        reference = resource.get('subject', {}).get('reference', '')
+        patient_id = reference[len('Patient/'):] if reference.startswith('Patient/') else None
+    if patient_id:
+        return (type_tag(resource_type), patient_tag(patient_id))
+    return (type_tag(resource_type),)
+
+def get_resources_by_ids(resource_type: str, resource_ids) -> Dict[str, Dict]:
+    """
+    Resolve many resource ids of one type in a single batched index lookup.
+    Ids are deduplicated, served from resource_cache where possible, and the
+    remainder read with one seek per resource, grouped by file in offset order.
+    Returns a mapping of id -> resource for the ids that exist.
+    """
+    if resource_type not in FILE_MAPPINGS:
+        return {}
+
+    found = {}
+    missing = []
+    for resource_id in set(resource_ids):
+        cached_resource = resource_cache.get(("resource", resource_type, resource_id))
+        if cached_resource is not None:
+            found[resource_id] = cached_resource
+        else:
+            missing.append(resource_id)
+
+    if not missing:
+        return found
+
+    if _use_sqlite():
+        with stage("read"):
+            for resource_id, resource in sqlite_store.get_many(resource_type, missing).items():
+                found[resource_id] = resource
+                resource_cache.set(
+                    ("resource", resource_type, resource_id), resource, tags=_resource_tags(resource_type, resource)
+                )
+        return found
+
+    with stage("index"):
+        index = build_id_index(resource_type)
+    locations_by_file: Dict[str, List[tuple]] = {}
+    for resource_id in missing:
+        location = index.get(resource_id)
+        if location:
+            filename, offset = location
+            locations_by_file.setdefault(filename, []).append((offset, resource_id))
+
+    with stage("read"):
+        for filename, locations in locations_by_file.items():
+            with open(os.path.join(data_dir, filename), 'rb') as f:
+                for offset, resource_id in sorted(locations):
+                    f.seek(offset)
+                    try:
+                        resource = json.loads(f.readline())
+                    except json.JSONDecodeError:
+                        continue
+                    if resource.get('id') != resource_id:
+                        # File replaced under an index that hasn't been swapped yet
+                        continue
+                    found[resource_id] = resource
+                    resource_cache.set(
+                        ("resource", resource_type, resource_id), resource, tags=_resource_tags(resource_type, resource)
+                    )
+
+    return found
+
 # ============================================================================
 # FHIR R4 Search Engine - Core Implementation
 # ============================================================================
@@ -130,13 +546,16 @@ FILE_MAPPINGS = {
 class FHIRSearchParameters:
     """Parse and validate FHIR search parameters"""
 
-    def __init__(self, query_params: dict):
+    def __init__(self, query_params: dict, include: Optional[List[str]] = None, revinclude: Optional[List[str]] = None):
         self.params = query_params
         self._id = query_params.get('_id')
         self._count = self._parse_count(query_params.get('_count'))
         self._format = self._parse_format(query_params.get('_format'))
         self._since = self._parse_since(query_params.get('_since'))
         self._summary = query_params.get('_summary')  # New: support _summary parameter
+        # _include/_revinclude may repeat, so callers pass every value explicitly
+        self._include = self._parse_include(include, query_params.get('_include'))
+        self._revinclude = self._parse_include(revinclude, query_params.get('_revinclude'))
 
     def _parse_count(self, count_param: Optional[str]) -> Optional[int]:
         """Parse _count parameter according to FHIR spec"""
@@ -159,6 +578,8 @@ class FHIRSearchParameters:
             return "json"
         elif format_param in ["html", "text/html"]:
             return "html"
+        elif format_param in ["ndjson", "application/fhir+ndjson", "application/ndjson", "application/x-ndjson"]:
+            return "ndjson"
         else:
             # Default to JSON for unsupported formats
             return "json"
@@ -177,6 +598,27 @@ class FHIRSearchParameters:
             # Invalid date format, ignore parameter
             return None
 
+    def _parse_include(self, values: Optional[List[str]], single_value: Optional[str]) -> List[tuple]:
+        """Parse _include/_revinclude values of the form SourceType:param[:TargetType]"""
+        if values is None:
+            values = [single_value] if single_value else []
+
+        parsed = []
+        for value in values:
+            parts = value.split(':')
+            if len(parts) not in (2, 3):
+                raise HTTPException(status_code=400, detail=f"Invalid include parameter: {value}")
+            source_type, param = parts[0], parts[1]
+            reference = REFERENCE_SEARCH_PARAMS.get(source_type, {}).get(param)
+            if reference is None:
+                raise HTTPException(status_code=400, detail=f"Unsupported include parameter: {value}")
+            element, target_type = reference
+            if len(parts) == 3 and parts[2] != target_type:
+                raise HTTPException(status_code=400, detail=f"Unsupported include target type: {value}")
+            if (source_type, element, target_type) not in parsed:
+                parsed.append((source_type, element, target_type))
+        return parsed
+
     @property
     def count(self) -> Optional[int]:
         return self._count
@@ -197,6 +639,14 @@ class FHIRSearchParameters:
     def summary(self) -> Optional[str]:
         return self._summary
 
+    @property
+    def include(self) -> List[tuple]:
+        return self._include
+
+    @property
+    def revinclude(self) -> List[tuple]:
+        return self._revinclude
+
     def get_count(self, default: int = 100, max_limit: int = 1000) -> int:
         """Get _count with default and maximum enforcement"""
         if self._count is None:
@@ -426,13 +876,74 @@ def _specimen_search_filter(resource: Dict, search_params: FHIRSearchParameters)
             return False
     return True
 
+# ============================================================================
+# SQLite Storage Engine - filters pushed down as SQL
+# ============================================================================
+
+def _use_sqlite() -> bool:
+    """Whether the SQLite engine is enabled and has finished its initial load"""
+    return sqlite_store is not None and sqlite_store.ready
+
+def _sql_filters(resource_type: str, search_params: FHIRSearchParameters) -> tuple:
+    """
+    Translate search parameters into SQL clauses over the extracted columns.
+    Returns (clauses, args, exact); unless exact, the clauses only narrow the
+    candidates and the Python search filter decides on each of them.
+    """
+    if search_params.id_search:
+        # _id alone decides the match, as in create_search_filter
+        return ["id = ?"], [search_params.id_search], True
+
+    clauses = []
+    args = []
+    if 'subject' in REFERENCE_SEARCH_PARAMS.get(resource_type, {}):
+        subject_param = search_params.params.get('subject') or search_params.params.get('patient')
+        if subject_param:
+            clauses.append("subject = ?")
+            args.append(f"Patient/{subject_param.split('/')[-1]}")
+    if resource_type == 'Observation' and 'category' in search_params.params:
+        # Indexed on the first category; further categories are checked with json_each
+        clauses.append(
+            "(category = ? OR EXISTS (SELECT 1 FROM json_each(resource, '$.category') "
+            "WHERE json_extract(value, '$.coding[0].code') = ?))"
+        )
+        args.extend([search_params.params['category']] * 2)
+
+    exact = search_params.since is None and not (
+        resource_type == 'Patient' and any(key in search_params.params for key in ('name', 'identifier'))
+    )
+    return clauses, args, exact
+
+def sqlite_count(resource_type: str, search_params: FHIRSearchParameters, search_filter: Optional[Callable]) -> int:
+    """Count matches with SQL, checking narrowed candidates in Python when needed"""
+    clauses, args, exact = _sql_filters(resource_type, search_params)
+    if exact or search_filter is None:
+        return sqlite_store.count(resource_type, clauses, args)
+    return sum(1 for resource in sqlite_store.select(resource_type, clauses, args) if search_filter(resource))
+
+def sqlite_page(
+    resource_type: str,
+    search_params: FHIRSearchParameters,
+    search_filter: Optional[Callable],
+    count: int
+) -> List[Dict]:
+    """First page of matches in NDJSON order, streamed from SQLite"""
+    clauses, args, exact = _sql_filters(resource_type, search_params)
+    if exact or search_filter is None:
+        return list(sqlite_store.select(resource_type, clauses, args, limit=count))
+    matches = (resource for resource in sqlite_store.select(resource_type, clauses, args) if search_filter(resource))
+    return list(islice(matches, count))
+
 def count_lines_with_string(filepath: str, search_string: str) -> int:
     """Count lines containing a specific string without JSON parsing"""
     count = 0
+    lines_scanned = 0
     with open(filepath, 'r') as f:
         for line in f:
+            lines_scanned += 1
             if search_string in line:
                 count += 1
+    record_scan(lines_scanned, count)
     return count
 
 def count_fhir_resources_optimized(resource_type: str, search_params: Optional[FHIRSearchParameters] = None, search_filter: Optional[Callable] = None) -> int:
@@ -498,6 +1009,8 @@ def count_fhir_resources_json_parse(resource_type: str, search_filter: Optional[
         return 0
 
     total_count = 0
+    lines_scanned = 0
+    parse_seconds = 0.0
     files = FILE_MAPPINGS[resource_type]
 
     for filename in files:
@@ -505,22 +1018,26 @@ def count_fhir_resources_json_parse(resource_type: str, search_filter: Optional[
         if os.path.exists(filepath):
             with open(filepath, 'r') as f:
                 for line in f:
+                    lines_scanned += 1
                     if line.strip():
                         if search_filter is None:
                             total_count += 1
                         else:
                             try:
+                                parse_start = time.perf_counter()
                                 resource = json.loads(line)
+                                parse_seconds += time.perf_counter() - parse_start
                                 if search_filter(resource):
                                     total_count += 1
                             except json.JSONDecodeError:
                                 continue
+    record_scan(lines_scanned, total_count, parse_seconds)
     return total_count
 
 # Keep old name for compatibility but redirect to optimized version
 def count_fhir_resources(resource_type: str, search_filter: Optional[Callable] = None) -> int:
     """Legacy wrapper - redirects to optimized counting"""
-    return count_fhir_resources_json_parse(resource_type, search_filter)
+    return count_fhir_resources_optimized(resource_type, search_filter=search_filter)
 
 def get_fhir_resources_page(resource_type: str, search_filter: Optional[Callable] = None, count: Optional[int] = None) -> List[Dict]:
     """
@@ -533,7 +1050,7 @@ def get_fhir_resources_page(resource_type: str, search_filter: Optional[Callable
 
     # Try to use cache for simple queries (no filter)
     if search_filter is None:
-        cache_key = f"page:{resource_type}:nofilter:{count}"
+        cache_key = ("page", resource_type, count)
         cached_results = resource_cache.get(cache_key)
         if cached_results is not None:
             return cached_results
@@ -552,17 +1069,85 @@ def get_fhir_resources_page(resource_type: str, search_filter: Optional[Callable
 
     # Cache results for simple queries
     if search_filter is None:
-        cache_key = f"page:{resource_type}:nofilter:{count}"
-        resource_cache.set(cache_key, final_results)
+        cache_key = ("page", resource_type, count)
+        resource_cache.set(cache_key, final_results, tags=(type_tag(resource_type),))
 
     return final_results
 
+def _reference_values(resource: Dict, element: str) -> List[str]:
+    """Get reference strings from a Reference or list of References element"""
+    value = resource.get(element)
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [ref.get('reference', '') for ref in value if isinstance(ref, dict)]
+
+def resolve_includes(resources: List[Dict], includes: List[tuple]) -> List[Dict]:
+    """
+    Resolve _include references for a page of resources.
+    Referenced ids are deduplicated across the whole page and each target type
+    is resolved with one batched id-index lookup.
+    """
+    ids_by_type: Dict[str, List[str]] = {}
+    for source_type, element, target_type in includes:
+        for resource in resources:
+            if resource.get('resourceType') != source_type:
+                continue
+            for reference in _reference_values(resource, element):
+                if reference.startswith(f"{target_type}/"):
+                    ids_by_type.setdefault(target_type, []).append(reference.split('/', 1)[1])
+
+    included = []
+    for target_type, resource_ids in ids_by_type.items():
+        found = get_resources_by_ids(target_type, resource_ids)
+        # Keep first-seen reference order for a stable response
+        for resource_id in dict.fromkeys(resource_ids):
+            if resource_id in found:
+                included.append(found[resource_id])
+    return included
+
+def resolve_revincludes(resources: List[Dict], revincludes: List[tuple], limit: int = MAX_REVINCLUDE) -> List[Dict]:
+    """
+    Resolve _revinclude for a page of resources with a single pass per source type.
+    Lines are pre-filtered on the referencing element before any JSON parsing.
+    """
+    included = []
+    for source_type, element, target_type in revincludes:
+        target_refs = {
+            f"{target_type}/{resource['id']}"
+            for resource in resources
+            if resource.get('resourceType') == target_type and 'id' in resource
+        }
+        if not target_refs:
+            continue
+
+        element_marker = f'"{element}"'
+        for filename in FILE_MAPPINGS.get(source_type, []):
+            filepath = os.path.join(data_dir, filename)
+            if not os.path.exists(filepath):
+                continue
+            with open(filepath, 'r') as f:
+                for line in f:
+                    if len(included) >= limit:
+                        return included
+                    if element_marker not in line:
+                        continue
+                    try:
+                        resource = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if any(ref in target_refs for ref in _reference_values(resource, element)):
+                        included.append(resource)
+    return included
+
 def create_fhir_bundle(
     resources: List[Dict],
     resource_type: str,
-    base_url: str,
+    base_url: Optional[str],
     total_matches: int,
-    self_url: str
+    self_url: Optional[str],
+    included: Optional[List[Dict]] = None
 ) -> Dict:
     """
     Create FHIR R4 compliant Bundle with type=searchset.
@@ -571,25 +1156,129 @@ def create_fhir_bundle(
     - Bundle.total = total number of matches across all pages
     - Bundle.entry = resources in this page only
     - search.mode = "match" for all search results
+    - search.mode = "include" for _include/_revinclude resources
+
+    With base_url and self_url of None the Bundle is host-agnostic: fullUrls
+    are relative and there is no self link (see bind_bundle).
     """
+    prefix = f"{base_url}/" if base_url is not None else ""
+    entries = [
+        {
+            "fullUrl": f"{prefix}{resource_type}/{resource['id']}",
+            "resource": resource,
+            "search": {"mode": "match"}
+        }
+        for resource in resources
+    ]
+
+    # Included resources may be shared by many matches; emit each only once
+    seen = {(resource_type, resource.get('id')) for resource in resources}
+    for resource in included or []:
+        key = (resource.get('resourceType'), resource.get('id'))
+        if key in seen:
+            continue
+        seen.add(key)
+        entries.append({
+            "fullUrl": f"{prefix}{key[0]}/{key[1]}",
+            "resource": resource,
+            "search": {"mode": "include"}
+        })
+
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "searchset",
+        "total": total_matches
+    }
+    if self_url is not None:
+        bundle["link"] = [{
+            "relation": "self",
+            "url": self_url
+        }]
+    bundle["entry"] = entries
+    return bundle
+
+def bind_bundle(bundle: Dict, base_url: str, self_url: str, count: Optional[int] = None) -> Dict:
+    """
+    Splice request-specific URLs into a host-agnostic cached Bundle.
+    Match entries beyond count are dropped, so one cached page serves every
+    _count in its bucket.
+    """
+    entries = []
+    matches = 0
+    for entry in bundle["entry"]:
+        if entry["search"]["mode"] == "match":
+            if count is not None and matches >= count:
+                continue
+            matches += 1
+        entries.append({**entry, "fullUrl": f"{base_url}/{entry['fullUrl']}"})
+
     return {
         "resourceType": "Bundle",
         "type": "searchset",
-        "total": total_matches,
+        "total": bundle["total"],
         "link": [{
             "relation": "self",
             "url": self_url
         }],
-        "entry": [
-            {
-                "fullUrl": f"{base_url}/{resource_type}/{resource['id']}",
-                "resource": resource,
-                "search": {"mode": "match"}
-            }
-            for resource in resources
-        ]
+        "entry": entries
     }
 
+# Parameters that only change how a response is rendered, not which resources match
+_RESPONSE_FORMAT_PARAMS = {'_format', '_pretty', '_debug'}
+
+# _count is rounded up to one of these page sizes so nearby sizes share a cached Bundle
+COUNT_BUCKETS = (10, 20, 50, 100, 200, 500, 1000)
+
+def _bucket_count(count: int) -> int:
+    """Round a page size up to its bucket"""
+    for bucket in COUNT_BUCKETS:
+        if count <= bucket:
+            return bucket
+    return count
+
+def normalize_search_params(resource_type: str, query_params) -> List[tuple]:
+    """
+    Canonical (name, value) pairs for a search, used for cache keys and the query log.
+
+    - Formatting-only parameters (_format, _pretty) are dropped
+    - subject/patient fold into patient with a bare patient id
+    - _count becomes the effective page size, bucketed unless _include/_revinclude
+      is present (included resources depend on exactly which matches are on the page)
+    - Parameters are sorted
+    """
+    items = [
+        (name, value) for name, value in query_params.multi_items()
+        if name not in _RESPONSE_FORMAT_PARAMS and name not in ('subject', 'patient', '_count')
+    ]
+
+    if 'subject' in REFERENCE_SEARCH_PARAMS.get(resource_type, {}):
+        # Same precedence as the search filters: subject wins over patient
+        subject_param = query_params.get('subject') or query_params.get('patient')
+        if subject_param:
+            items.append(('patient', subject_param.split('/')[-1]))
+    else:
+        items.extend((name, value) for name, value in query_params.multi_items() if name in ('subject', 'patient'))
+
+    count = FHIRSearchParameters({'_count': query_params.get('_count')}).get_count(default=100, max_limit=1000)
+    if count and '_include' not in query_params and '_revinclude' not in query_params:
+        count = _bucket_count(count)
+    items.append(('_count', str(count)))
+
+    return sorted(items)
+
+def parse_search_request(resource_type: str, request: Request) -> tuple:
+    """Parse FHIR search parameters from their canonical form; returns (query_items, search_params)"""
+    query_items = normalize_search_params(resource_type, request.query_params)
+    params = dict(query_items)
+    if '_format' in request.query_params:
+        params['_format'] = request.query_params['_format']
+    search_params = FHIRSearchParameters(
+        params,
+        include=[value for name, value in query_items if name == '_include'],
+        revinclude=[value for name, value in query_items if name == '_revinclude']
+    )
+    return query_items, search_params
+
 def fhir_search(resource_type: str, request: Request):
     """
     Execute FHIR R4 compliant search operation.
@@ -598,8 +1287,7 @@ def fhir_search(resource_type: str, request: Request):
     Supports _format parameter for content negotiation.
     Supports _summary=count for count-only responses.
     """
-    # Parse FHIR search parameters
-    search_params = FHIRSearchParameters(dict(request.query_params))
+    query_items, search_params = parse_search_request(resource_type, request)
 
     # Handle _summary=count - return count-only Bundle
     if search_params.summary == "count":
@@ -607,7 +1295,11 @@ def fhir_search(resource_type: str, request: Request):
         search_filter = create_search_filter(resource_type, search_params)
 
         # Use optimized counting for _summary=count
-        total_matches = count_fhir_resources_optimized(resource_type, search_params, search_filter)
+        with stage("count"):
+            if _use_sqlite():
+                total_matches = sqlite_count(resource_type, search_params, search_filter)
+            else:
+                total_matches = count_fhir_resources_optimized(resource_type, search_params, search_filter)
 
         # Return count-only Bundle per FHIR spec
         return {
@@ -617,45 +1309,17 @@ def fhir_search(resource_type: str, request: Request):
             "entry": []
         }
 
-    # Generate cache key for this search
-    cache_key = f"bundle:{resource_type}:{generate_cache_key(**dict(request.query_params))}"
+    # Cache key from the canonical query; the cached body is host-agnostic
+    cache_key = ("bundle", resource_type, *generate_cache_key(*query_items))
     cached_bundle = bundle_cache.get(cache_key)
 
-    if cached_bundle:
-        # Handle format parameter for cached results
-        if search_params.format == "html":
-            html_content = f"""
-            <html>
-            <head><title>FHIR {resource_type} Search Results</title></head>
-            <body>
-            <h1>{resource_type} Search Results</h1>
-            <p>Total matches: {cached_bundle.get('total', 0)}</p>
-            <p>Resources in this page: {len(cached_bundle.get('entry', []))}</p>
-            <pre>{json.dumps(cached_bundle, indent=2)}</pre>
-            </body>
-            </html>
-            """
-            return PlainTextResponse(content=html_content, media_type="text/html")
-        return cached_bundle
-
-    # Create search filter
-    search_filter = create_search_filter(resource_type, search_params)
-
-    # Count total matches (for Bundle.total)
-    total_matches = count_fhir_resources(resource_type, search_filter)
+    if not cached_bundle:
+        # Concurrent identical misses share a single scan
+        cached_bundle = single_flight.do(cache_key, _execute_search, resource_type, search_params, cache_key)
 
-    # Get current page of results with default and max limits
-    count = search_params.get_count(default=100, max_limit=1000)
-    page_resources = get_fhir_resources_page(resource_type, search_filter, count)
-
-    # Build FHIR Bundle response
-    base_url = get_base_url(request)
-    self_url = str(request.url)
-
-    bundle = create_fhir_bundle(page_resources, resource_type, base_url, total_matches, self_url)
-
-    # Cache the bundle
-    bundle_cache.set(cache_key, bundle)
+    requested_count = FHIRSearchParameters(dict(request.query_params)).get_count(default=100, max_limit=1000)
+    with stage("bundle"):
+        bundle = bind_bundle(cached_bundle, get_base_url(request), str(request.url), requested_count or None)
 
     # Handle format parameter
     if search_params.format == "html":
@@ -665,8 +1329,8 @@ def fhir_search(resource_type: str, request: Request):
         <head><title>FHIR {resource_type} Search Results</title></head>
         <body>
         <h1>{resource_type} Search Results</h1>
-        <p>Total matches: {total_matches}</p>
-        <p>Resources in this page: {len(page_resources)}</p>
+        <p>Total matches: {bundle.get('total', 0)}</p>
+        <p>Resources in this page: {len(bundle.get('entry', []))}</p>
         <pre>{json.dumps(bundle, indent=2)}</pre>
         </body>
         </html>
@@ -675,30 +1339,303 @@ def fhir_search(resource_type: str, request: Request):
 
     return bundle
 
+def _search_tags(resource_type: str, search_params: FHIRSearchParameters) -> tuple:
+    """
+    Invalidation tags for a cached search Bundle: every resource type it draws on
+    (including _include targets and _revinclude sources) and the searched patient
+    """
+    resource_types = {resource_type}
+    resource_types.update(target_type for _, _, target_type in search_params.include)
+    resource_types.update(source_type for source_type, _, _ in search_params.revinclude)
+    tags = [type_tag(t) for t in sorted(resource_types)]
+
+    if resource_type == 'Patient':
+        patient_id = search_params.id_search
+    else:
+        patient_param = search_params.params.get('patient') or search_params.params.get('subject')
+        patient_id = patient_param.split('/')[-1] if patient_param else None
+    if patient_id:
+        tags.append(patient_tag(patient_id))
+    return tuple(tags)
+
+def _execute_search(resource_type: str, search_params: FHIRSearchParameters, cache_key: tuple) -> Dict:
+    """Run a search that missed bundle_cache and cache the resulting host-agnostic Bundle"""
+    # Another request may have filled the cache between our miss and taking the flight
+    bundle = bundle_cache.get(cache_key)
+    if bundle:
+        return bundle
+
+    # Create search filter
+    search_filter = create_search_filter(resource_type, search_params)
+
+    # Get current page of results with default and max limits
+    count = search_params.get_count(default=100, max_limit=1000)
+
+    if _use_sqlite():
+        with stage("count"):
+            total_matches = sqlite_count(resource_type, search_params, search_filter)
+        with stage("scan"):
+            page_resources = sqlite_page(resource_type, search_params, search_filter, count)
+    else:
+        # Count total matches (for Bundle.total)
+        with stage("count"):
+            total_matches = count_fhir_resources(resource_type, search_filter)
+        with stage("scan"):
+            page_resources = get_fhir_resources_page(resource_type, search_filter, count)
+
+    # Resolve _include/_revinclude for the current page
+    included = []
+    with stage("include"):
+        if search_params.include:
+            included.extend(resolve_includes(page_resources, search_params.include))
+        if search_params.revinclude:
+            included.extend(resolve_revincludes(page_resources, search_params.revinclude))
+
+    # Build FHIR Bundle without host-specific URLs (spliced in by bind_bundle)
+    with stage("bundle"):
+        bundle = create_fhir_bundle(page_resources, resource_type, None, total_matches, None, included)
+
+    # Cache the bundle
+    bundle_cache.set(cache_key, bundle, tags=_search_tags(resource_type, search_params))
+    return bundle
+
+def _make_request(path: str, query_string: str) -> Request:
+    """Create a standalone GET request against BASE_URL, for replaying recorded queries"""
+    base = urlsplit(BASE_URL)
+    port = base.port or (443 if base.scheme == 'https' else 80)
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "scheme": base.scheme,
+        "server": (base.hostname, port),
+        "root_path": "",
+        "path": path,
+        "raw_path": path.encode('utf-8'),
+        "query_string": query_string.encode('utf-8'),
+        "headers": [(b"host", base.netloc.encode('utf-8'))]
+    })
+
+async def warm_caches(queries: List[str]) -> None:
+    """
+    Warm caches in the background after startup: every Patient read, then
+    the recorded top queries. Work runs one item at a time in the worker
+    pool so warming never competes with live traffic for more than a thread.
+    """
+    warmup_state.update({"status": "warming", "completed": 0, "total": len(queries) + 1})
+    status = "failed"
+    try:
+        patient_ids = list(await run_in_threadpool(build_id_index, 'Patient'))
+        await run_in_threadpool(get_resources_by_ids, 'Patient', patient_ids)
+        warmup_state["completed"] += 1
+
+        for query in queries:
+            resource_type, _, query_string = query.partition('?')
+            if resource_type in FILE_MAPPINGS:
+                try:
+                    await run_in_threadpool(fhir_search, resource_type, _make_request(f"/{resource_type}", query_string))
+                except Exception as e:
+                    print(f"Cache warming skipped {query}: {e}")
+            warmup_state["completed"] += 1
+
+        status = "ready"
+        print(f"Cache warming complete: {len(patient_ids)} patients, {len(queries)} queries")
+    except Exception as e:
+        # Warming is best effort; the server still serves from cold caches
+        print(f"Cache warming failed: {e!r}")
+    finally:
+        warmup_state["status"] = status
+
+def load_line_counts() -> List[str]:
+    """
+    Fill file_line_counts from the data manifest.
+    Returns the files whose size, mtime or content sample no longer match it.
+    """
+    stale = []
+    for filenames in FILE_MAPPINGS.values():
+        for filename in filenames:
+            key = file_key(os.path.join(data_dir, filename))
+            if key is None:
+                continue
+            entry = data_manifest.lookup(filename, key)
+            if entry is None:
+                stale.append(filename)
+            else:
+                file_line_counts[filename] = entry['lines']
+    return stale
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    """Worker processes for CPU-bound file scans; spawned, not forked, since this process already runs threads"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+async def rebuild_stale_files(filenames: List[str]) -> None:
+    """
+    Rescan changed files in parallel worker processes and record their line
+    counts and id segments. Counts for these files are computed on demand
+    until their scan finishes.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _process_pool(min(len(filenames), os.cpu_count() or 1))
+
+    async def rebuild(filename: str) -> None:
+        filepath = os.path.join(data_dir, filename)
+        key = await run_in_threadpool(file_key, filepath)
+        count, ids = await loop.run_in_executor(pool, scan_data_file, filepath)
+        file_line_counts[filename] = count
+        await run_in_threadpool(data_manifest.record, filename, key, count, ids)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(rebuild(filename) for filename in filenames))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    print(f"Rebuilt {len(filenames)} files in {time.perf_counter() - started:.1f}s")
+
+async def load_sqlite_store() -> None:
+    """Bring the SQLite engine up to date with the data files, then start serving from it"""
+    started = time.perf_counter()
+    loaded = await anyio.to_thread.run_sync(sqlite_store.sync, data_dir, FILE_MAPPINGS, abandon_on_cancel=True)
+    print(f"SQLite storage engine ready: loaded {len(loaded)} files in {time.perf_counter() - started:.1f}s ({sqlite_store.path})")
+
+def analytics_snapshot_path() -> str:
+    """Snapshot of the analytical views for the current version of the data files"""
+    fingerprint = shared_index.dataset_fingerprint(data_dir, FILE_MAPPINGS)
+    return os.path.join(_manifest_dir(), f'analytics-{fingerprint[:16]}.pickle')
+
+def load_or_build_analytics(map_func: Callable = map, changed: Optional[List[str]] = None) -> bool:
+    """
+    Load the analytical views from the snapshot of the current data files, or
+    build them (refresh only the changed files, if given) and write that snapshot.
+    This runs under a file lock, so when several workers start together exactly
+    one scans the data and the rest load its result. Returns whether this
+    process scanned.
+    """
+    snapshot_dir = _manifest_dir()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with shared_index.build_lock(os.path.join(snapshot_dir, 'analytics')):
+        path = analytics_snapshot_path()
+        if analytics_views.load(path):
+            return False
+        if changed is None:
+            analytics_views.build(data_dir, map_func)
+        else:
+            analytics_views.refresh(data_dir, changed)
+        # Only a complete snapshot of data that did not change during the scan is shared
+        if all(view.ready for view, _ in ANALYTICS_VIEWS) and analytics_snapshot_path() == path:
+            try:
+                analytics_views.save(path)
+                for filename in os.listdir(snapshot_dir):
+                    if filename.startswith('analytics-') and os.path.join(snapshot_dir, filename) != path:
+                        os.remove(os.path.join(snapshot_dir, filename))
+            except OSError as e:
+                print(f"Saving analytical views snapshot failed: {e!r}")
+    return True
+
+async def build_analytics() -> None:
+    """
+    Build the analytical views in one pass over their files, scanned in parallel
+    worker processes, or load them if another uvicorn worker already did. A view
+    that fails is marked failed; the others still build.
+    """
+    # Its processes are only spawned by the one worker that ends up scanning
+    pool = _process_pool(os.cpu_count() or 1)
+    started = time.perf_counter()
+    try:
+        scanned = await anyio.to_thread.run_sync(load_or_build_analytics, pool.map, abandon_on_cancel=True)
+    except Exception as e:
+        # The scans could not run at all (e.g. a broken worker pool)
+        for view, _ in ANALYTICS_VIEWS:
+            view.error = repr(e)
+        print(f"Building analytical views failed: {e!r}")
+        return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    built = [view.name for view, _ in ANALYTICS_VIEWS if view.ready]
+    action = 'Built' if scanned else 'Loaded'
+    print(f"{action} {', '.join(built) or 'no'} views in {time.perf_counter() - started:.1f}s")
+
+def report_task_failure(task: asyncio.Task) -> None:
+    """Done callback logging the exception of a background startup task"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     # Startup
+    global data_manifest, sqlite_store
+    rebuild_task = None
+    sqlite_task = None
+    analytics_task = None
     print("MIMIC-IV FHIR R4 API Starting...")
     print(f"Data directory: {data_dir}")
     if not os.path.exists(data_dir):
         print(f"WARNING: Data directory not found: {data_dir}")
+    elif INDEX_FILE:
+        # Shared index: built once (by a pre-start step or the first worker), mapped by all
+        print(f"Loading shared index: {INDEX_FILE}")
+        load_shared_index(INDEX_FILE)
+        print(f"Mapped id index for {len(resource_id_index)} resource types, line counts for {len(file_line_counts)} files")
     else:
         print("MIMIC-IV FHIR data files available - will be read on-demand")
-        # Pre-cache line counts for all files
-        print("Pre-caching file line counts for optimized counting...")
-        for resource_type, filenames in FILE_MAPPINGS.items():
-            for filename in filenames:
-                filepath = os.path.join(data_dir, filename)
-                if os.path.exists(filepath):
-                    with open(filepath, 'r') as f:
-                        count = sum(1 for line in f if line.strip())
-                        file_line_counts[filename] = count
-                        print(f"  - {filename}: {count:,} resources")
-        print(f"Cached line counts for {len(file_line_counts)} files")
+        # Line counts come from the manifest; only changed files are rescanned, in the background
+        data_manifest = DataManifest(_manifest_dir())
+        stale = await run_in_threadpool(load_line_counts)
+        print(f"Loaded line counts for {len(file_line_counts)} files from {data_manifest.path}")
+        if stale:
+            print(f"Rebuilding {len(stale)} changed files in the background")
+            rebuild_task = asyncio.create_task(rebuild_stale_files(stale), name="rebuild")
+            rebuild_task.add_done_callback(report_task_failure)
+    # Last-Modified of search responses, and the If-Modified-Since reference
+    update_dataset_last_modified()
+    if STORAGE_ENGINE == 'sqlite' and os.path.exists(data_dir):
+        # Searches fall back to NDJSON scans until changed files are loaded (by
+        # whichever worker takes the build lock first, or a `python storage.py` pre-start)
+        sqlite_store = SQLiteStore(SQLITE_PATH or os.path.join(_manifest_dir(), 'resources.db'))
+        sqlite_task = asyncio.create_task(load_sqlite_store(), name="sqlite-load")
+        sqlite_task.add_done_callback(report_task_failure)
+    if DISK_CACHE_PATH:
+        # Entries written for a different version of the data files are discarded
+        open_disk_cache(shared_index.dataset_fingerprint(data_dir, FILE_MAPPINGS))
+        print(f"Persistent cache tier enabled: {DISK_CACHE_PATH}")
+
+    # Reclaim expired cache entries in the background
+    expiry_sweeper.start()
+
+    # Precompute analytical views off the request path
+    if ANALYTICS_ENABLED and os.path.exists(data_dir):
+        analytics_task = asyncio.create_task(build_analytics(), name="analytics")
+        analytics_task.add_done_callback(report_task_failure)
+
+    # Pick up refreshed data files without a restart
+    data_watcher = None
+    if WATCH_INTERVAL > 0 and os.path.exists(data_dir):
+        watched = [filename for filenames in FILE_MAPPINGS.values() for filename in filenames]
+        data_watcher = DataWatcher(data_dir, watched, apply_data_changes, interval=WATCH_INTERVAL)
+        data_watcher.start()
+
+    # Replay popular queries once startup has finished
+    warm_task = None
+    if query_log is not None and os.path.exists(data_dir):
+        warm_task = asyncio.create_task(warm_caches(query_log.top(WARM_TOP_N)))
+    else:
+        warmup_state["status"] = "ready"
     yield
     # Shutdown
     print("MIMIC-IV FHIR R4 API Shutting down...")
+    if warm_task is not None:
+        warm_task.cancel()
+    if rebuild_task is not None:
+        rebuild_task.cancel()
+    if sqlite_task is not None:
+        sqlite_task.cancel()
+        sqlite_store.stop()
+    if analytics_task is not None:
+        analytics_task.cancel()
+    expiry_sweeper.stop()
+    if data_watcher is not None:
+        data_watcher.stop()
+    if query_log is not None:
+        await run_in_threadpool(query_log.flush)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -708,6 +1645,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# gzip/brotli for responses not already served from a pre-compressed cached body
+app.add_middleware(CompressionMiddleware)
+
 # Enable CORS for browser testing
 app.add_middleware(
     CORSMiddleware,
@@ -717,6 +1657,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def is_admin(request: Request) -> bool:
+    """Check the request's X-Admin-Token against FHIR_ADMIN_TOKEN (unset = nobody is admin)"""
+    token = request.headers.get("X-Admin-Token")
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+def _debug_mode(request: Request) -> Optional[str]:
+    """Requested debug mode ("timing" or "profile") from the X-Debug header or _debug flag, for admins only"""
+    mode = request.headers.get("X-Debug") or request.query_params.get("_debug")
+    if mode not in ("timing", "profile") or not is_admin(request):
+        return None
+    return mode
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Trace FHIR resource interactions and fold their timings into /metrics.
+    Admins can ask for the trace back as Server-Timing, plus a profile of the request.
+    """
+    segments = request.url.path.strip('/').split('/')
+    if segments[0] not in FILE_MAPPINGS:
+        return await call_next(request)
+
+    debug = _debug_mode(request)
+    trace = QueryTrace(segments[0], profile=debug == "profile")
+    token = current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    elapsed = time.perf_counter() - start
+    if len(segments) > 1:
+        interaction = segments[-1] if segments[-1].startswith('$') else "read"
+    else:
+        interaction = "search"
+    metrics.observe_request(trace, interaction, elapsed)
+
+    if debug:
+        response.headers["Server-Timing"] = metrics.server_timing(trace, elapsed)
+        if debug == "profile":
+            profile_id = await run_in_threadpool(metrics.save_profile, trace)
+            response.headers["X-Debug-Profile"] = f"/debug/profile/{profile_id}"
+    return response
+
 # FHIR-compliant error handling
 @app.exception_handler(HTTPException)
 async def fhir_exception_handler(request: Request, exc: HTTPException):
@@ -729,6 +1713,10 @@ async def fhir_exception_handler(request: Request, exc: HTTPException):
         issue_code = "invalid"
     elif exc.status_code == 401:
         issue_code = "security"
+    elif exc.status_code == 403:
+        issue_code = "forbidden"
+    elif exc.status_code == 503:
+        issue_code = "transient"
 
     return JSONResponse(
         status_code=exc.status_code,
@@ -752,15 +1740,400 @@ async def root(response: Response):
         "link": [{"relation": "self", "url": "/metadata"}]
     }
 
+def _batch_status(status_code: int) -> str:
+    """Format a Bundle.entry.response.status value"""
+    return f"{status_code} {HTTPStatus(status_code).phrase}"
+
+def _batch_error_entry(status_code: int, diagnostics: str) -> Dict:
+    """Create a batch-response entry for a failed request"""
+    issue_code = "not-found" if status_code == 404 else "invalid" if status_code == 400 else "not-supported"
+    return {
+        "response": {
+            "status": _batch_status(status_code),
+            "outcome": create_operation_outcome("error", issue_code, diagnostics)
+        }
+    }
+
+def _make_subrequest(request: Request, path: str, query_string: str) -> Request:
+    """Create a GET request for a batch entry, sharing the outer request's host and headers"""
+    scope = dict(request.scope)
+    scope.update({
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode('utf-8'),
+        "query_string": query_string.encode('utf-8')
+    })
+    return Request(scope)
+
+def _run_batch_search(resource_type: str, subrequest: Request) -> Dict:
+    """Execute one batch search entry, returning its batch-response entry"""
+    try:
+        bundle = fhir_search(resource_type, subrequest)
+    except HTTPException as exc:
+        return _batch_error_entry(exc.status_code, str(exc.detail))
+    if not isinstance(bundle, dict):
+        return _batch_error_entry(400, "Only JSON search results are supported in a batch")
+    return {
+        "resource": bundle,
+        "response": {"status": _batch_status(200), "etag": representation_etag(content_etag(serialize_json(bundle)), None)}
+    }
+
+@app.post("/")
+async def fhir_batch(request: Request):
+    """
+    FHIR R4 batch/transaction interaction for read-only GET entries.
+
+    Reads are grouped by resource type and resolved with one id-index lookup per
+    type; identical searches run once. Lookups execute concurrently in the worker
+    thread pool and the results come back as a batch-response Bundle.
+    """
+    try:
+        bundle = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be a JSON Bundle")
+
+    if not isinstance(bundle, dict) or bundle.get('resourceType') != 'Bundle':
+        raise HTTPException(status_code=400, detail="Request body must be a Bundle resource")
+    bundle_type = bundle.get('type')
+    if bundle_type not in ('batch', 'transaction'):
+        raise HTTPException(status_code=400, detail=f"Unsupported Bundle.type: {bundle_type}")
+
+    entries = bundle.get('entry', [])
+    base_url = get_base_url(request)
+    results: List[Optional[Dict]] = [None] * len(entries)
+
+    # Classify entries into reads (shared per-type id lookups) and searches
+    reads_by_type: Dict[str, List[tuple]] = {}
+    searches: Dict[tuple, List[int]] = {}
+    for position, entry in enumerate(entries):
+        entry_request = entry.get('request', {}) if isinstance(entry, dict) else {}
+        method = str(entry_request.get('method', '')).upper()
+        if method != 'GET':
+            results[position] = _batch_error_entry(405, f"Method {method or '(missing)'} not supported in batch")
+            continue
+
+        # Accept relative URLs as well as absolute URLs against this server's base
+        url = urlsplit(str(entry_request.get('url', '')))
+        path = url.path
+        base_path = urlsplit(base_url).path.rstrip('/')
+        if base_path and path.startswith(f"{base_path}/"):
+            path = path[len(base_path):]
+        parts = [part for part in path.split('/') if part]
+        if not parts or len(parts) > 2:
+            results[position] = _batch_error_entry(400, f"Unsupported request URL: {entry_request.get('url')}")
+        elif parts[0] not in FILE_MAPPINGS:
+            results[position] = _batch_error_entry(404, f"Resource type {parts[0]} not supported")
+        elif len(parts) == 2:
+            reads_by_type.setdefault(parts[0], []).append((position, parts[1]))
+        else:
+            searches.setdefault((parts[0], url.query), []).append(position)
+
+    # Run one id lookup per resource type and one scan per distinct search concurrently
+    read_types = list(reads_by_type)
+    search_keys = list(searches)
+    lookups = await asyncio.gather(
+        *(run_in_threadpool(get_resources_by_ids, resource_type, [rid for _, rid in reads_by_type[resource_type]])
+          for resource_type in read_types),
+        *(run_in_threadpool(_run_batch_search, resource_type, _make_subrequest(request, f"/{resource_type}", query))
+          for resource_type, query in search_keys)
+    )
+
+    for resource_type, found in zip(read_types, lookups[:len(read_types)]):
+        for position, resource_id in reads_by_type[resource_type]:
+            resource = found.get(resource_id)
+            if resource is None:
+                results[position] = _batch_error_entry(404, f"{resource_type}/{resource_id} not found")
+                continue
+            results[position] = {
+                "fullUrl": f"{base_url}/{resource_type}/{resource_id}",
+                "resource": resource,
+                "response": {
+                    "status": _batch_status(200), "etag": representation_etag(content_etag(serialize_json(resource)), None)
+                }
+            }
+
+    for search_key, entry_result in zip(search_keys, lookups[len(read_types):]):
+        for position in searches[search_key]:
+            results[position] = entry_result
+
+    # A transaction succeeds or fails as a whole
+    if bundle_type == 'transaction':
+        for result in results:
+            status = result["response"]["status"]
+            if not status.startswith("200"):
+                raise HTTPException(status_code=int(status.split()[0]), detail=result["response"]["outcome"]["issue"][0]["diagnostics"])
+
+    return {
+        "resourceType": "Bundle",
+        "type": f"{bundle_type}-response",
+        "entry": results
+    }
+
+@app.get("/ready")
+async def readiness(response: Response):
+    """Readiness probe - 503 until startup cache warming has finished (or given up)"""
+    if warmup_state["status"] not in ("ready", "failed"):
+        response.status_code = 503
+    return warmup_state
+
 @app.get("/cache/stats")
 async def get_cache_stats():
     """Get cache statistics"""
-    return get_cache_statistics()
+    # Remote and disk-backed caches answer over the network or from SQLite
+    return await run_in_threadpool(get_cache_statistics)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics: latency, stage timings, scan sizes, cache and worker pool usage"""
+    # Worker pool usage must be read on the event loop thread
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    pool = {
+        "fhir_threadpool_max_threads": ("Worker pool size", limiter.total_tokens),
+        "fhir_threadpool_busy_threads": ("Worker threads currently running a task", limiter.borrowed_tokens),
+        "fhir_threadpool_queued_tasks": ("Tasks waiting for a worker thread", limiter.statistics().tasks_waiting),
+    }
+
+    # Cache stats may need a round trip to the shared cache server
+    statistics = await run_in_threadpool(get_cache_statistics)
+    caches = {name: stats for name, stats in statistics.items() if isinstance(stats, dict)}
+    cache_metrics = {
+        "fhir_cache_hits_total": ("Cache hits", "counter", "hits"),
+        "fhir_cache_misses_total": ("Cache misses", "counter", "misses"),
+        "fhir_cache_evictions_total": ("Entries evicted to stay within max_size", "counter", "evictions"),
+        "fhir_cache_entries": ("Entries currently cached", "gauge", "size"),
+        "fhir_cache_memory_bytes": ("Approximate bytes held by cached values in this process", "gauge", "memory_bytes"),
+    }
+
+    sections = [metrics.REGISTRY.render()]
+    for name, (help_text, metric_type, field) in cache_metrics.items():
+        values = {(cache_name,): stats.get(field) for cache_name, stats in caches.items()}
+        sections.append(metrics.render_values(name, help_text, metric_type, values, ("cache",)))
+    for name, (help_text, value) in pool.items():
+        sections.append(metrics.render_values(name, help_text, "gauge", {(): value}))
+    return PlainTextResponse("\n".join(sections) + "\n", media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profile/{profile_id}")
+async def debug_profile(profile_id: str, request: Request):
+    """Profile captured for a request made with _debug=profile (admin endpoint)"""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    profile = metrics.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return PlainTextResponse(profile)
 
 @app.post("/cache/clear")
-async def clear_cache():
-    """Clear all caches (admin endpoint)"""
-    return clear_all_caches()
+async def clear_cache(
+    resource_type: Optional[str] = Query(None, alias="type"),
+    patient: Optional[str] = None
+):
+    """
+    Clear caches (admin endpoint).
+    With type and/or patient, only entries tagged with all of them are cleared.
+    """
+    tags = []
+    if resource_type:
+        tags.append(type_tag(resource_type))
+    if patient:
+        tags.append(patient_tag(patient.split('/')[-1]))
+    # Remote and disk-backed caches clear over the network or in SQLite
+    if tags:
+        return await run_in_threadpool(invalidate_caches, *tags)
+    return await run_in_threadpool(clear_all_caches)
+
+# ============================================================================
+# Analytics - precomputed views served from memory
+# ============================================================================
+
+def _date_range(value: str) -> tuple:
+    """First and last day ordinal covered by a YYYY, YYYY-MM or YYYY-MM-DD value"""
+    try:
+        if len(value) == 4:
+            return date(int(value), 1, 1).toordinal(), date(int(value), 12, 31).toordinal()
+        if len(value) == 7:
+            first = date.fromisoformat(f"{value}-01")
+            following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+            return first.toordinal(), following.toordinal() - 1
+        day = date.fromisoformat(value[:10]).toordinal()
+        return day, day
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+def parse_date_bounds(values: List[str]) -> tuple:
+    """Inclusive (start_day, end_day) ordinals from FHIR date parameters such as ge2150-01"""
+    start_day = end_day = None
+    for value in values:
+        prefix, text = (value[:2], value[2:]) if value[:2] in ('eq', 'ge', 'gt', 'le', 'lt') else ('eq', value)
+        first, last = _date_range(text)
+        lower = {'eq': first, 'ge': first, 'gt': last + 1}.get(prefix)
+        upper = {'eq': last, 'le': last, 'lt': first - 1}.get(prefix)
+        if lower is not None:
+            start_day = lower if start_day is None else max(start_day, lower)
+        if upper is not None:
+            end_day = upper if end_day is None else min(end_day, upper)
+    return start_day, end_day
+
+observation_stats = ObservationStats()
+patient_risk = PatientRisk()
+patient_summary = PatientSummary()
+
+# Views built at startup and refreshed per changed file, with the resource types they read
+ANALYTICS_VIEWS = [
+    (observation_stats, ('Observation',)),
+    (patient_risk, ('Patient', 'Observation', 'Condition')),
+    (patient_summary, tuple(FILE_MAPPINGS)),
+]
+analytics_views = ViewSet([
+    (view, [filename for resource_type in resource_types for filename in FILE_MAPPINGS[resource_type]])
+    for view, resource_types in ANALYTICS_VIEWS
+])
+
+def require_view(view: SegmentedView, building: str) -> None:
+    """503 while a view is being built, 500 if building it failed"""
+    if view.ready:
+        return
+    if view.error is not None:
+        raise HTTPException(status_code=500, detail=f"The {view.name} view could not be built: {view.error}")
+    raise HTTPException(status_code=503, detail=building)
+
+@app.get("/api/patient-intelligence")
+async def patient_intelligence():
+    """
+    Patient risk intelligence: every patient scored from their critical/abnormal
+    interpretation codes and conditions, highest risk first. Precomputed in one
+    pass at startup and kept current as data files change.
+    """
+    require_view(patient_risk, "Patient risk scores are still being computed")
+    return patient_risk.combined
+
+@app.get("/patients-summary")
+async def get_patients_summary(
+    _count: int = Query(100, ge=0),
+    _offset: int = Query(0, ge=0),
+    _sort: str = "-observationCount"
+):
+    """
+    Patient list for selection: exact resource counts per type, first and last
+    activity and most frequent conditions for every patient. Paginated with
+    _count/_offset and sorted by _sort (prefix - for descending).
+    """
+    if _sort.lstrip('-') not in SUMMARY_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"_sort must be one of {', '.join(SUMMARY_SORT_FIELDS)} (prefix - for descending)")
+    require_view(patient_summary, "Patient summaries are still being computed")
+    return patient_summary.page(sort=_sort, offset=_offset, count=min(_count, 1000))
+
+# Defined ahead of /{resource_type}/{resource_id}, which would otherwise match it as a read
+@app.get("/Observation/$stats")
+async def observation_value_stats(
+    code: Optional[str] = None,
+    patient: Optional[str] = None,
+    subject: Optional[str] = None,
+    date_params: Optional[List[str]] = Query(None, alias="date"),
+    group_by: str = Query("patient,code", alias="group-by"),
+    bucket: str = "month",
+    percentiles: str = "5,25,50,75,95"
+):
+    """
+    Count, min, max, mean and percentiles of Observation valueQuantity values,
+    grouped by any of patient, code and period (a day/week/month/year bucket).
+    Computed from an in-memory columnar copy of the values.
+    """
+    fields = [field.strip() for field in group_by.split(',') if field.strip()]
+    if any(field not in GROUP_FIELDS for field in fields) or len(set(fields)) != len(fields):
+        raise HTTPException(status_code=400, detail=f"group-by must be a list of {', '.join(GROUP_FIELDS)}")
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of {', '.join(BUCKETS)}")
+    try:
+        points = [float(p) for p in percentiles.split(',') if p.strip()]
+    except ValueError:
+        points = [-1.0]
+    if any(not 0 <= p <= 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be numbers between 0 and 100")
+    start_day, end_day = parse_date_bounds(date_params or [])
+
+    require_view(observation_stats, "Observation statistics are still being built")
+
+    subject_param = subject or patient
+    return await run_in_threadpool(
+        observation_stats.query,
+        patient=subject_param.split('/')[-1] if subject_param else None,
+        code=code.split('|')[-1] if code else None,
+        start_day=start_day,
+        end_day=end_day,
+        group_by=fields,
+        bucket=bucket,
+        percentiles=points
+    )
+
+# ============================================================================
+# Streaming - NDJSON read without blocking the event loop
+# ============================================================================
+
+def _patient_line_filter(patient_id: str) -> bytes:
+    """Bytes every line referencing the patient contains, checked before parsing"""
+    return f'"Patient/{patient_id}"'.encode('utf-8')
+
+async def stream_search_ndjson(
+    resource_type: str,
+    search_params: FHIRSearchParameters,
+    limit: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Every match of a search (up to limit) as NDJSON, read and sent a chunk at a time"""
+    line_filter = None
+    patient_param = search_params.params.get('patient') or search_params.params.get('subject')
+    if patient_param and resource_type != 'Patient':
+        line_filter = _patient_line_filter(patient_param.split('/')[-1])
+    search_filter = create_search_filter(resource_type, search_params)
+    async for resource in read_many(data_dir, FILE_MAPPINGS[resource_type], search_filter, line_filter, limit):
+        yield serialize_json(resource) + b'\n'
+
+# Resource types outside the patient compartment
+_NON_COMPARTMENT_TYPES = ('Patient', 'Organization', 'Location', 'Medication')
+
+@app.get("/Patient/{patient_id}/$everything")
+async def patient_everything(patient_id: str, request: Request, _type: Optional[str] = None):
+    """
+    Patient $everything: the patient and every resource whose subject is the
+    patient (optionally only the types listed in _type), streamed as a
+    searchset Bundle while the files are read.
+    """
+    patients = await run_in_threadpool(get_resources_by_ids, 'Patient', [patient_id])
+    if patient_id not in patients:
+        raise HTTPException(status_code=404, detail=f"Patient/{patient_id} not found")
+
+    resource_types = [t for t in FILE_MAPPINGS if t not in _NON_COMPARTMENT_TYPES]
+    if _type:
+        requested = [t.strip() for t in _type.split(',') if t.strip()]
+        unknown = [t for t in requested if t not in FILE_MAPPINGS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unsupported _type: {', '.join(unknown)}")
+        resource_types = [t for t in resource_types if t in requested]
+
+    base_url = get_base_url(request)
+    reference = f"Patient/{patient_id}"
+    line_filter = _patient_line_filter(patient_id)
+
+    def entry(resource: Dict) -> bytes:
+        return serialize_json({
+            "fullUrl": f"{base_url}/{resource.get('resourceType')}/{resource.get('id')}",
+            "resource": resource,
+            "search": {"mode": "match"}
+        })
+
+    async def body() -> AsyncIterator[bytes]:
+        header = {"resourceType": "Bundle", "type": "searchset", "link": [{"relation": "self", "url": str(request.url)}]}
+        yield serialize_json(header)[:-1] + b',"entry":[' + entry(patients[patient_id])
+        for resource_type in resource_types:
+            async for resource in read_many(
+                data_dir,
+                FILE_MAPPINGS[resource_type],
+                lambda resource: (resource.get('subject') or {}).get('reference') == reference,
+                line_filter
+            ):
+                yield b',' + entry(resource)
+        yield b']}'
+
+    return StreamingResponse(buffered(body()), media_type="application/fhir+json")
 
 @app.get("/metadata")
 async def capability_statement(response: Response):
@@ -787,7 +2160,17 @@ async def capability_statement(response: Response):
                         {"name": "_count", "type": "number", "documentation": "Number of resources to return (default: 100, max: 1000)"},
                         {"name": "_format", "type": "token", "documentation": "Specify response format (json, html)"},
                         {"name": "_summary", "type": "token", "documentation": "Return summary (count = return only Bundle.total)"}
-                    ] + _get_resource_search_params(resource_type)
+                    ] + _get_resource_search_params(resource_type),
+                    "searchInclude": [
+                        f"{resource_type}:{param}"
+                        for param in REFERENCE_SEARCH_PARAMS.get(resource_type, {})
+                    ],
+                    "searchRevInclude": [
+                        f"{source_type}:{param}"
+                        for source_type, params in REFERENCE_SEARCH_PARAMS.items()
+                        for param, (_, target_type) in params.items()
+                        if target_type == resource_type
+                    ]
                 }
                 for resource_type in FILE_MAPPINGS.keys()
             ]
@@ -857,82 +2240,105 @@ def _get_resource_search_params(resource_type: str) -> List[Dict]:
 # FHIR R4 Endpoints - Clean Implementation
 # ============================================================================
 
+SEARCH_CACHE_CONTROL = "public, max-age=3600"  # 1 hour cache for searches
+READ_CACHE_CONTROL = "public, max-age=86400"  # 24 hours for individual resources
+
 # Generic FHIR search endpoint - handles all resource types
 @app.get("/{resource_type}")
-async def fhir_resource_search(resource_type: str, request: Request, response: Response):
+async def fhir_resource_search(resource_type: str, request: Request):
     """FHIR R4 search operation for any resource type"""
     if resource_type not in FILE_MAPPINGS:
         raise HTTPException(status_code=404, detail=f"Resource type {resource_type} not supported")
 
-    bundle = fhir_search(resource_type, request)
-
-    # Add ETag header for cache validation
-    if isinstance(bundle, dict):
-        etag = generate_etag(bundle)
-        response.headers["ETag"] = f'W/"{etag}"'
-        response.headers["Cache-Control"] = "public, max-age=3600"  # 1 hour cache for searches
-
-        # Handle conditional requests
-        if_none_match = request.headers.get("If-None-Match")
-        if if_none_match and if_none_match.strip('W/"').strip('"') == etag:
-            response.status_code = 304  # Not Modified
-            return None
-
-    return bundle
+    # Record query popularity for cache warming on the next boot
+    if query_log is not None:
+        query_log.record(f"{resource_type}?{urlencode(normalize_search_params(resource_type, request.query_params))}")
+
+    # Bulk NDJSON: every match, streamed from non-blocking reads
+    if '_format' in request.query_params:
+        _, search_params = parse_search_request(resource_type, request)
+        if search_params.format == "ndjson" and search_params.summary != "count":
+            # An explicit _count caps the stream as given, not rounded up to a page bucket
+            limit = FHIRSearchParameters({'_count': request.query_params.get('_count')}).count
+            return StreamingResponse(
+                buffered(stream_search_ndjson(resource_type, search_params, limit)), media_type="application/fhir+ndjson"
+            )
+
+    # Revalidation is answered from the stored validator for this exact URL (or the
+    # dataset's mtime for If-Modified-Since), before any scan
+    body_key = ("search", get_base_url(request), str(request.url))
+    debugging = _debug_mode(request) is not None
+    if not debugging:
+        not_modified = await answer_conditional(request, body_key, SEARCH_CACHE_CONTROL)
+        if not_modified is not None:
+            return not_modified
+
+    # Then the serialized Bundle (and its compressed variants)
+    entry = body_cache.get(body_key) if not debugging else None
+
+    if entry is None:
+        # Scan in the worker pool so concurrent requests don't block the event loop
+        bundle = await run_in_threadpool(metrics.profiled_call, fhir_search, resource_type, request)
+        if not isinstance(bundle, dict):
+            return bundle
+
+        entry = encode_json_body(bundle)
+        _, search_params = parse_search_request(resource_type, request)
+        tags = _search_tags(resource_type, search_params)
+        body_cache.set(body_key, entry, tags=tags)
+        # validator_cache may be remote or disk-backed
+        await run_in_threadpool(validator_cache.set, body_key, body_validator(entry), tags=tags)
+
+    not_modified = not_modified_response(request, body_validator(entry), SEARCH_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
+    return await encoded_response(entry, request, SEARCH_CACHE_CONTROL)
 
 # Generic FHIR read endpoint - get resource by ID
 @app.get("/{resource_type}/{resource_id}")
-async def fhir_resource_read(resource_type: str, resource_id: str, request: Request, response: Response):
+async def fhir_resource_read(resource_type: str, resource_id: str, request: Request):
     """FHIR R4 read operation - get single resource by ID"""
     if resource_type not in FILE_MAPPINGS:
         raise HTTPException(status_code=404, detail=f"Resource type {resource_type} not supported")
 
-    # Try cache first for individual resource
-    cache_key = f"resource:{resource_type}:{resource_id}"
-    cached_resource = resource_cache.get(cache_key)
-
-    if cached_resource:
-        resource = cached_resource
-    else:
-        # Use _id search parameter to find the resource
-        search_params = FHIRSearchParameters({'_id': resource_id})
-        search_filter = create_search_filter(resource_type, search_params)
-
-        # Get the resource - bypass get_fhir_resources_page for efficiency
-        # Direct file reading for single resource by ID
-        resources = []
-        files = FILE_MAPPINGS[resource_type]
-        for filename in files:
-            filepath = os.path.join(data_dir, filename)
-            file_results = read_ndjson_file(filepath, search_filter, 1)
-            if file_results:
-                resources = file_results
-                break
-
-        if not resources:
-            raise HTTPException(status_code=404, detail=f"{resource_type}/{resource_id} not found")
-
-        resource = resources[0]
-        # Cache the individual resource with specific key
-        resource_cache.set(cache_key, resource)
+    # Revalidation is answered from the stored validator (or the dataset's mtime), before any read
+    body_key = ("read", resource_type, resource_id)
+    not_modified = await answer_conditional(request, body_key, READ_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
 
-    # Add ETag header
-    etag = generate_etag(resource)
-    response.headers["ETag"] = f'W/"{etag}"'
-    response.headers["Cache-Control"] = "public, max-age=86400"  # 24 hours for individual resources
+    # Then the serialized resource (and its compressed variants)
+    entry = body_cache.get(body_key)
 
-    # Handle conditional requests
-    if_none_match = request.headers.get("If-None-Match")
-    if if_none_match and if_none_match.strip('W/"').strip('"') == etag:
-        response.status_code = 304  # Not Modified
-        return None
+    if entry is None:
+        # Then the parsed resource cache (which may be remote or disk-backed)
+        cache_key = ("resource", resource_type, resource_id)
+        cached_resource = await run_in_threadpool(resource_cache.get, cache_key)
 
-    # Add Last-Modified header if available
-    last_modified = get_last_modified(resource)
-    if last_modified:
-        response.headers["Last-Modified"] = last_modified
-
-    return resource
+        if cached_resource:
+            resource = cached_resource
+        else:
+            # Direct read through the id index (also caches the resource);
+            # concurrent misses for the same resource share one lookup
+            resources = await run_in_threadpool(
+                metrics.profiled_call, single_flight.do, cache_key, get_resources_by_ids, resource_type, [resource_id]
+            )
+
+            if resource_id not in resources:
+                raise HTTPException(status_code=404, detail=f"{resource_type}/{resource_id} not found")
+
+            resource = resources[resource_id]
+
+        entry = encode_json_body(resource, get_last_modified(resource))
+        tags = _resource_tags(resource_type, resource)
+        body_cache.set(body_key, entry, tags=tags)
+        # validator_cache may be remote or disk-backed
+        await run_in_threadpool(validator_cache.set, body_key, body_validator(entry), tags=tags)
+
+    not_modified = not_modified_response(request, body_validator(entry), READ_CACHE_CONTROL)
+    if not_modified is not None:
+        return not_modified
+    return await encoded_response(entry, request, READ_CACHE_CONTROL)
 
 if __name__ == "__main__":
     print("\n" + "="*60)
@@ -0,0 +1,217 @@
+"""
+Sidecar manifest of per-file line counts and id index segments
+Startup reads line counts from the manifest instead of scanning every data
+file; each entry is keyed by the file's size, mtime and a sampled content hash,
+so only files that were replaced or changed need to be scanned again.
+DataWatcher reports files that change while the server runs.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared_index import file_signature
+
+MANIFEST_VERSION = 1
+
+# Bytes hashed from each end of a file; catches files replaced with the same size and mtime
+SAMPLE_BYTES = 1 << 20
+
+_ID_PREFIX = b'{"id": "'
+
+def extract_resource_id(line: bytes) -> Optional[str]:
+    """Extract the resource id from an NDJSON line, avoiding a JSON parse when possible"""
+    if line.startswith(_ID_PREFIX):
+        end = line.find(b'"', len(_ID_PREFIX))
+        if end != -1:
+            return line[len(_ID_PREFIX):end].decode('utf-8')
+    if not line.strip():
+        return None
+    try:
+        return json.loads(line).get('id')
+    except json.JSONDecodeError:
+        return None
+
+def file_key(filepath: str) -> Optional[List]:
+    """Size, mtime and sampled content hash of a data file, or None if it is missing"""
+    try:
+        stat = os.stat(filepath)
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            digest.update(f.read(SAMPLE_BYTES))
+            if stat.st_size > 2 * SAMPLE_BYTES:
+                f.seek(-SAMPLE_BYTES, os.SEEK_END)
+                digest.update(f.read(SAMPLE_BYTES))
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+
+def scan_data_file(filepath: str) -> Tuple[int, Dict[str, int]]:
+    """
+    Scan one NDJSON file, counting resources and indexing id -> byte offset
+    (first occurrence wins). Module-level so it can run in a worker process.
+    """
+    ids = {}
+    count = 0
+    offset = 0
+    with open(filepath, 'rb') as f:
+        for line in f:
+            resource_id = extract_resource_id(line)
+            if resource_id is not None:
+                count += 1
+                if resource_id not in ids:
+                    ids[resource_id] = offset
+            offset += len(line)
+    return count, ids
+
+class DataManifest:
+    """Persisted line counts and id segments for the files in one data directory"""
+
+    def __init__(self, directory: str):
+        """
+        Initialize manifest
+
+        Args:
+            directory: Where the manifest and its id segment files are kept
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, 'manifest.json')
+        self.entries: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        """Read the manifest from disk; a missing or outdated manifest is treated as empty"""
+        try:
+            with open(self.path, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.entries = manifest.get('files', {})
+
+    def lookup(self, filename: str, key: Optional[List]) -> Optional[Dict]:
+        """Get a file's entry if it was recorded for this exact key"""
+        entry = self.entries.get(filename)
+        if entry is None or key is None or entry.get('key') != key:
+            return None
+        return entry
+
+    def _segment_path(self, filename: str) -> str:
+        return os.path.join(self.directory, f"{filename}.ids.json")
+
+    def load_segment(self, filename: str, key: Optional[List]) -> Optional[Dict[str, int]]:
+        """Load a file's id -> offset segment if it is still current"""
+        if self.lookup(filename, key) is None:
+            return None
+        try:
+            with open(self._segment_path(filename), 'r') as f:
+                segment = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if segment.get('key') != key:
+            return None
+        return segment['ids']
+
+    def record(self, filename: str, key: Optional[List], lines: int, ids: Dict[str, int]) -> None:
+        """Persist a scanned file's line count and id segment"""
+        if key is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(self._segment_path(filename), {'key': key, 'ids': ids})
+            with self.lock:
+                self.entries[filename] = {'key': key, 'lines': lines}
+                _write_json(self.path, {'version': MANIFEST_VERSION, 'files': self.entries})
+        except OSError as e:
+            print(f"WARNING: Could not update data manifest {self.path}: {e}")
+
+def _write_json(path: str, content: Dict) -> None:
+    """Write JSON next to its destination and rename it into place"""
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+class DataWatcher:
+    """
+    Background thread that polls the data files' size and mtime and reports the
+    ones that changed. A file is reported once its signature has been the same
+    for two polls in a row, so files still being copied in are not scanned half-written.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        filenames: List[str],
+        on_change: Callable[[List[str]], None],
+        interval: float = 5.0
+    ):
+        """
+        Initialize watcher
+
+        Args:
+            directory: Data directory
+            filenames: Files to watch (they may not exist yet)
+            on_change: Called from the watcher thread with the changed (or removed) files
+            interval: Seconds between polls
+        """
+        self.directory = directory
+        self.filenames = list(filenames)
+        self.on_change = on_change
+        self.interval = interval
+        self.changes = 0
+        self._known = self._signatures()
+        self._pending: Dict[str, Optional[List[int]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _signatures(self) -> Dict[str, Optional[List[int]]]:
+        return {
+            filename: file_signature(os.path.join(self.directory, filename))
+            for filename in self.filenames
+        }
+
+    def start(self) -> None:
+        """Start polling in a daemon thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="data-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the watcher thread and wait for an in-progress refresh to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll_once(self) -> List[str]:
+        """Check every file once and hand settled changes to on_change"""
+        settled = []
+        for filename, signature in self._signatures().items():
+            if signature == self._known.get(filename):
+                self._pending.pop(filename, None)
+            elif filename in self._pending and self._pending[filename] == signature:
+                settled.append(filename)
+            else:
+                self._pending[filename] = signature
+
+        if settled:
+            try:
+                self.on_change(settled)
+            except Exception as e:
+                # Leave them pending; the next poll retries
+                print(f"Data refresh failed for {', '.join(settled)}: {e}")
+                return []
+            for filename in settled:
+                self._known[filename] = self._pending.pop(filename)
+            self.changes += len(settled)
+        return settled
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.poll_once()
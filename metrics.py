@@ -0,0 +1,265 @@
+"""
+Prometheus-format metrics for the FHIR API
+Dependency-free histograms and scrape-time gauges/counters rendered in the
+text exposition format, plus a per-request trace of stage timings and
+lines scanned that the search path fills in as it runs
+"""
+
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds, from cached hits (sub-millisecond) to full scans
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Line-count buckets for per-query scan sizes
+LINE_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    """Render a label set, escaping values per the exposition format"""
+    pairs = [
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    """Base class for a named metric with a fixed set of label names"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self.lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self.values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class CallbackMetric(Metric):
+    """Metric whose samples are read from a callback at scrape time"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Tuple[str, ...] = ()
+    ):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self.callback().items()):
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+def render_values(
+    name: str,
+    help: str,
+    type: str,
+    values: Dict[Tuple[str, ...], float],
+    labelnames: Tuple[str, ...] = ()
+) -> str:
+    """Render a one-off snapshot of values read at scrape time"""
+    return CallbackMetric(name, help, type, lambda: values, labelnames).render()
+
+class Registry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+REGISTRY = Registry()
+
+# Content type of the text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'fhir_request_duration_seconds', 'Request latency by resource type and interaction',
+    ('resource_type', 'interaction')
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'fhir_stage_duration_seconds', 'Time spent per request in each processing stage',
+    ('resource_type', 'stage')
+))
+LINES_SCANNED = REGISTRY.register(Histogram(
+    'fhir_query_lines_scanned', 'NDJSON lines read per query', ('resource_type',), LINE_BUCKETS
+))
+LINES_MATCHED = REGISTRY.register(Histogram(
+    'fhir_query_lines_matched', 'NDJSON lines matching the search per query', ('resource_type',), LINE_BUCKETS
+))
+
+# ============================================================================
+# Per-request trace
+# ============================================================================
+
+class QueryTrace:
+    """Stage timings and scan sizes collected while one request is handled"""
+
+    __slots__ = ('resource_type', 'stages', 'lines_scanned', 'lines_matched', 'profile')
+
+    def __init__(self, resource_type: str, profile: bool = False):
+        self.resource_type = resource_type
+        self.stages: Dict[str, float] = {}
+        self.lines_scanned = 0
+        self.lines_matched = 0
+        # Only requests that ask for a profile pay for one
+        self.profile: Optional[cProfile.Profile] = cProfile.Profile() if profile else None
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+# Trace of the request being handled; copied into worker threads by run_in_threadpool
+current_trace: ContextVar[Optional[QueryTrace]] = ContextVar('current_trace', default=None)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a processing stage into the current request's trace"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - start)
+
+def record_scan(lines_scanned: int, lines_matched: int, parse_seconds: float = 0.0) -> None:
+    """Add one file scan's line counts (and JSON parse time) to the current trace"""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    trace.lines_scanned += lines_scanned
+    trace.lines_matched += lines_matched
+    if parse_seconds:
+        trace.add_stage('json_parse', parse_seconds)
+
+def profiled_call(func: Callable, *args, **kwargs):
+    """
+    Call func in the current thread, under the request's profiler if one was requested.
+    Used at the worker-pool boundary, since a profiler only sees its own thread.
+    """
+    trace = current_trace.get()
+    if trace is None or trace.profile is None:
+        return func(*args, **kwargs)
+    trace.profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        trace.profile.disable()
+
+def server_timing(trace: QueryTrace, total_seconds: float) -> str:
+    """Server-Timing header value for a finished request's trace"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.stages.items()]
+    if trace.lines_scanned:
+        entries.append(f'lines;desc="scanned={trace.lines_scanned} matched={trace.lines_matched}"')
+    entries.append(f"total;dur={total_seconds * 1000:.2f}")
+    return ", ".join(entries)
+
+# Recent request profiles, served to admins by id
+MAX_PROFILES = 20
+_profiles: OrderedDict = OrderedDict()
+_profiles_lock = threading.Lock()
+
+def save_profile(trace: QueryTrace, limit: int = 40) -> str:
+    """Store the request's profile as text (top functions by cumulative time) and return its id"""
+    output = io.StringIO()
+    try:
+        stats = pstats.Stats(trace.profile, stream=output)
+    except TypeError:
+        # Nothing ran in the worker pool (e.g. served from cache); see Server-Timing
+        output.write("No worker pool activity was profiled for this request\n")
+    else:
+        stats.sort_stats('cumulative').print_stats(limit)
+
+    profile_id = uuid.uuid4().hex
+    with _profiles_lock:
+        _profiles[profile_id] = output.getvalue()
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+    return profile_id
+
+def get_profile(profile_id: str) -> Optional[str]:
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+def observe_request(trace: QueryTrace, interaction: str, seconds: float) -> None:
+    """Fold a finished request's trace into the histograms"""
+    REQUEST_SECONDS.observe(seconds, resource_type=trace.resource_type, interaction=interaction)
+    for name, stage_seconds in trace.stages.items():
+        STAGE_SECONDS.observe(stage_seconds, resource_type=trace.resource_type, stage=name)
+    if trace.lines_scanned:
+        LINES_SCANNED.observe(trace.lines_scanned, resource_type=trace.resource_type)
+        LINES_MATCHED.observe(trace.lines_matched, resource_type=trace.resource_type)
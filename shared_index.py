@@ -0,0 +1,214 @@
+"""
+Shared, memory-mapped resource index for multi-worker deployments
+Built once before workers start; every worker maps the same file read-only
+so the OS page cache holds a single copy regardless of worker count
+"""
+
+import bisect
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+MAGIC = b'FHIRIDX1'
+_HEADER_LEN = struct.Struct('<I')
+
+class SharedIdTable:
+    """Read-only id -> (filename, offset) lookup over a sorted fixed-width record table"""
+
+    def __init__(self, buffer: mmap.mmap, start: int, count: int, key_width: int, filenames: List[str]):
+        """
+        Initialize table view
+
+        Args:
+            buffer: Memory map of the whole index file
+            start: Byte offset of the first record
+            count: Number of records
+            key_width: Width of the null-padded id field
+            filenames: File names indexed by the record's file number
+        """
+        self.buffer = buffer
+        self.start = start
+        self.count = count
+        self.key_width = key_width
+        self.filenames = filenames
+        self.record = struct.Struct(f'<{key_width}sHQ')
+
+    def _key_at(self, position: int) -> bytes:
+        """Get the padded id of the record at a position"""
+        offset = self.start + position * self.record.size
+        return self.buffer[offset:offset + self.key_width]
+
+    def get(self, resource_id: str, default: Optional[tuple] = None) -> Optional[tuple]:
+        """Look up a resource id with a binary search over the mapped records"""
+        key = resource_id.encode('utf-8')
+        if len(key) > self.key_width or self.count == 0:
+            return default
+        key = key.ljust(self.key_width, b'\0')
+
+        keys = _RecordKeys(self)
+        position = bisect.bisect_left(keys, key)
+        if position == self.count or keys[position] != key:
+            return default
+
+        _, file_number, offset = self.record.unpack_from(self.buffer, self.start + position * self.record.size)
+        return (self.filenames[file_number], offset)
+
+    def __contains__(self, resource_id: str) -> bool:
+        return self.get(resource_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for position in range(self.count):
+            yield self._key_at(position).rstrip(b'\0').decode('utf-8')
+
+    def __len__(self) -> int:
+        return self.count
+
+class _RecordKeys:
+    """Sequence view of a table's keys, so bisect can search the mapped records"""
+
+    def __init__(self, table: SharedIdTable):
+        self.table = table
+
+    def __len__(self) -> int:
+        return self.table.count
+
+    def __getitem__(self, position: int) -> bytes:
+        return self.table._key_at(position)
+
+class SharedIndex:
+    """Memory-mapped index file holding id tables and line counts for every resource type"""
+
+    def __init__(self, path: str):
+        """
+        Map an existing index file
+
+        Args:
+            path: Location of the index file written by write_index_file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a shared index file: {path}")
+        (header_len,) = _HEADER_LEN.unpack_from(self.buffer, len(MAGIC))
+        header_start = len(MAGIC) + _HEADER_LEN.size
+        self.header = json.loads(self.buffer[header_start:header_start + header_len])
+        self.line_counts: Dict[str, int] = self.header['line_counts']
+
+        filenames = self.header['filenames']
+        self.tables: Dict[str, SharedIdTable] = {
+            resource_type: SharedIdTable(self.buffer, info['start'], info['count'], info['key_width'], filenames)
+            for resource_type, info in self.header['types'].items()
+        }
+
+    def close(self) -> None:
+        """Unmap the index file"""
+        self.buffer.close()
+
+def file_signature(filepath: str) -> Optional[List[int]]:
+    """Size and mtime of a data file, used to detect stale indexes"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def dataset_signatures(data_dir: str, file_mappings: Dict[str, List[str]]) -> Dict[str, Optional[List[int]]]:
+    """Signatures for every file in the FILE_MAPPINGS layout"""
+    return {
+        filename: file_signature(os.path.join(data_dir, filename))
+        for filenames in file_mappings.values()
+        for filename in filenames
+    }
+
+def dataset_fingerprint(data_dir: str, file_mappings: Dict[str, List[str]]) -> str:
+    """Checksum of every data file's signature, identifying one version of the dataset"""
+    signatures = json.dumps(dataset_signatures(data_dir, file_mappings), sort_keys=True)
+    return hashlib.sha256(signatures.encode('utf-8')).hexdigest()
+
+def is_current(path: str, data_dir: str, file_mappings: Dict[str, List[str]]) -> bool:
+    """Check whether an index file exists and matches the current data files"""
+    try:
+        index = SharedIndex(path)
+    except (FileNotFoundError, ValueError):
+        return False
+    try:
+        return index.header.get('files') == dataset_signatures(data_dir, file_mappings)
+    finally:
+        index.close()
+
+def write_index_file(
+    path: str,
+    id_indexes: Dict[str, Dict[str, tuple]],
+    line_counts: Dict[str, int],
+    signatures: Dict[str, Optional[List[int]]]
+) -> None:
+    """
+    Serialize per-type id indexes into a single sorted, fixed-width index file.
+    The file is written next to its destination and renamed into place so
+    workers never map a partially written index.
+    """
+    filenames = sorted({filename for index in id_indexes.values() for filename, _ in index.values()})
+    file_numbers = {filename: number for number, filename in enumerate(filenames)}
+
+    tables = []
+    types = {}
+    for resource_type, index in id_indexes.items():
+        keys = sorted((resource_id.encode('utf-8'), location) for resource_id, location in index.items())
+        key_width = max((len(key) for key, _ in keys), default=1)
+        record = struct.Struct(f'<{key_width}sHQ')
+        table = b''.join(
+            record.pack(key, file_numbers[filename], offset)
+            for key, (filename, offset) in keys
+        )
+        tables.append(table)
+        types[resource_type] = {'count': len(keys), 'key_width': key_width, 'size': len(table)}
+
+    # Header size depends on table offsets, so lay out tables after a fixed-point header
+    header = {'files': signatures, 'line_counts': line_counts, 'filenames': filenames, 'types': types}
+    while True:
+        header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        start = len(MAGIC) + _HEADER_LEN.size + len(header_bytes)
+        changed = False
+        for resource_type, table in zip(id_indexes, tables):
+            if types[resource_type].get('start') != start:
+                types[resource_type]['start'] = start
+                changed = True
+            start += len(table)
+        if not changed:
+            break
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for table in tables:
+            f.write(table)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def build_lock(path: str) -> Iterator[None]:
+    """Exclusive cross-process lock so only one process builds the index file"""
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+if __name__ == "__main__":
+    # Pre-build step for multi-worker deployments: run once before starting uvicorn
+    import main
+
+    index_path = os.getenv('FHIR_INDEX_FILE')
+    if not index_path:
+        raise SystemExit("FHIR_INDEX_FILE is not set")
+    main.load_shared_index(index_path)
+    print(f"Shared index ready: {index_path}")
@@ -0,0 +1,227 @@
+"""
+Embedded SQLite storage engine for the FHIR data files
+Each NDJSON file is loaded once into a local database that keeps the raw JSON
+next to columns SQLite extracts from it with its JSON1 functions (id, subject,
+encounter, code, category, effective time, lastUpdated). Those columns are
+indexed, so searches, counts and reads by id run as SQL instead of file scans.
+Run `python storage.py` once before starting several workers to build it up front.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from manifest import file_key
+from shared_index import build_lock
+
+SCHEMA_VERSION = 1
+
+# Columns computed by SQLite from the stored JSON whenever a row is written
+EXTRACTED_COLUMNS = {
+    'id': "json_extract(resource, '$.id')",
+    'subject': "json_extract(resource, '$.subject.reference')",
+    'encounter': "coalesce(json_extract(resource, '$.encounter.reference'), json_extract(resource, '$.context.reference'))",
+    'code': "json_extract(resource, '$.code.coding[0].code')",
+    'category': "json_extract(resource, '$.category[0].coding[0].code')",
+    'effective': (
+        "coalesce(json_extract(resource, '$.effectiveDateTime'), json_extract(resource, '$.effectivePeriod.start'), "
+        "json_extract(resource, '$.period.start'), json_extract(resource, '$.performedDateTime'), "
+        "json_extract(resource, '$.performedPeriod.start'), json_extract(resource, '$.authoredOn'), "
+        "json_extract(resource, '$.whenHandedOver'), json_extract(resource, '$.onsetDateTime'), "
+        "json_extract(resource, '$.recordedDate'), json_extract(resource, '$.collection.collectedDateTime'))"
+    ),
+    'last_updated': "json_extract(resource, '$.meta.lastUpdated')",
+}
+
+_INDEXES = {
+    'resources_by_id': "type, id",
+    'resources_by_subject': "type, subject",
+    'resources_by_subject_category': "type, subject, category",
+    'resources_by_category': "type, category",
+    'resources_by_encounter': "type, encounter",
+    'resources_by_code': "type, code",
+    'resources_by_effective': "type, effective",
+}
+
+# seq (the rowid) is file rank << 32 | line number, so rowid order is NDJSON order
+_FILE_SHIFT = 32
+
+class SQLiteStore:
+    """
+    FHIR resources from the NDJSON files, stored and indexed in SQLite.
+    Loading is done under a cross-process build lock, so with several workers
+    one process writes and the rest find the database up to date; request
+    threads each read through their own read-only connection and see the last
+    committed state of every file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize store (empty until sync() has loaded the data files; no I/O here)
+
+        Args:
+            path: Location of the SQLite database file
+        """
+        self.path = path
+        self.ready = False
+        self._local = threading.local()
+        self._stop = threading.Event()
+
+    def _create_schema(self, connection: sqlite3.Connection) -> None:
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        row = connection.execute("SELECT value FROM meta WHERE name = 'schema_version'").fetchone()
+        if row is not None and row[0] != str(SCHEMA_VERSION):
+            connection.execute("DROP TABLE IF EXISTS resources")
+            connection.execute("DROP TABLE IF EXISTS files")
+
+        columns = ", ".join(f"{name} TEXT GENERATED ALWAYS AS ({expression}) STORED" for name, expression in EXTRACTED_COLUMNS.items())
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS resources (seq INTEGER PRIMARY KEY, type TEXT NOT NULL, resource TEXT NOT NULL, {columns})"
+        )
+        for name, columns in _INDEXES.items():
+            unique = "UNIQUE " if name == 'resources_by_id' else ""
+            connection.execute(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON resources ({columns})")
+        connection.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, type TEXT, key TEXT, lines INTEGER)")
+        connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread read-only connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30.0, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def sync(self, data_dir: str, file_mappings: Dict[str, List[str]]) -> List[str]:
+        """
+        Load every data file that is new or changed since it was last loaded and
+        drop files that no longer exist. Returns the files this process (re)loaded:
+        a process that waited on the build lock while another one loaded them
+        finds nothing left to do. Blocking; run it off the event loop.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        changed = []
+        with build_lock(self.path):
+            # The only writer connection, open just while this process holds the lock
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+                self._create_schema(connection)
+                loaded_keys = dict(connection.execute("SELECT name, key FROM files").fetchall())
+                ranks = {}
+                for rank, (resource_type, filename) in enumerate(
+                    (resource_type, filename) for resource_type, names in file_mappings.items() for filename in names
+                ):
+                    ranks[filename] = rank
+                    key = file_key(os.path.join(data_dir, filename))
+                    stored = loaded_keys.get(filename)
+                    if key is None and stored is None:
+                        continue
+                    if key is None or stored != json.dumps(key):
+                        changed.append((resource_type, filename))
+                for resource_type, filename in changed:
+                    if self._stop.is_set():
+                        break
+                    self._load_file(connection, resource_type, filename, os.path.join(data_dir, filename), ranks[filename])
+            finally:
+                connection.close()
+        self.ready = not self._stop.is_set()
+        return [filename for _, filename in changed]
+
+    def _load_file(self, connection: sqlite3.Connection, resource_type: str, filename: str, filepath: str, rank: int) -> int:
+        """Replace the rows of one file with its current contents, in one transaction"""
+        key = file_key(filepath)
+        first = rank << _FILE_SHIFT
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM resources WHERE seq BETWEEN ? AND ?", (first, first + (1 << _FILE_SHIFT) - 1))
+            if key is None:
+                connection.execute("DELETE FROM files WHERE name = ?", (filename,))
+                connection.execute("COMMIT")
+                return 0
+            with open(filepath, 'r') as f:
+                rows = (
+                    (first + line_number, resource_type, line, line)
+                    for line_number, line in enumerate(f)
+                    if line.strip()
+                )
+                # Malformed lines are skipped, and ids repeated within a type keep
+                # their first occurrence, as with the NDJSON scans and id index
+                connection.executemany(
+                    "INSERT OR IGNORE INTO resources (seq, type, resource) SELECT ?, ?, ? WHERE json_valid(?)", rows
+                )
+            (lines,) = connection.execute(
+                "SELECT COUNT(*) FROM resources WHERE seq BETWEEN ? AND ?", (first, first + (1 << _FILE_SHIFT) - 1)
+            ).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (filename, resource_type, json.dumps(key), lines)
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return lines
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def count(self, resource_type: str, where: List[str], args: List) -> int:
+        """Number of resources of a type matching every clause"""
+        clauses = " AND ".join(["type = ?"] + where)
+        (total,) = self._connection().execute(
+            f"SELECT COUNT(*) FROM resources WHERE {clauses}", [resource_type, *args]
+        ).fetchone()
+        return total
+
+    def select(self, resource_type: str, where: List[str], args: List, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Stream matching resources in NDJSON order, parsed one row at a time"""
+        clauses = " AND ".join(["type = ?"] + where)
+        sql = f"SELECT resource FROM resources WHERE {clauses} ORDER BY seq"
+        params = [resource_type, *args]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for (resource,) in self._connection().execute(sql, params):
+            yield json.loads(resource)
+
+    def get_many(self, resource_type: str, resource_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Resolve resource ids of one type through the id index"""
+        resource_ids = list(resource_ids)
+        found = {}
+        connection = self._connection()
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(resource_ids), 500):
+            chunk = resource_ids[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            for resource_id, resource in connection.execute(
+                f"SELECT id, resource FROM resources WHERE type = ? AND id IN ({placeholders})", [resource_type, *chunk]
+            ):
+                found[resource_id] = json.loads(resource)
+        return found
+
+    def stop(self) -> None:
+        """Stop loading after the file in progress (for shutdown)"""
+        self._stop.set()
+
+    def close(self) -> None:
+        """Close the calling thread's read connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+if __name__ == "__main__":
+    # Pre-build step for multi-worker deployments: run once before starting uvicorn
+    import main
+
+    store = SQLiteStore(main.SQLITE_PATH or os.path.join(main._manifest_dir(), 'resources.db'))
+    loaded = store.sync(main.data_dir, main.FILE_MAPPINGS)
+    print(f"SQLite database ready: loaded {len(loaded)} files ({store.path})")
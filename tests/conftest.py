@@ -0,0 +1,114 @@
+"""
+Shared fixtures: a small MIMIC-layout data directory and an app client over it
+"""
+
+import json
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from cache import clear_all_caches
+
+def _patient(patient_id, family):
+    return {"resourceType": "Patient", "id": patient_id, "name": [{"family": family}], "gender": "female", "birthDate": "2100-01-01"}
+
+def _observation(observation_id, patient_id, *categories, value=1.0):
+    resource = {
+        "resourceType": "Observation",
+        "id": observation_id,
+        "meta": {"lastUpdated": "2022-06-01T00:00:00+00:00"},
+        "category": [{"coding": [{"code": category}]} for category in categories],
+        "code": {"coding": [{"code": "50912"}]},
+        "effectiveDateTime": "2150-01-01T10:00:00-05:00",
+        "valueQuantity": {"value": value, "unit": "mg/dL"},
+    }
+    if patient_id is not None:
+        resource["subject"] = {"reference": f"Patient/{patient_id}"}
+    return resource
+
+def _condition(condition_id, patient_id):
+    return {
+        "resourceType": "Condition",
+        "id": condition_id,
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "code": {"coding": [{"code": "I10", "display": "Hypertension"}]},
+    }
+
+# File name -> lines, in the MIMIC layout (json.dumps default separators); None is a malformed line
+DATA_FILES = {
+    'MimicPatient.ndjson': [_patient('p1', 'Ames'), _patient('p2', 'Baker'), _patient('p3', 'Smith')],
+    'MimicObservationLabevents.ndjson': [
+        _observation('o1', 'p1', 'laboratory'),
+        _observation('o2', 'p2', 'laboratory', value=2.5),
+        None,
+        _observation('o3', 'p1', 'vital-signs', 'laboratory'),
+        _observation('o4', None, 'laboratory'),
+    ],
+    'MimicObservationChartevents.ndjson': [
+        _observation('o5', 'p1', 'vital-signs', value=98.6),
+        _observation('o6', 'p3', 'vital-signs'),
+    ],
+    'MimicCondition.ndjson': [_condition('c1', 'p1'), _condition('c2', 'p2')],
+    'MimicEncounter.ndjson': [
+        {"resourceType": "Encounter", "id": "e1", "subject": {"reference": "Patient/p1"}, "period": {"start": "2150-01-01"}},
+    ],
+}
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / "fhir"
+    directory.mkdir()
+    for filename, lines in DATA_FILES.items():
+        with open(directory / filename, 'w') as f:
+            for line in lines:
+                f.write((json.dumps(line) if line is not None else '{"resourceType": "Observation", "id": ') + "\n")
+    return str(directory)
+
+@pytest.fixture
+def make_client(data_dir, tmp_path, monkeypatch):
+    """Start the app over the fixture data with the given storage engine"""
+    monkeypatch.setattr(main, "data_dir", data_dir)
+    monkeypatch.setattr(main, "MANIFEST_DIR", str(tmp_path / "manifest"))
+    monkeypatch.setattr(main, "SQLITE_PATH", str(tmp_path / "resources.db"))
+    monkeypatch.setattr(main, "ANALYTICS_ENABLED", False)
+    monkeypatch.setattr(main, "WATCH_INTERVAL", 0)
+    monkeypatch.setattr(main, "INDEX_FILE", None)
+    monkeypatch.setattr(main, "query_log", None)
+    main.resource_id_index.clear()
+    main.file_line_counts.clear()
+    clear_all_caches()
+    clients = []
+
+    def start(storage_engine: str = 'ndjson') -> TestClient:
+        # One app at a time: they share the module state
+        while clients:
+            clients.pop().__exit__(None, None, None)
+        monkeypatch.setattr(main, "STORAGE_ENGINE", storage_engine)
+        monkeypatch.setattr(main, "sqlite_store", None)
+        client = TestClient(main.app)
+        client.__enter__()
+        clients.append(client)
+
+        def loaded() -> bool:
+            # Line counts are rebuilt, and the SQLite engine loaded, in the background
+            if set(main.file_line_counts) != set(DATA_FILES):
+                return False
+            return storage_engine != 'sqlite' or (main.sqlite_store is not None and main.sqlite_store.ready)
+
+        deadline = time.monotonic() + 30
+        while not loaded():
+            assert time.monotonic() < deadline, "Startup did not finish loading the data files"
+            time.sleep(0.05)
+        clear_all_caches()
+        return client
+
+    yield start
+    for client in clients:
+        client.__exit__(None, None, None)
+    clear_all_caches()
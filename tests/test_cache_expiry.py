@@ -0,0 +1,157 @@
+"""
+Expired entries: background sweeps and stale-while-revalidate
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+
+import cache
+from cache import (
+    CacheBackend, ExpirySweeper, InMemoryCache, cache_async_result, cache_result, generate_cache_key
+)
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def _set_stale(results: InMemoryCache, func, value, *args) -> tuple:
+    """Store an already expired result of func(*args) that is still inside its stale window"""
+    key = (func.__name__, *generate_cache_key(*args))
+    results.set(key, value, ttl=-1, stale_ttl=60)
+    return key
+
+def test_stale_window():
+    results = InMemoryCache()
+    results.set("stale", 1, ttl=-1, stale_ttl=60)
+    results.set("gone", 2, ttl=-2, stale_ttl=1)
+    assert results.get("stale") is None
+    assert results.get_stale("stale") == (1, True)
+    assert results.get_stale("gone") == (None, False)
+    results.set("fresh", 3, ttl=60, stale_ttl=60)
+    assert results.get_stale("fresh") == (3, False)
+
+def test_stale_value_served_while_one_refresh_runs():
+    results = InMemoryCache()
+    release = threading.Event()
+    calls = []
+
+    @cache_result(results, stale_ttl=60)
+    def lookup(resource_id):
+        calls.append(resource_id)
+        release.wait(5)
+        return "fresh"
+
+    key = _set_stale(results, lookup, "stale", "p1")
+    assert [lookup("p1") for _ in range(5)] == ["stale"] * 5
+    _wait_for(lambda: calls == ["p1"])
+    release.set()
+    _wait_for(lambda: results.get(key) == "fresh")
+    assert lookup("p1") == "fresh"
+    assert calls == ["p1"]
+
+def test_failed_refresh_keeps_serving_stale():
+    results = InMemoryCache()
+    calls = []
+
+    @cache_result(results, stale_ttl=60)
+    def lookup(resource_id):
+        calls.append(resource_id)
+        if len(calls) == 1:
+            raise ValueError("scan failed")
+        return "fresh"
+
+    key = _set_stale(results, lookup, "stale", "p1")
+    assert lookup("p1") == "stale"
+    _wait_for(lambda: key not in cache._revalidating)
+    assert results.get_stale(key) == ("stale", True)
+
+    # The next stale read retries
+    assert lookup("p1") == "stale"
+    _wait_for(lambda: results.get(key) == "fresh")
+    assert len(calls) == 2
+
+def test_async_stale_value_served_while_one_refresh_runs():
+    results = InMemoryCache()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        @cache_async_result(results, stale_ttl=60)
+        async def lookup(resource_id):
+            calls.append(resource_id)
+            await release.wait()
+            return "fresh"
+
+        key = _set_stale(results, lookup, "stale", "p1")
+        assert await asyncio.gather(*(lookup("p1") for _ in range(5))) == ["stale"] * 5
+        while not calls:
+            await asyncio.sleep(0.001)
+        release.set()
+        while results.get(key) != "fresh":
+            await asyncio.sleep(0.001)
+        return await lookup("p1")
+
+    assert asyncio.run(scenario()) == "fresh"
+    assert calls == ["p1"]
+
+def test_sweep_reclaims_expired_entries_in_slices():
+    results = InMemoryCache(shards=1)
+    for number in range(5):
+        results.set(f"expired-{number}", number, ttl=-1, tags=("type:Observation",))
+    results.set("stale", "s", ttl=-1, stale_ttl=60)
+    results.set("live", "l", ttl=60)
+    results.set("forever", "f")
+
+    sweeper = ExpirySweeper([results], slice_size=2)
+    assert sweeper.sweep_once() == 5
+    assert sweeper.swept == 5
+    assert sorted(key for shard in results.shards for key in shard.entries) == ["forever", "live", "stale"]
+    assert results.shards[0].tag_index == {}
+    assert sweeper.sweep_once() == 0
+
+def test_sweep_skips_entries_replaced_since_they_were_scheduled():
+    results = InMemoryCache()
+    results.set("key", "old", ttl=-1)
+    results.set("key", "new", ttl=60)
+    assert ExpirySweeper([results]).sweep_once() == 0
+    assert results.get("key") == "new"
+
+class _FailingCache(CacheBackend):
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None, tags=(), stale_ttl=None):
+        pass
+
+    def clear(self, pattern=None):
+        return 0
+
+    def invalidate(self, *tags):
+        return 0
+
+    def sweep(self, limit=1000):
+        raise sqlite3.OperationalError("database is locked")
+
+    def get_stats(self):
+        return {}
+
+def test_sweep_failure_does_not_stop_other_caches():
+    results = InMemoryCache()
+    results.set("expired", 1, ttl=-1)
+    assert ExpirySweeper([_FailingCache(), results]).sweep_once() == 1
+
+def test_sweeper_thread():
+    results = InMemoryCache()
+    sweeper = ExpirySweeper([results], interval=0.01)
+    sweeper.start()
+    try:
+        results.set("expired", 1, ttl=-1)
+        _wait_for(lambda: sweeper.swept == 1)
+    finally:
+        sweeper.stop()
+    assert len(results) == 0
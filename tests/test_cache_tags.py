@@ -0,0 +1,113 @@
+"""
+Tag invalidation across the cache backends: in-memory, remote (against the local
+cache server) and tiered (in-memory front over the SQLite disk store)
+"""
+
+import time
+import uuid
+
+import pytest
+
+from cache import DiskStore, InMemoryCache, RemoteCache, TieredCache
+from cache_server import LocalCacheServer
+
+@pytest.fixture(scope="module")
+def cache_server():
+    server = LocalCacheServer(port=0)
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=["memory", "remote", "tiered"])
+def backend(request):
+    return request.param
+
+@pytest.fixture
+def make_cache(backend, request, tmp_path):
+    """Build a cache of the selected backend holding at most max_size entries in memory"""
+    def make(max_size: int = 100):
+        if backend == "memory":
+            return InMemoryCache(max_size=max_size)
+        namespace = f"test-{uuid.uuid4().hex}"
+        if backend == "remote":
+            server = request.getfixturevalue("cache_server")
+            return RemoteCache(server.url, namespace, near_cache_size=max_size)
+        disk = DiskStore(str(tmp_path / "cache.db"))
+        disk.open("fingerprint")
+        return TieredCache(InMemoryCache(max_size=max_size), disk, namespace)
+    return make
+
+def _memory_tier(cache) -> InMemoryCache:
+    """The in-process layer of a cache: itself, the remote near cache or the tiered front"""
+    if isinstance(cache, RemoteCache):
+        return cache.near_cache
+    if isinstance(cache, TieredCache):
+        return cache.front
+    return cache
+
+def _tag_index(cache) -> dict:
+    return {tag: keys for shard in _memory_tier(cache).shards for tag, keys in shard.tag_index.items()}
+
+def test_overwrite_is_invalidated_by_its_new_tags(make_cache):
+    cache = make_cache()
+    cache.set(("Patient", "p1"), "old", tags=("type:Patient", "patient:p1"))
+    cache.set(("Patient", "p1"), "new", tags=("type:Patient", "patient:p2"))
+    assert cache.get(("Patient", "p1")) == "new"
+    assert _tag_index(cache) == {"type:Patient": {("Patient", "p1")}, "patient:p2": {("Patient", "p1")}}
+
+    cache.invalidate("patient:p1")
+    # Remote tag sets may still list the key under its old tag, so the entry can go early, never stale
+    assert cache.get(("Patient", "p1")) in ("new", None)
+
+    cache.set(("Patient", "p1"), "new", tags=("type:Patient", "patient:p2"))
+    assert cache.invalidate("type:Patient", "patient:p2") == 1
+    assert cache.get(("Patient", "p1")) is None
+
+@pytest.mark.parametrize("backend", ["memory", "tiered"])
+def test_overwrite_drops_old_tags(make_cache):
+    cache = make_cache()
+    cache.set("key", "old", tags=("a",))
+    cache.set("key", "new", tags=("b",))
+    assert cache.invalidate("a") == 0
+    assert cache.get("key") == "new"
+
+def test_eviction_removes_tag_entries(backend, make_cache):
+    cache = make_cache(max_size=1)
+    cache.set("first", 1, tags=("a", "b"))
+    cache.set("second", 2, tags=("a",))
+    assert _tag_index(cache) == {"a": {"second"}}
+
+    if backend != "memory":
+        # Still on the server or disk, and read back into memory
+        assert cache.get("first") == 1
+    # Copies outside the process, and those read back from them, go too
+    cache.invalidate("a")
+    assert cache.get("first") is None
+    assert cache.get("second") is None
+
+def test_disk_sweep_removes_tag_rows(tmp_path):
+    disk = DiskStore(str(tmp_path / "cache.db"))
+    disk.open("fingerprint")
+    disk.set("ns", "expired", 1, time.time() - 1, ["a"])
+    disk.set("ns", "live", 2, None, ["a"])
+    assert disk.sweep("ns") == 1
+    assert disk.tags("ns", "expired") == []
+    assert disk.tags("ns", "live") == ["a"]
+    assert disk.invalidate("ns", ["a"]) == 1
+
+def test_invalidate_intersects_tags(make_cache):
+    cache = make_cache()
+    cache.set("both", 1, tags=("a", "b"))
+    cache.set("only-a", 2, tags=("a",))
+    cache.set("only-b", 3, tags=("b",))
+    cache.set("untagged", 4)
+
+    assert cache.invalidate("a", "missing") == 0
+    assert cache.invalidate("a", "b") == 1
+    assert cache.get("both") is None
+    assert [cache.get(key) for key in ("only-a", "only-b", "untagged")] == [2, 3, 4]
+
+    assert cache.invalidate("a") == 1
+    assert cache.get("only-a") is None
+    assert [cache.get(key) for key in ("only-b", "untagged")] == [3, 4]
@@ -0,0 +1,115 @@
+"""
+Conditional request helpers: If-None-Match parsing and matching, If-Modified-Since dates
+"""
+
+from email.utils import formatdate
+
+import pytest
+from starlette.requests import Request
+
+import main
+from main import entity_tags, etag_matches, is_not_modified, representation_etag, unmodified_since
+
+ETAG = "0123456789abcdef0123456789abcdef"
+
+def _request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/Patient",
+        "query_string": b"",
+        "headers": [(name.replace('_', '-').lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+def test_entity_tags_strip_quotes_and_weak_prefixes():
+    assert entity_tags('"a", W/"b",  "c-gzip" ,') == ["a", "b", "c-gzip"]
+    assert entity_tags("*") == ["*"]
+    assert entity_tags("") == []
+    # Unquoted tags are tolerated as sent
+    assert entity_tags("abc") == ["abc"]
+
+@pytest.mark.parametrize("header", [
+    f'"{ETAG}"',
+    f'W/"{ETAG}"',
+    f'"other", "{ETAG}"',
+    f'"{ETAG}-gzip"',
+    f'W/"{ETAG}-gzip"',
+    "*",
+    f'"x", *',
+])
+def test_etag_matches(header):
+    assert etag_matches(header, ETAG)
+
+@pytest.mark.parametrize("header", [
+    '"other"',
+    f'"{ETAG}-deflate"',
+    f'"{ETAG[:-1]}"',
+    f'"{ETAG}x"',
+    "",
+])
+def test_etag_does_not_match(header):
+    assert not etag_matches(header, ETAG)
+
+def test_representation_etag_suffixes_the_coding():
+    assert representation_etag(ETAG, None) == f'"{ETAG}"'
+    assert representation_etag(ETAG, "gzip") == f'"{ETAG}-gzip"'
+    assert etag_matches(representation_etag(ETAG, "gzip"), ETAG)
+
+LAST_MODIFIED = 1700000000.5
+
+@pytest.mark.parametrize("header, expected", [
+    (formatdate(LAST_MODIFIED, usegmt=True), True),
+    (formatdate(LAST_MODIFIED + 60, usegmt=True), True),
+    (formatdate(LAST_MODIFIED - 60, usegmt=True), False),
+    ("not a date", False),
+    ("", False),
+    # A date without a zone cannot be compared
+    ("Tue, 14 Nov 2023 22:13:20", False),
+])
+def test_unmodified_since(header, expected):
+    assert unmodified_since(header, LAST_MODIFIED) is expected
+
+def test_unmodified_since_without_last_modified():
+    assert not unmodified_since(formatdate(LAST_MODIFIED, usegmt=True), None)
+
+def test_if_none_match_takes_precedence():
+    since = formatdate(LAST_MODIFIED + 60, usegmt=True)
+    assert is_not_modified(_request(if_none_match=f'"{ETAG}"', if_modified_since=since), ETAG, LAST_MODIFIED)
+    # A failing If-None-Match is not rescued by a matching If-Modified-Since
+    assert not is_not_modified(_request(if_none_match='"other"', if_modified_since=since), ETAG, LAST_MODIFIED)
+    assert is_not_modified(_request(if_modified_since=since), ETAG, LAST_MODIFIED)
+    assert not is_not_modified(_request(), ETAG, LAST_MODIFIED)
+
+def test_revalidation_round_trip(make_client):
+    client = make_client()
+    response = client.get("/Patient?_count=2", headers={"Accept-Encoding": "gzip"})
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    revalidated = client.get("/Patient?_count=2", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    # The identity representation of the same body matches weakly too
+    assert client.get("/Patient?_count=2", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/Patient?_count=2", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get("/Patient?_count=2", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+def test_if_modified_since_without_validator(make_client):
+    client = make_client()
+    since = formatdate(main.dataset_last_modified, usegmt=True)
+    # Never requested before, so no validator is stored: answered from the data files' mtime
+    response = client.get("/Observation?patient=p1", headers={"If-Modified-Since": since})
+    assert response.status_code == 304
+    assert response.headers["last-modified"] == since
+    before = formatdate(main.dataset_last_modified - 3600, usegmt=True)
+    assert client.get("/Observation?patient=p2", headers={"If-Modified-Since": before}).status_code == 200
+    assert client.get("/Observation?patient=p3", headers={"If-Modified-Since": "garbage"}).status_code == 200
+
+def test_batch_entries_carry_the_read_etag(make_client):
+    client = make_client()
+    read = client.get("/Patient/p1")
+    batch = client.post("/", json={
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [{"request": {"method": "GET", "url": "Patient/p1"}}],
+    }).json()
+    assert batch["entry"][0]["response"]["etag"] == read.headers["etag"]
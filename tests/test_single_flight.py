@@ -0,0 +1,168 @@
+"""
+Single-flight deduplication of concurrent cache misses, in threads and on an event loop
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import AsyncSingleFlight, InMemoryCache, SingleFlight, cache_result, single_flight
+
+CALLERS = 8
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+async def _wait_for_async(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.001)
+
+def test_concurrent_misses_compute_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "key", compute, 21) for _ in range(CALLERS)]
+        _wait_for(lambda: flight.deduplicated == CALLERS - 1)
+        release.set()
+        assert [future.result() for future in futures] == [42] * CALLERS
+    assert calls == [21]
+
+    # Once the call finishes the key is free again
+    assert flight.do("key", compute, 1) == 2
+    assert calls == [21, 1]
+
+def test_leader_exception_reaches_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(None)
+        release.wait(5)
+        raise ValueError("scan failed")
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "key", compute) for _ in range(CALLERS)]
+        _wait_for(lambda: flight.deduplicated == CALLERS - 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="scan failed"):
+                future.result()
+    assert len(calls) == 1
+
+    # The failure is not cached
+    with pytest.raises(ValueError):
+        flight.do("key", compute)
+    assert len(calls) == 2
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    with ThreadPoolExecutor(2) as pool:
+        blocked = pool.submit(flight.do, "slow", lambda: release.wait(5))
+        assert flight.do("fast", lambda: "done") == "done"
+        release.set()
+        assert blocked.result() is True
+    assert flight.deduplicated == 0
+
+def test_cached_function_misses_compute_once():
+    cache = InMemoryCache()
+    release = threading.Event()
+    calls = []
+
+    @cache_result(cache)
+    def lookup(resource_id):
+        calls.append(resource_id)
+        release.wait(5)
+        return {"id": resource_id}
+
+    deduplicated = single_flight.deduplicated
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(lookup, "p1") for _ in range(CALLERS)]
+        _wait_for(lambda: single_flight.deduplicated - deduplicated == CALLERS - 1)
+        release.set()
+        assert [future.result() for future in futures] == [{"id": "p1"}] * CALLERS
+    assert calls == ["p1"]
+    assert lookup("p1") == {"id": "p1"}
+    assert calls == ["p1"]
+
+def test_async_concurrent_misses_compute_once():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def compute(value):
+            calls.append(value)
+            await release.wait()
+            return value * 2
+
+        tasks = [asyncio.create_task(flight.do("key", compute, 21)) for _ in range(CALLERS)]
+        await _wait_for_async(lambda: flight.deduplicated == CALLERS - 1)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(scenario()) == [42] * CALLERS
+    assert calls == [21]
+    assert not flight._calls
+
+def test_async_leader_exception_reaches_followers():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(None)
+            await release.wait()
+            raise ValueError("scan failed")
+
+        tasks = [asyncio.create_task(flight.do("key", compute)) for _ in range(CALLERS)]
+        await _wait_for_async(lambda: flight.deduplicated == CALLERS - 1)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert len(results) == CALLERS
+    assert all(isinstance(result, ValueError) and str(result) == "scan failed" for result in results)
+    assert len(calls) == 1
+    assert not flight._calls
+
+def test_async_cancelled_follower_does_not_cancel_the_call():
+    flight = AsyncSingleFlight()
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.create_task(flight.do("key", compute))
+        follower = asyncio.create_task(flight.do("key", compute))
+        await _wait_for_async(lambda: flight.deduplicated == 1)
+        follower.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(scenario()) == "done"
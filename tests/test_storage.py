@@ -0,0 +1,78 @@
+"""
+The SQLite storage engine must answer searches, counts and reads exactly as the NDJSON scans do
+"""
+
+import main
+from cache import clear_all_caches
+from storage import SQLiteStore
+
+SEARCHES = [
+    "/Patient",
+    "/Patient?_count=2",
+    "/Patient?_id=p2",
+    "/Patient?name=Smith",
+    "/Observation",
+    "/Observation?patient=p1",
+    "/Observation?subject=Patient/p1",
+    "/Observation?category=laboratory",
+    "/Observation?category=vital-signs",
+    "/Observation?patient=p1&category=laboratory",
+    "/Observation?_count=1",
+    "/Observation?_summary=count",
+    "/Observation?patient=p1&_summary=count",
+    "/Condition?subject=p2",
+    "/Encounter?patient=p1",
+    "/Encounter?patient=nobody",
+]
+
+def _result(response):
+    assert response.status_code == 200, response.text
+    bundle = response.json()
+    return bundle.get('total'), [entry['resource'] for entry in bundle.get('entry', [])]
+
+def _answers(client):
+    answers = {}
+    for url in SEARCHES:
+        clear_all_caches()
+        answers[url] = _result(client.get(url))
+    for resource_type, resource_id in [("Patient", "p3"), ("Observation", "o3"), ("Observation", "o5")]:
+        clear_all_caches()
+        answers[resource_id] = client.get(f"/{resource_type}/{resource_id}").json()
+    return answers
+
+def test_sqlite_matches_ndjson(make_client):
+    expected = _answers(make_client('ndjson'))
+    client = make_client('sqlite')
+    assert main.sqlite_store.ready
+    assert _answers(client) == expected
+
+def test_sqlite_counts_and_pages(make_client):
+    client = make_client('sqlite')
+    total, resources = _result(client.get("/Observation?patient=p1"))
+    assert total == 3
+    assert [resource['id'] for resource in resources] == ['o1', 'o3', 'o5']
+    # The malformed line is skipped; the Observation without a subject still matches its category
+    total, resources = _result(client.get("/Observation?category=laboratory"))
+    assert [resource['id'] for resource in resources] == ['o1', 'o2', 'o3', 'o4']
+
+def test_sync_loads_only_changed_files(data_dir, tmp_path):
+    store = SQLiteStore(str(tmp_path / "resources.db"))
+    loaded = store.sync(data_dir, main.FILE_MAPPINGS)
+    assert sorted(loaded) == [
+        'MimicCondition.ndjson', 'MimicEncounter.ndjson', 'MimicObservationChartevents.ndjson',
+        'MimicObservationLabevents.ndjson', 'MimicPatient.ndjson',
+    ]
+    # A second store (another worker) finds the database up to date
+    assert SQLiteStore(store.path).sync(data_dir, main.FILE_MAPPINGS) == []
+    assert store.count('Observation', [], []) == 6
+
+    with open(f"{data_dir}/MimicCondition.ndjson", 'a') as f:
+        f.write('{"resourceType": "Condition", "id": "c3", "subject": {"reference": "Patient/p3"}}\n')
+    assert store.sync(data_dir, main.FILE_MAPPINGS) == ['MimicCondition.ndjson']
+    assert set(store.get_many('Condition', ['c1', 'c3', 'missing'])) == {'c1', 'c3'}
+
+def test_store_constructor_does_no_io(tmp_path):
+    path = tmp_path / "nested" / "resources.db"
+    store = SQLiteStore(str(path))
+    assert not store.ready
+    assert not path.exists()